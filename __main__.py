@@ -1,5 +1,45 @@
-import src.parsex as parsex
-import src.tools as tools
+import argparse
+import sys
+
+import evaluate
+
+def arguments(argv=None):
+    parser = argparse.ArgumentParser(prog="sheep", description="normalize λ-terms, one per line, into lines of JSON.")
+    parser.add_argument("files", nargs="*", help="files to read terms from, stdin when none or -")
+    parser.add_argument("--jsonl", action="store_true", help="input lines are JSON strings or objects with a \"term\"")
+    parser.add_argument("-o", "--output", help="file to write the results to instead of stdout")
+    parser.add_argument("-b", "--backend", choices=evaluate.BACKENDS, default="lazy")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes, 0 evaluates in this process (default: one per core)")
+    parser.add_argument("--max-steps", type=int, default=100000, help="step budget per term")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds per term")
+    parser.add_argument("--numerals", action="store_true", help="read numbers as Church numerals")
+    parser.add_argument("--unordered", action="store_true", help="write results as they complete instead of in input order")
+    parser.add_argument("--chunksize", type=int, default=64, help="terms sent to a worker at once")
+
+    return parser.parse_args(argv)
+
+def lines(files):
+    for name in files or ["-"]:
+        if name == "-":
+            yield from sys.stdin
+        else:
+            with open(name, encoding="utf-8") as f:
+                yield from f
+
+def main(argv=None):
+    args = arguments(argv)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    try:
+        programs = evaluate.read_terms(lines(args.files), args.jsonl)
+        records = evaluate.evaluate_batch(programs, args.workers, args.backend, args.max_steps, args.timeout, args.numerals, not args.unordered, args.chunksize)
+
+        for record in records:
+            out.write(record + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
 if __name__ == "__main__":
-    print(tools.beta_reduction(parsex.LamPar("(λx.x) y").parse()))
\ No newline at end of file
+    main()
\ No newline at end of file
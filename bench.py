@@ -0,0 +1,230 @@
+'''
+benchmarks of lexing, parsing, printing and every reduction backend over fixed
+workloads.
+
+workloads are generated from fixed seeds, so every run measures the same terms.
+every benchmark runs --repeat times after a warm-up run, the median and the minimum
+are kept. results can be saved as a JSON baseline and later runs compared with it,
+a benchmark whose median got slower than the baseline's by more than --threshold
+is a regression and makes the exit status 1.
+
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json --threshold 0.2
+'''
+
+import argparse
+import gc
+import json
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+
+import evaluate
+import src.lambex as lambex
+import src.parsex as parsex
+import src.tools as tools
+import src.printer as printer
+import src.cache as cache
+from src.debruijn import Index, Abs, Apply, to_debruijn
+
+VERSION = 1
+
+def church_arithmetic(scale):
+    plus = "(λm.λn.λf.λx.m f (n f x))"
+    mult = "(λm.λn.λf.m (n f))"
+    return ["%s (%s) (%s)" % (mult if i % 2 else plus, tools.encode_church(scale // 4 + i), tools.encode_church(scale // 8 + i)) for i in range(4)]
+
+def nested_abstractions(scale):
+    return ["λx." * scale + "x", "λ" * scale + " 1", "(" * scale + "x" + ")" * scale]
+
+def application_chain(scale):
+    return ["f " + " ".join("x%d" % (i % 97) for i in range(scale)), "(λx.x) " * scale + "y"]
+
+def divergent(scale):
+    return [
+        "(λx.x x) (λx.x x)",
+        "(λf.(λx.f (x x)) (λx.f (x x))) g",
+        "(λx.x x x) (λx.x x x)",
+    ]
+
+def random_closed(scale, seed=18):
+    '''
+    closed terms of about scale // 4 nodes, from a fixed seed.
+    '''
+    rng = random.Random(seed)
+    programs = []
+
+    for _ in range(8):
+        results = []
+        stack = [(max(2, scale // 4), 0)]
+
+        while stack:
+            n, depth = stack.pop()
+
+            if n is None:
+                arg = results.pop()
+                results.append(Apply(results.pop(), arg))
+            elif n == "λ":
+                results.append(Abs(results.pop()))
+            elif n <= 1 and depth:
+                results.append(Index(rng.randrange(depth)))
+            elif depth == 0 or rng.random() < 0.3:
+                stack.append(("λ", depth))
+                stack.append((n - 1 if n > 1 else 1, depth + 1))
+            else:
+                k = rng.randint(1, n - 1)
+                stack.append((None, depth))
+                stack.append((n - k, depth))
+                stack.append((k, depth))
+
+        programs.append(printer.pretty(results[0]))
+
+    return programs
+
+WORKLOADS = {
+    "church":    church_arithmetic,
+    "nested":    nested_abstractions,
+    "chain":     application_chain,
+    "divergent": divergent,
+    "random":    random_closed,
+}
+
+# workloads the reduction backends are run on, the others are too big to normalize
+REDUCIBLE = ("church", "divergent", "random")
+
+def parse(program):
+    return parsex.LamPar(program).parse_expression()
+
+def benchmarks(scale, max_steps, timeout):
+    '''
+    name -> function doing one run, the workloads are built and parsed up front.
+    '''
+    suite = {}
+
+    for workload, generate in WORKLOADS.items():
+        programs = generate(scale)
+        trees = [parse(program) for program in programs]
+
+        suite["lex/%s" % workload] = lambda programs=programs: [lambex.LambEx(program).tokenize() for program in programs]
+        suite["parse/%s" % workload] = lambda programs=programs: [parsex.LamPar(program).parse() for program in programs]
+        suite["reconstruct/%s" % workload] = lambda trees=trees: [tree.reconstruct() for tree in trees]
+        suite["objify/%s" % workload] = lambda trees=trees: [parsex.objify_node(tree) for tree in trees]
+        suite["pretty/%s" % workload] = lambda trees=trees: [printer.pretty(tree) for tree in trees]
+
+        if workload not in REDUCIBLE:
+            continue
+
+        for backend in evaluate.BACKENDS:
+            suite["%s/%s" % (backend, workload)] = lambda trees=trees, backend=backend: [evaluate.simplify(tree, backend, max_steps, timeout) for tree in trees]
+
+        terms = [to_debruijn(tree) for tree in trees]
+        suite["cache/%s" % workload] = lambda terms=terms: [cache.Cache().normalize(term, max_steps, timeout) for term in terms]
+
+    return suite
+
+def measure(run, repeat):
+    '''
+    time repeat runs of run. reductions that ran out of time instead of steps are
+    counted, their times depend on the timeout rather than on the code.
+    '''
+    run()
+    times = []
+
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        outputs = run()
+        times.append(time.perf_counter() - start)
+
+    timeouts = sum(getattr(output, "reason", None) == "timeout" for output in outputs)
+    return {"median": statistics.median(times), "min": min(times), "runs": repeat, "timeouts": timeouts}
+
+def compare(results, baseline, threshold):
+    '''
+    print every benchmark against baseline, returns the names of the regressions.
+    '''
+    regressions = []
+    print("%-24s %12s %12s %8s" % ("benchmark", "baseline ms", "current ms", "ratio"))
+
+    for name, result in results.items():
+        if (base := baseline.get(name)) is None:
+            print("%-24s %12s %12.3f %8s" % (name, "-", result["median"] * 1000, "new"))
+            continue
+
+        ratio = result["median"] / base["median"] if base["median"] else float("inf")
+        flag = ""
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  slower"
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+
+        print("%-24s %12.3f %12.3f %8.2f%s" % (name, base["median"] * 1000, result["median"] * 1000, ratio, flag))
+
+    return regressions
+
+def arguments(argv=None):
+    parser = argparse.ArgumentParser(prog="sheep-bench", description="benchmark lexing, parsing, printing and reduction.")
+    parser.add_argument("-k", "--filter", default="", help="only benchmarks whose name matches this regular expression")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--scale", type=int, default=2000, help="size of the generated workloads")
+    parser.add_argument("--quick", action="store_true", help="small workloads and 3 runs, to check the suite")
+    parser.add_argument("--max-steps", type=int, default=5000, help="step budget per term")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds per term")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of a baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown of the median that counts as a regression")
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = arguments(argv)
+
+    if args.quick:
+        args.scale, args.repeat = min(args.scale, 200), min(args.repeat, 3)
+
+    pattern = re.compile(args.filter)
+    suite = benchmarks(args.scale, args.max_steps, args.timeout)
+    results = {}
+
+    for name, run in suite.items():
+        if not pattern.search(name):
+            continue
+
+        results[name] = measure(run, args.repeat)
+
+        if not args.compare:
+            result = results[name]
+            note = "  %d timeouts" % result["timeouts"] if result["timeouts"] else ""
+            print("%-24s %10.3f ms  (min %.3f)%s" % (name, result["median"] * 1000, result["min"] * 1000, note), flush=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": VERSION,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "scale": args.scale,
+                "max_steps": args.max_steps,
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        if baseline.get("scale") != args.scale or baseline.get("max_steps") != args.max_steps:
+            print("warning: the baseline was made with scale %s and max steps %s" % (baseline.get("scale"), baseline.get("max_steps")))
+
+        if (regressions := compare(results, baseline["results"], args.threshold)):
+            print("%d regressions: %s" % (len(regressions), ", ".join(regressions)))
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -1,5 +1,280 @@
-import lambex
+'''
+evaluation of single terms and of batches.
 
-def simplify(tree):
+every term gets a step budget and a timeout, which the backends check while they
+run, so a diverging term ends as a record with "normal": false instead of holding
+up the batch. batches are spread over a process pool in chunks, with a bounded
+number of chunks in flight, and come back as records in input order or as they
+complete.
+'''
+
+import collections
+import concurrent.futures
+import json
+import os
+import time
+
+import src.trace as trace
+import src.lambex as lambex
+import src.parsex as parsex
+import src.printer as printer
+import src.debruijn as debruijn
+import src.tools as tools
+import src.reduction as reduction
+import src.machine as machine
+import src.nbe as nbe
+import src.church as church
+import src.combinators as combinators
+
+BACKENDS = {
+    "normal":  lambda tree, max_steps, timeout: reduction.normalize(tree, max_steps=max_steps, timeout=timeout),
+    "krivine": lambda tree, max_steps, timeout: machine.evaluate(tree, max_steps, timeout),
+    "lazy":    lambda tree, max_steps, timeout: machine.evaluate(tree, max_steps, timeout, lazy=True),
+    "nbe":     lambda tree, max_steps, timeout: nbe.normalize(tree, max_steps, timeout),
+    "church":  lambda tree, max_steps, timeout: church.normalize(tree, accelerate=True, literals=True, max_steps=max_steps, timeout=timeout),
+    "combinators": lambda tree, max_steps, timeout: combinators.normalize(tree, max_steps, timeout),
+}
+
+class InputException(Exception):
+    ...
+
+def simplify(tree, backend="lazy", max_steps=None, timeout=None):
+    '''
+    normalize tree with one of BACKENDS, the result is a reduction.Reduction.
+    '''
+    return BACKENDS[backend](tree, max_steps, timeout)
+
+@trace.traced("evaluate")
+def evaluate(index, program, backend="lazy", max_steps=None, timeout=None, numerals=False, encode=False, max_depth=None):
+    '''
+    parse and normalize one program into a record, errors become records too. the
+    normal form is in "output" as text that parses back to it and in "result" as
+    objify_node gives it. with encode the record comes back as a line of JSON, which
+    also works for results nested deeper than the recursion limit. with max_depth a
+    result nested deeper than that is only in "output", so the record reads back
+    with the json module. program can also be an InputException from read_terms, or
+    anything that is not a string, which are error records.
+    '''
+    if not isinstance(program, str):
+        if not isinstance(program, InputException):
+            program = InputException("the term is %s, not a string" % type(program).__name__)
+
+        record = {"index": index, "error": "%s: %s" % (program.__class__.__name__, program)}
+        return json.dumps(record) if encode else record
+
+    record = {"index": index, "input": program}
+    result = None
+    start = time.perf_counter()
+
+    try:
+        tree = parsex.LamPar(program).parse_expression()
+
+        if numerals:
+            tree = tools.convert_church(tree)
+
+        result = simplify(tree, backend, max_steps, timeout)
+    except (parsex.ParseException, lambex.LexException, EOFError) as e:
+        record["error"] = "%s: %s" % (e.__class__.__name__, e)
+        return json.dumps(record) if encode else record
+
+    record["normal"] = result.normal
+    record["steps"] = result.steps
+
+    if result.reason:
+        record["reason"] = result.reason
+
+    tree = None
+
+    if result.term is not None:
+        record["output"] = printer.pretty(result.term)
+
+        if max_depth is None or debruijn.shape(result.term)[1] <= max_depth:
+            tree = result.tree
+
+    record["elapsed"] = time.perf_counter() - start
+
+    if not encode:
+        if tree is not None:
+            record["result"] = parsex.objify_node(tree)
+        return record
+
+    line = json.dumps(record)
+    return line if tree is None else '%s, "result": %s}' % (line[:-1], parsex.objify_json(tree))
+
+def evaluate_chunk(chunk, *options):
+    return [evaluate(index, program, *options, encode=True) for index, program in chunk]
+
+def read_terms(lines, jsonl=False):
+    '''
+    programs from lines, one per line. with jsonl every line is a JSON string or an
+    object with a "term", a line that is neither is an InputException in its place,
+    which evaluate makes an error record. blank lines are skipped.
+    '''
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+
+        if not line:
+            continue
+
+        if jsonl:
+            try:
+                line = json.loads(line)
+            except ValueError as e:
+                yield InputException("line %d is not JSON: %s" % (number, e))
+                continue
+
+            if isinstance(line, dict):
+                if "term" not in line:
+                    yield InputException('line %d has no "term"' % number)
+                    continue
+
+                line = line["term"]
+
+            if not isinstance(line, str):
+                yield InputException("the term on line %d is %s, not a string" % (number, type(line).__name__))
+                continue
+
+        yield line
+
+def chunked(programs, size):
+    chunk = []
+
+    for index, program in enumerate(programs):
+        chunk.append((index, program))
+
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def evaluate_batch(programs, workers=None, backend="lazy", max_steps=None, timeout=None, numerals=False, ordered=True, chunksize=64, window=None):
+    '''
+    yield a record for every program, as a line of JSON. workers == 0 evaluates in this
+    process, otherwise a pool of workers processes (one per core by default) evaluates
+    chunks of chunksize programs, at most window chunks (twice the workers by default)
+    are in flight, so programs are read lazily. ordered records come in input order,
+    else as they complete.
     '''
-    '''
\ No newline at end of file
+    options = (backend, max_steps, timeout, numerals)
+    chunks = chunked(programs, chunksize)
+
+    if workers == 0:
+        for chunk in chunks:
+            yield from evaluate_chunk(chunk, *options)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    window = window or 2 * workers
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque()
+
+        for chunk in chunks:
+            pending.append(pool.submit(evaluate_chunk, chunk, *options))
+
+            if len(pending) < window:
+                continue
+
+            if ordered:
+                yield from pending.popleft().result()
+            else:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+
+        if ordered:
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            for future in concurrent.futures.as_completed(pending):
+                yield from future.result()
+
+if __name__ == "__main__":
+    from src.debruijn import to_debruijn
+
+    def test_evaluate():
+        record = evaluate(0, "(λx.x) y")
+        assert record["normal"] and record["output"] == "y" and record["result"] == {"type": "L_VARIABLE", "name": "y"}
+
+        record = evaluate(1, "(λm.λn.λf.m (n f)) 2 3", backend="church", numerals=False)
+        assert record["output"] == "6"
+
+        record = evaluate(2, "(λm.λn.λf.m (n f)) 2 3", backend="normal", numerals=True)
+        assert record["steps"] > 0 and record["output"] == "λf.λx1.f (f (f (f (f (f x1)))))"
+
+        # the output parses back to the normal form, whatever the backend
+        for backend in BACKENDS:
+            record = evaluate(0, "(λa.λb.a (y b)) x", backend=backend)
+            assert to_debruijn(parsex.LamPar(record["output"]).parse_expression()) == to_debruijn(parsex.LamPar("λb.x (y b)").parse_expression()), backend
+
+        record = evaluate(3, "(λx.x x) (λx.x x)", max_steps=1000)
+        assert not record["normal"] and record["reason"] == "steps" and "result" not in record
+
+        record = evaluate(4, "(λx.x x) (λx.x x)", backend="krivine", timeout=0.05)
+        assert record["reason"] == "timeout"
+
+        line = evaluate(0, "(λx.x) y", encode=True)
+        assert json.loads(line) == dict(evaluate(0, "(λx.x) y"), elapsed=json.loads(line)["elapsed"])
+        assert evaluate(0, "(λx.x) 5000", numerals=True, encode=True).count("L_APPLICATION") == 5000
+
+        record = json.loads(evaluate(0, "(λx.x) 5000", numerals=True, encode=True, max_depth=500))
+        assert "result" not in record and record["output"].count("(") == 4999
+        assert "result" in evaluate(0, "(λx.x) 200", numerals=True, max_depth=500)
+
+        assert "error" in evaluate(5, "(λx.x")
+        assert "error" in evaluate(6, "λx.$")
+
+        for backend in BACKENDS:
+            assert simplify(parsex.LamPar("(λx.λy.x y) y").parse(), backend).tree.reconstruct() == "λx0.(y) x0", backend
+
+        return True
+
+    def test_evaluate_batch():
+        programs = ["(λx.x) v%d" % i for i in range(200)] + ["(λx.x x) (λx.x x)"]
+        expected = ["v%d" % i for i in range(200)]
+
+        records = [json.loads(line) for line in evaluate_batch(programs, workers=0, max_steps=100)]
+        assert [r["output"] for r in records[:200]] == expected and records[-1]["reason"] == "steps"
+
+        records = [json.loads(line) for line in evaluate_batch(iter(programs), workers=2, max_steps=100, chunksize=7, window=2)]
+        assert [r.get("output") for r in records[:200]] == expected
+        assert [r["index"] for r in records] == list(range(201))
+
+        records = [json.loads(line) for line in evaluate_batch(programs, workers=2, max_steps=100, ordered=False, chunksize=7)]
+        assert sorted(r["index"] for r in records) == list(range(201))
+
+        assert list(read_terms(['"λx.x"', '', '{"term": "y"}'], jsonl=True)) == ["λx.x", "y"]
+        assert list(read_terms(["λx.x\n", "  \n", "y\n"])) == ["λx.x", "y"]
+
+        # bad lines are error records in their place, the batch goes on
+        lines = ['"(λx.x) a"', '{"term": "b"', '{"input": "c"}', '{"term": 4}', '[]', '"(λx.x) d"']
+
+        for workers in (0, 2):
+            records = [json.loads(line) for line in evaluate_batch(read_terms(lines, jsonl=True), workers=workers, chunksize=2)]
+            assert [r["index"] for r in records] == list(range(6))
+            assert records[0]["output"] == "a" and records[5]["output"] == "d"
+            assert all(r["error"].startswith("InputException") for r in records[1:5])
+
+        assert "error" in evaluate(0, None) and "error" in json.loads(evaluate(0, 4, encode=True))
+
+        return True
+
+    def bench_evaluate_batch():
+        programs = ["(λm.λn.λf.m (n f)) %d %d" % (n % 40, n % 30) for n in range(4000)]
+
+        for workers in sorted({0, 1, 2, os.cpu_count() or 1}):
+            start = time.perf_counter()
+
+            for _ in evaluate_batch(programs, workers=workers, numerals=True):
+                pass
+
+            print("%2d workers: %8.0f terms/s" % (workers, len(programs) / (time.perf_counter() - start)))
+
+        return True
+
+    print(test_evaluate() and test_evaluate_batch())
+    print(bench_evaluate_batch())
\ No newline at end of file
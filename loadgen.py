@@ -0,0 +1,144 @@
+'''
+load generator for server.py: a number of connections, each with a number of
+concurrent requesters, send terms until the requests are used up, then latency
+percentiles and throughput are printed. without --port or --unix a server is
+started in this process on a temporary Unix socket and checked first.
+'''
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from server import Server, Client
+
+TERMS = [
+    "(λm.λn.λf.m (n f)) %d %d" % (m, n) for m in range(2, 12) for n in range(2, 12)
+] + [
+    "(λx.x x x) ((λm.λn.λf.m (n f)) 20 20 (λb.b) (λz.z))",
+    "(λm.λn.n m) 2 4",
+    "(λx.x x) (λx.x x)",
+]
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def requester(client, terms, remaining, latencies, errors, options):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        start = time.perf_counter()
+        response = await client.evaluate(random.choice(terms), **options)
+        latencies.append(time.perf_counter() - start)
+
+        if "error" in response:
+            errors[0] += 1
+
+async def check(connect):
+    client = await connect()
+
+    response = await client.evaluate("(λx.x) y")
+    assert response["normal"] and response["output"] == "y" and response["result"] == {"type": "L_VARIABLE", "name": "y"}
+
+    response = await client.evaluate("(λx.x x) (λx.x x)", max_steps=100)
+    assert not response["normal"] and response["reason"] == "steps"
+
+    # a budget of 0 is a budget, not the server's default
+    response = await client.evaluate("(λx.x) y", max_steps=0)
+    assert not response["normal"] and response["reason"] == "steps" and response["steps"] == 0
+    assert (await client.evaluate("(λx.x x) (λx.x x)", timeout=0))["reason"] == "timeout"
+    assert (await client.evaluate("y", max_steps=0))["normal"]
+
+    for budget in [{"max_steps": -1}, {"timeout": -0.5}, {"max_steps": "many"}]:
+        assert (await client.evaluate("(λx.x) y", **budget))["error"].startswith("bad request"), budget
+
+    response = await client.evaluate("(λx.", max_steps=100)
+    assert response["error"].startswith("EOFError")
+
+    response = await client.evaluate("(λx.x) y", backend="none")
+    assert response["error"].startswith("bad request")
+
+    before = await client.stats()
+    slow = "(λm.λn.λf.m (n f)) 150 150 (λb.b) y"
+    responses = await asyncio.gather(*[client.evaluate(slow, numerals=True) for _ in range(20)])
+    after = await client.stats()
+
+    assert all(r["output"] == "y" for r in responses) and after["coalesced"] - before["coalesced"] >= 10
+
+    # requests sent before the client shuts down its side are still answered
+    other = await connect()
+    futures = [asyncio.ensure_future(other.evaluate("(λm.λn.λf.m (n f)) 40 %d (λb.b) v" % n, numerals=True)) for n in range(10)]
+    await asyncio.sleep(0) # every request is written
+    other.writer.write_eof()
+    responses = await asyncio.wait_for(asyncio.gather(*futures), 30)
+    assert [r["output"] for r in responses] == ["v"] * 10
+    await other.close()
+    # too deep for json as a result, the text still has it
+    response = await client.evaluate("λx.x 3000", numerals=True)
+    assert "result" not in response and response["output"].count("(") == 2999
+
+    await client.close()
+    return True
+
+async def run(args):
+    server = None
+
+    if args.port is None and args.unix is None:
+        args.unix = os.path.join(tempfile.mkdtemp(), "sheep.sock")
+        server = Server(args.workers, args.max_steps, args.timeout)
+        await server.start(path=args.unix)
+
+    async def connect():
+        return await Client.connect(args.host, args.port, args.unix)
+
+    if server is not None:
+        print(await check(connect))
+
+    terms = TERMS
+
+    if args.terms:
+        with open(args.terms, encoding="utf-8") as f:
+            terms = [line.strip() for line in f if line.strip()]
+
+    options = {"numerals": True, "max_steps": args.max_steps, "timeout": args.timeout}
+    clients = [await connect() for _ in range(args.connections)]
+    remaining = [args.requests]
+    latencies = []
+    errors = [0]
+
+    start = time.perf_counter()
+    await asyncio.gather(*[requester(client, terms, remaining, latencies, errors, options) for client in clients for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    stats = await clients[0].stats()
+
+    print("%d requests, %d errors, %.0f requests/s" % (len(latencies), errors[0], len(latencies) / elapsed))
+    print("p50 %.2f ms, p99 %.2f ms, max %.2f ms" % (percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, latencies[-1] * 1000))
+    print("server: %s" % stats)
+
+    for client in clients:
+        await client.close()
+
+    if server is not None:
+        await server.close()
+        os.remove(args.unix)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sheep-loadgen", description="measure latency and throughput of a sheep server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--unix", help="Unix socket of the server")
+    parser.add_argument("--terms", help="file with one term per line, picked at random")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--connections", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight per connection")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes of a server started here")
+    parser.add_argument("--max-steps", type=int, default=100000)
+    parser.add_argument("--timeout", type=float, default=5.0)
+
+    asyncio.run(run(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
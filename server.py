@@ -0,0 +1,279 @@
+'''
+evaluation server: line-delimited JSON over a local TCP or Unix socket.
+
+    request   {"id": 1, "term": "(λx.x) y", "backend": "lazy", "max_steps": 1000, "timeout": 1.0, "numerals": false}
+    response  {"id": 1, "index": 0, "input": "(λx.x) y", "normal": true, ...}   a record as evaluate.evaluate makes it
+              {"id": 1, "error": "..."}
+    request   {"id": 2, "op": "stats"}
+
+a result nested deeper than MAX_DEPTH is only sent as text, in "output", so every
+response line reads back with the json module. only "term" is required, budgets are capped by the server's, a missing or null
+budget is the server's and a negative one a bad request. parsing and reduction
+run in a process pool, never on the event loop. identical requests that arrive
+while one is being computed share its result. a connection is not read further
+while it has max_pending requests outstanding, so a fast client is slowed down by
+TCP instead of queueing unboundedly. a request whose budget runs out gets an error
+response, its computation is dropped if it has not started and nobody else waits.
+a client that shuts down its side of the connection still gets every response to
+what it sent before.
+'''
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import json
+import os
+
+import evaluate
+
+MAX_DEPTH = 500 # deepest result sent as JSON, well within json's recursion
+
+class Server:
+    def __init__(self, workers=None, max_steps=100000, timeout=10.0, max_pending=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_pending = max_pending
+
+        self.pool = None
+        self.server = None
+        self.inflight = {} # key -> [future, number of waiters]
+        self.connections = {} # handler task -> (writer, its respond tasks)
+
+        self.requests = 0
+        self.computed = 0
+        self.coalesced = 0
+        self.expired = 0
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.connection, path)
+        else:
+            self.server = await asyncio.start_server(self.connection, host, port)
+
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        self.server.close()
+
+        # outstanding requests are dropped, a closed transport ends the reads of its handler
+        for writer, tasks in self.connections.values():
+            for task in tasks:
+                task.cancel()
+
+            writer.close()
+
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    def stats(self):
+        return {"requests": self.requests, "computed": self.computed, "coalesced": self.coalesced, "expired": self.expired, "inflight": len(self.inflight)}
+
+    async def connection(self, reader, writer):
+        pending = asyncio.Semaphore(self.max_pending)
+        lock = asyncio.Lock()
+        tasks = set()
+
+        handler = asyncio.current_task()
+        self.connections[handler] = (writer, tasks)
+
+        try:
+            while True:
+                await pending.acquire()
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                task = asyncio.create_task(self.respond(line, writer, lock, pending))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            # the client is done sending, not necessarily done reading
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            async with lock:
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            writer.close()
+            del self.connections[handler]
+
+    async def respond(self, line, writer, lock, pending):
+        try:
+            response = await self.handle(line)
+
+            async with lock:
+                writer.write(response.encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            pending.release()
+
+    async def handle(self, line):
+        '''
+        the response line for a request line.
+        '''
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({"id": None, "error": "bad request: %s" % e})
+
+        try:
+            ident = json.dumps(request.get("id"))
+
+            if request.get("op") == "stats":
+                return json.dumps(dict(self.stats(), id=request.get("id")))
+
+            program = request["term"]
+            backend = request.get("backend", "lazy")
+            max_steps = self.budget(request, "max_steps", self.max_steps)
+            timeout = self.budget(request, "timeout", self.timeout)
+            numerals = bool(request.get("numerals", False))
+
+            if backend not in evaluate.BACKENDS:
+                raise ValueError("unknown backend %r" % backend)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return json.dumps({"id": request.get("id") if isinstance(request, dict) else None, "error": "bad request: %s" % e})
+
+        self.requests += 1
+
+        try:
+            record = await self.compute((program, backend, max_steps, timeout, numerals))
+        except asyncio.TimeoutError:
+            self.expired += 1
+            return '{"id": %s, "error": "timeout"}' % ident
+        except Exception as e:
+            return json.dumps({"id": request.get("id"), "error": "%s: %s" % (e.__class__.__name__, e)})
+
+        return '{"id": %s, %s' % (ident, record[1:])
+
+    @staticmethod
+    def budget(request, name, cap):
+        '''
+        the budget name of request, at most cap.
+        '''
+        if (value := request.get(name)) is None:
+            return cap
+
+        if value < 0:
+            raise ValueError("%s is negative" % name)
+
+        return min(value, cap)
+
+    async def compute(self, key):
+        '''
+        the encoded record for key, shared with every concurrent request for the same key.
+        the worker checks the budget itself, the deadline here also covers the time
+        spent queueing for a worker.
+        '''
+        if (entry := self.inflight.get(key)) is not None and not entry[0].cancelled():
+            self.coalesced += 1
+            entry[1] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.pool, functools.partial(evaluate.evaluate, 0, *key, encode=True, max_depth=MAX_DEPTH))
+            entry = self.inflight[key] = [future, 1]
+            future.add_done_callback(functools.partial(self.forget, key, entry))
+            self.computed += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry[0]), key[3] * 2 + 1)
+        finally:
+            entry[1] -= 1
+
+            if not entry[1] and not entry[0].done():
+                # nobody waits any more, drop it unless a worker already runs it
+                entry[0].cancel()
+
+    def forget(self, key, entry, future):
+        if self.inflight.get(key) is entry:
+            del self.inflight[key]
+
+class Client:
+    '''
+    a connection to a Server, requests are pipelined and matched to responses by id.
+    '''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.waiting = {}
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=None, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=2 ** 26)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=2 ** 26)
+
+        return cls(reader, writer)
+
+    async def receive(self):
+        while (line := await self.reader.readline()):
+            response = json.loads(line)
+
+            if (future := self.waiting.pop(response.get("id"), None)) is not None and not future.done():
+                future.set_result(response)
+
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, **request):
+        request["id"] = ident = next(self.ids)
+        future = self.waiting[ident] = asyncio.get_running_loop().create_future()
+
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def evaluate(self, term, **options):
+        return await self.request(term=term, **options)
+
+    async def stats(self):
+        return await self.request(op="stats")
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sheep-server", description="serve normal forms of λ-terms as line-delimited JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7878)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--max-steps", type=int, default=100000, help="largest step budget of a request")
+    parser.add_argument("--timeout", type=float, default=10.0, help="largest timeout of a request, in seconds")
+    parser.add_argument("--max-pending", type=int, default=64, help="outstanding requests per connection")
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = Server(args.workers, args.max_steps, args.timeout, args.max_pending)
+        print("listening on", await server.start(args.host, args.port, args.unix), flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,243 @@
+'''
+struct-of-arrays term storage.
+
+every node is a row in three parallel arrays:
+    kinds[i]  NODES value of the node
+    left[i]   symbol id (variable, abstraction) or abstraction index (application)
+    right[i]  body index (abstraction) or parameter index (application)
+
+children always come before their parents, so a whole term is a prefix-closed
+slice of the arena and the root is its last row.
+'''
+
+from array import array
+
+from .parsex import LamNode, Var, Lam, App, NODES
+
+class Arena:
+    def __init__(self):
+        self.kinds = array("B")
+        self.left = array("I")
+        self.right = array("I")
+        self.symbols = []
+        self.symbol_ids = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def symbol(self, name):
+        if (i := self.symbol_ids.get(name)) is None:
+            i = self.symbol_ids[name] = len(self.symbols)
+            self.symbols.append(name)
+
+        return i
+
+    def push(self, kind, left, right):
+        self.kinds.append(kind.value)
+        self.left.append(left)
+        self.right.append(right)
+
+        return len(self.kinds) - 1
+
+    def var(self, name):
+        return self.push(NODES.L_VARIABLE, self.symbol(name), 0)
+
+    def lam(self, name, body):
+        return self.push(NODES.L_ABSTRACTION, self.symbol(name), body)
+
+    def app(self, abstraction, parameter):
+        return self.push(NODES.L_APPLICATION, abstraction, parameter)
+
+    def add(self, root):
+        '''
+        copy a LamNode tree into the arena, returns the index of its root.
+        '''
+        results = []
+        stack = [(root, False)]
+
+        while stack:
+            node, done = stack.pop()
+
+            if node.node_type == NODES.L_VARIABLE:
+                results.append(self.var(node.symbol))
+            elif done and node.node_type == NODES.L_ABSTRACTION:
+                results.append(self.lam(node.argument.symbol, results.pop()))
+            elif done:
+                parameter = results.pop()
+                results.append(self.app(results.pop(), parameter))
+            elif node.node_type == NODES.L_ABSTRACTION:
+                stack.append((node, True))
+                stack.append((node.body, False))
+            else:
+                stack.append((node, True))
+                stack.append((node.parameter, False))
+                stack.append((node.abstraction, False))
+
+        return results[0]
+
+    def node(self, index):
+        return ArenaNode(self, index)
+
+    def to_node(self, index):
+        '''
+        rebuild the term rooted at index as Var, Lam and App objects.
+        '''
+        kinds, left, right, symbols = self.kinds, self.left, self.right, self.symbols
+        variable, abstraction = NODES.L_VARIABLE.value, NODES.L_ABSTRACTION.value
+
+        results = []
+        stack = [(index, False)]
+
+        while stack:
+            i, done = stack.pop()
+            kind = kinds[i]
+
+            if kind == variable:
+                results.append(Var(symbols[left[i]]))
+            elif done and kind == abstraction:
+                results.append(Lam(Var(symbols[left[i]]), results.pop()))
+            elif done:
+                parameter = results.pop()
+                results.append(App(results.pop(), parameter))
+            elif kind == abstraction:
+                stack.append((i, True))
+                stack.append((right[i], False))
+            else:
+                stack.append((i, True))
+                stack.append((right[i], False))
+                stack.append((left[i], False))
+
+        return results[0]
+
+class ArenaNode(LamNode):
+    '''
+    read-only LamNode view of one arena row, children are views as well.
+    '''
+
+    __slots__ = ("arena", "index")
+
+    def __new__(cls, arena, index):
+        node = object.__new__(cls)
+        node.arena = arena
+        node.index = index
+        return node
+
+    @property
+    def node_type(self):
+        return NODES(self.arena.kinds[self.index])
+
+    @property
+    def symbol(self):
+        if self.node_type == NODES.L_APPLICATION:
+            raise AttributeError("symbol")
+        return self.arena.symbols[self.arena.left[self.index]]
+
+    @property
+    def argument(self):
+        if self.node_type != NODES.L_ABSTRACTION:
+            raise AttributeError("argument")
+        return Var(self.symbol)
+
+    @property
+    def body(self):
+        if self.node_type != NODES.L_ABSTRACTION:
+            raise AttributeError("body")
+        return ArenaNode(self.arena, self.arena.right[self.index])
+
+    @property
+    def abstraction(self):
+        if self.node_type != NODES.L_APPLICATION:
+            raise AttributeError("abstraction")
+        return ArenaNode(self.arena, self.arena.left[self.index])
+
+    @property
+    def parameter(self):
+        if self.node_type != NODES.L_APPLICATION:
+            raise AttributeError("parameter")
+        return ArenaNode(self.arena, self.arena.right[self.index])
+
+    def __setitem__(self, key, value):
+        raise TypeError("arena nodes are read-only")
+
+if __name__ == "__main__":
+    from .parsex import LamPar, objify_node
+    from . import tools
+
+    def test_Arena():
+        program = "(λm.λn.λf.λx.m f (n f x)) (λf.λx.f (f x)) (λf.λx.f x) λλ 1"
+        root = LamPar(program).parse()
+
+        arena = Arena()
+        index = arena.add(root)
+
+        assert index == len(arena) - 1
+        assert arena.to_node(index) == root
+        assert arena.node(index) == root
+        assert arena.node(index).reconstruct() == root.reconstruct()
+        assert objify_node(arena.node(index)) == objify_node(root)
+        assert tools.beta_reduction(arena.node(index)) == tools.beta_reduction(root)
+        assert tools.convert_church(LamPar("x 2").parse()).reconstruct().startswith("(x) λf")
+
+        deep = LamPar("λx." * 50000 + "x").parse()
+        assert arena.to_node(arena.add(deep)) == deep
+
+        return True
+
+    def bench_memory():
+        import tracemalloc
+        from .lambex import TOKENS
+
+        class DictToken:
+            def __init__(self, token_type, value):
+                self.token_type = token_type
+                self.value = value
+
+        class DictNode:
+            def __init__(self, node_type, **kw):
+                self.node_type = node_type
+                self.values = kw
+
+        def build_dict(n):
+            node = DictNode(NODES.L_VARIABLE, name=DictToken(TOKENS.T_VAR, "x"))
+
+            for i in range(n):
+                if i % 2:
+                    node = DictNode(NODES.L_ABSTRACTION, argument=DictNode(NODES.L_VARIABLE, name=DictToken(TOKENS.T_VAR, "x")), body=node)
+                else:
+                    node = DictNode(NODES.L_APPLICATION, abstraction=node, parameter=DictNode(NODES.L_VARIABLE, name=DictToken(TOKENS.T_VAR, "x")))
+
+            return node
+
+        def build_slots(n):
+            node = Var("x")
+
+            for i in range(n):
+                node = Lam(Var("x"), node) if i % 2 else App(node, Var("x"))
+
+            return node
+
+        def build_arena(n):
+            arena = Arena()
+            node = arena.var("x")
+
+            for i in range(n):
+                node = arena.lam("x", node) if i % 2 else arena.app(node, arena.var("x"))
+
+            return arena
+
+        n = 50000
+        nodes = 2 * n + 1
+
+        for name, build in [("dict LamNode", build_dict), ("slotted Var/Lam/App", build_slots), ("Arena", build_arena)]:
+            tracemalloc.start()
+            term = build(n)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del term
+
+            print("%-20s %6.1f bytes/node" % (name, size / nodes))
+
+        return True
+
+    print(test_Arena())
+    print(bench_memory())
\ No newline at end of file
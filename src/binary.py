@@ -0,0 +1,633 @@
+'''
+compact binary files of terms, named trees (Var, Lam, App) or de Bruijn terms.
+
+    header   MAGIC, VERSION
+    symbols  count, then every name as its length and utf-8 bytes
+    nodes    one record per distinct node, children before their parents
+    footer   offset of the nodes and of the root record (8 bytes each), MAGIC
+
+all numbers are unsigned LEB128 varints. a record is one or two of them, the kind
+is in the low 3 bits of the first, the first field in the rest. a child is written
+as how many bytes its record starts before its parent's, so the child right before
+its parent, the argument of an application mostly, is a small number:
+
+    VARIABLE     symbol                  INDEX  index
+    ABSTRACTION  symbol, body            FREE   symbol
+    APPLICATION  parameter, abstraction  ABS    hint (symbol + 1, 0 for none), body
+                                         APPLY  arg, func
+
+a node shared by several parents is written once, so hash-consed terms stay small
+and come back with the same sharing. a Reader walks a file in place, over bytes or
+an mmap, nodes are only decoded when they are visited.
+'''
+
+import mmap
+import struct
+
+from .parsex import LamNode, Var, Lam, App, NODES
+from .debruijn import Term, Index, Free, Abs, Apply
+
+MAGIC = b"SHEEP"
+VERSION = 2
+
+FOOTER = struct.Struct("<QQ")
+
+VARIABLE    = 0
+ABSTRACTION = 1
+APPLICATION = 2
+INDEX       = 3
+FREE        = 4
+ABS         = 5
+APPLY       = 6
+
+KIND = 3 # bits of the kind in the first number of a record
+KINDS = (1 << KIND) - 1
+
+class SerializeException(Exception):
+    ...
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+
+    out.append(n)
+
+def read_varint(data, pos):
+    '''
+    the varint at pos and the position after it.
+    '''
+    try:
+        byte = data[pos]
+
+        if byte < 0x80:
+            return byte, pos + 1
+
+        n, shift = byte & 0x7f, 7
+
+        while True:
+            pos += 1
+            byte = data[pos]
+            n |= (byte & 0x7f) << shift
+
+            if byte < 0x80:
+                return n, pos + 1
+
+            shift += 7
+    except IndexError:
+        raise SerializeException("truncated number at %d" % pos) from None
+
+def dumps(term):
+    '''
+    the bytes of a file holding term.
+    '''
+    symbols = {}
+    nodes = bytearray()
+    written = {} # id(node) -> offset of its record
+    stack = [(term, False)]
+
+    def symbol(name):
+        if (i := symbols.get(name)) is None:
+            i = symbols[name] = len(symbols)
+        return i
+
+    while stack:
+        node, done = stack.pop()
+
+        if id(node) in written:
+            continue
+
+        if isinstance(node, Term):
+            cls = node.__class__
+            children = (node.body,) if cls is Abs else (node.func, node.arg) if cls is Apply else ()
+        elif isinstance(node, LamNode):
+            node_type = node.node_type
+            children = (node.body,) if node_type == NODES.L_ABSTRACTION else (node.abstraction, node.parameter) if node_type == NODES.L_APPLICATION else ()
+        else:
+            raise SerializeException("can not serialize %r" % (node,))
+
+        if children and not done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children))
+            continue
+
+        offset = written[id(node)] = len(nodes)
+
+        if isinstance(node, Term):
+            if cls is Index:
+                kind, value = INDEX, node.index
+            elif cls is Free:
+                kind, value = FREE, symbol(node.name)
+            elif cls is Abs:
+                kind, value = ABS, 0 if node.hint is None else symbol(node.hint) + 1
+            else:
+                kind, value = APPLY, offset - written[id(node.arg)]
+        elif node_type == NODES.L_VARIABLE:
+            kind, value = VARIABLE, symbol(node.symbol)
+        elif node_type == NODES.L_ABSTRACTION:
+            kind, value = ABSTRACTION, symbol(node.argument.symbol)
+        else:
+            kind, value = APPLICATION, offset - written[id(node.parameter)]
+
+        write_varint(nodes, value << KIND | kind)
+
+        if children:
+            write_varint(nodes, offset - written[id(children[0])])
+
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    write_varint(out, len(symbols))
+
+    for name in symbols:
+        encoded = name.encode()
+        write_varint(out, len(encoded))
+        out += encoded
+
+    start = len(out)
+    out += nodes
+    out += FOOTER.pack(start, start + written[id(term)])
+    out += MAGIC
+
+    return bytes(out)
+
+def dump(term, path):
+    with open(path, "wb") as f:
+        f.write(dumps(term))
+
+def loads(data):
+    return Reader(data).load()
+
+def load(path):
+    with Reader.open(path) as reader:
+        return reader.load()
+
+class Reader:
+    '''
+    a file of terms in data, anything indexable by byte (bytes, bytearray, mmap).
+    only the symbol table is read up front, names are decoded when first used.
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        self.file = None
+
+        end = len(data) - len(MAGIC)
+
+        if end < len(MAGIC) + 1 + FOOTER.size or data[:len(MAGIC)] != MAGIC or data[end:] != MAGIC:
+            raise SerializeException("not a file of terms")
+
+        if data[len(MAGIC)] != VERSION:
+            raise SerializeException("unsupported version %d, expected %d" % (data[len(MAGIC)], VERSION))
+
+        self.start, self.root_offset = FOOTER.unpack(data[end - FOOTER.size:end])
+        self.end = end - FOOTER.size
+
+        if not self.start <= self.root_offset < self.end:
+            raise SerializeException("bad footer")
+
+        count, pos = read_varint(data, len(MAGIC) + 1)
+        self.spans = []
+
+        for _ in range(count):
+            length, pos = read_varint(data, pos)
+            self.spans.append((pos, pos + length))
+            pos += length
+
+        if pos != self.start:
+            raise SerializeException("bad symbol table")
+
+        self.names = [None] * count
+
+    @classmethod
+    def open(cls, path):
+        '''
+        map the file at path, close the reader when done with it and its nodes.
+        '''
+        f = open(path, "rb")
+
+        try:
+            reader = cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (ValueError, SerializeException):
+            f.close()
+            raise
+
+        reader.file = f
+        return reader
+
+    def close(self):
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def name(self, i):
+        if not 0 <= i < len(self.names):
+            raise SerializeException("no symbol %d" % i)
+
+        if (name := self.names[i]) is None:
+            start, end = self.spans[i]
+
+            try:
+                name = self.names[i] = bytes(self.data[start:end]).decode()
+            except UnicodeDecodeError as e:
+                raise SerializeException("bad symbol %d: %s" % (i, e)) from None
+
+        return name
+
+    def child(self, offset, distance):
+        '''
+        the offset of the record distance bytes before the one at offset.
+        '''
+        if not 0 < distance <= offset - self.start:
+            raise SerializeException("bad child of the record at %d" % offset)
+
+        return offset - distance
+
+    def record(self, offset):
+        '''
+        (kind, fields) of the record at offset, children as offsets of their records.
+        '''
+        if not self.start <= offset < self.end:
+            raise SerializeException("no record at %d" % offset)
+
+        first, pos = read_varint(self.data, offset)
+        kind, value = first & KINDS, first >> KIND
+
+        if kind == VARIABLE or kind == FREE or kind == INDEX:
+            return kind, (value,)
+
+        if kind > APPLY:
+            raise SerializeException("bad record kind %d at %d" % (kind, offset))
+
+        second, _ = read_varint(self.data, pos)
+
+        if kind == ABSTRACTION or kind == ABS:
+            return kind, (value, self.child(offset, second))
+
+        # the function or abstraction first, as the fields of the nodes go
+        return kind, (self.child(offset, second), self.child(offset, value))
+
+    @property
+    def root(self):
+        '''
+        the root as a read-only view, named trees only.
+        '''
+        return self.node(self.root_offset)
+
+    def node(self, offset):
+        if self.record(offset)[0] > APPLICATION:
+            raise SerializeException("de Bruijn terms have no views, load them")
+
+        return MappedNode(self, offset)
+
+    def load(self, offset=None):
+        '''
+        decode the term whose record is at offset, the root by default. nodes shared in
+        the file are shared in the result.
+        '''
+        if offset is None or offset == self.root_offset:
+            return self.load_all()
+
+        name = self.name
+        loaded = {}
+        root = offset
+        named = self.record(root)[0] <= APPLICATION
+        stack = [(root, False)]
+
+        # children are before their parents, so this ends even on a corrupt file
+        while stack:
+            offset, done = stack.pop()
+
+            if offset in loaded:
+                continue
+
+            kind, fields = self.record(offset)
+
+            if (kind <= APPLICATION) is not named:
+                raise SerializeException("named and de Bruijn records mixed at %d" % offset)
+
+            if kind == VARIABLE:
+                loaded[offset] = Var(name(fields[0]))
+            elif kind == INDEX:
+                loaded[offset] = Index(fields[0])
+            elif kind == FREE:
+                loaded[offset] = Free(name(fields[0]))
+            elif kind == ABSTRACTION or kind == ABS:
+                value, body = fields
+
+                if not done:
+                    stack.append((offset, True))
+                    stack.append((body, False))
+                elif kind == ABS:
+                    loaded[offset] = Abs(loaded[body], name(value - 1) if value else None)
+                else:
+                    loaded[offset] = Lam(Var(name(value)), loaded[body])
+            else:
+                left, right = fields
+
+                if not done:
+                    stack.append((offset, True))
+                    stack.append((right, False))
+                    stack.append((left, False))
+                elif kind == APPLY:
+                    loaded[offset] = Apply(loaded[left], loaded[right])
+                else:
+                    loaded[offset] = App(loaded[left], loaded[right])
+
+        return loaded[root]
+
+    def load_all(self):
+        '''
+        decode every record in one forward pass, children come first so no stack is
+        needed. the file holds the root's nodes only, so this is the root.
+        '''
+        start = self.start
+        data = bytes(self.data[start:self.end]) # the root is the last record
+        names = [self.name(i) for i in range(len(self.names))]
+        loaded = {}
+        end = self.root_offset - start
+        named = self.record(self.root_offset)[0] <= APPLICATION
+        offset = pos = 0
+
+        # a corrupt file shows as a number running off the end, an unknown symbol or a
+        # child that is not a record before its parent
+        try:
+            while pos <= end:
+                offset = pos
+
+                # the kind and first field, kinds with children have a second field
+                value = data[pos]
+                pos += 1
+
+                if value >= 0x80:
+                    value &= 0x7f
+                    shift = 7
+
+                    while True:
+                        byte = data[pos]
+                        pos += 1
+                        value |= (byte & 0x7f) << shift
+
+                        if byte < 0x80:
+                            break
+
+                        shift += 7
+
+                kind = value & KINDS
+                value >>= KIND
+
+                if (kind <= APPLICATION) is not named:
+                    raise SerializeException("named and de Bruijn records mixed at %d" % (start + offset))
+
+                if kind == VARIABLE:
+                    loaded[offset] = Var(names[value])
+                    continue
+
+                if kind == INDEX:
+                    loaded[offset] = Index(value)
+                    continue
+
+                if kind == FREE:
+                    loaded[offset] = Free(names[value])
+                    continue
+
+                second = data[pos]
+                pos += 1
+
+                if second >= 0x80:
+                    second &= 0x7f
+                    shift = 7
+
+                    while True:
+                        byte = data[pos]
+                        pos += 1
+                        second |= (byte & 0x7f) << shift
+
+                        if byte < 0x80:
+                            break
+
+                        shift += 7
+
+                if kind == APPLICATION:
+                    loaded[offset] = App(loaded[offset - second], loaded[offset - value])
+                elif kind == ABSTRACTION:
+                    loaded[offset] = Lam(Var(names[value]), loaded[offset - second])
+                elif kind == APPLY:
+                    loaded[offset] = Apply(loaded[offset - second], loaded[offset - value])
+                elif kind == ABS:
+                    loaded[offset] = Abs(loaded[offset - second], names[value - 1] if value else None)
+                else:
+                    raise SerializeException("bad record kind %d at %d" % (kind, start + offset))
+
+            return loaded[end]
+        except (IndexError, KeyError):
+            raise SerializeException("corrupt record at %d" % (start + offset)) from None
+
+    def __len__(self):
+        '''
+        number of records in the file.
+        '''
+        count, offset = 0, self.start
+
+        while offset < self.end:
+            first, offset = read_varint(self.data, offset)
+
+            if first & KINDS in (ABSTRACTION, ABS, APPLICATION, APPLY):
+                _, offset = read_varint(self.data, offset)
+
+            count += 1
+
+        return count
+
+class MappedNode(LamNode):
+    '''
+    read-only LamNode view of one record of a Reader, children are views as well.
+    '''
+
+    __slots__ = ("reader", "offset")
+
+    def __new__(cls, reader, offset):
+        node = object.__new__(cls)
+        node.reader = reader
+        node.offset = offset
+        return node
+
+    @property
+    def node_type(self):
+        if (node_type := KIND_NODES.get(self.reader.record(self.offset)[0])) is None:
+            raise SerializeException("de Bruijn record at %d in a named tree" % self.offset)
+
+        return node_type
+
+    def field(self, kind, key, i):
+        record_kind, fields = self.reader.record(self.offset)
+
+        if record_kind != kind:
+            raise AttributeError(key)
+
+        return fields[i]
+
+    @property
+    def symbol(self):
+        record_kind, fields = self.reader.record(self.offset)
+
+        if record_kind == APPLICATION:
+            raise AttributeError("symbol")
+
+        return self.reader.name(fields[0])
+
+    @property
+    def argument(self):
+        return Var(self.reader.name(self.field(ABSTRACTION, "argument", 0)))
+
+    @property
+    def body(self):
+        return MappedNode(self.reader, self.field(ABSTRACTION, "body", 1))
+
+    @property
+    def abstraction(self):
+        return MappedNode(self.reader, self.field(APPLICATION, "abstraction", 0))
+
+    @property
+    def parameter(self):
+        return MappedNode(self.reader, self.field(APPLICATION, "parameter", 1))
+
+    def __setitem__(self, key, value):
+        raise TypeError("mapped nodes are read-only")
+
+KIND_NODES = {
+    VARIABLE:    NODES.L_VARIABLE,
+    ABSTRACTION: NODES.L_ABSTRACTION,
+    APPLICATION: NODES.L_APPLICATION,
+}
+
+if __name__ == "__main__":
+    import gc
+    import json
+    import os
+    import random
+    import tempfile
+    import time
+
+    from .parsex import LamPar, objify_json
+    from .debruijn import to_debruijn
+    from .hashcons import HashCons
+    from .tools import convert_church
+
+    def random_term(rng, size):
+        names = ["x", "y", "f", "g", "n%d" % rng.randint(0, 99)]
+        results = []
+        stack = [size]
+
+        while stack:
+            n = stack.pop()
+
+            if n is None:
+                parameter = results.pop()
+                results.append(App(results.pop(), parameter))
+            elif isinstance(n, str):
+                results.append(Lam(Var(n), results.pop()))
+            elif n <= 1:
+                results.append(Var(rng.choice(names)))
+            elif rng.random() < 0.3:
+                stack.extend([rng.choice(names), n - 1])
+            else:
+                k = rng.randint(1, n - 1)
+                stack.extend([None, n - k, k])
+
+        return results[0]
+
+    def test_binary():
+        for program in ["x", "λx.λy.x y z", "(λm.λn.λf.m (n f)) 2 3", "λλ 2 (λ 1) 3", "λ(λ1) x"]:
+            tree = LamPar(program).parse()
+            assert loads(dumps(tree)) == tree
+
+            term = to_debruijn(tree)
+            assert loads(dumps(term)) == term and repr(loads(dumps(term))) == repr(term)
+
+        tree = LamPar("(λx.x) (λy.y y) z").parse()
+        reader = Reader(dumps(tree))
+        assert reader.root == tree and reader.root.reconstruct() == tree.reconstruct()
+        assert reader.root.parameter.symbol == "z" and reader.root.abstraction.parameter.body == LamPar("y y").parse()
+        assert reader.load(reader.root.abstraction.offset) == tree.abstraction and len(reader) == 9
+
+        # sharing survives
+        shared = HashCons().intern(convert_church(LamPar("(λx.x x) 3").parse()))
+        again = loads(dumps(shared))
+        assert again == shared and again.abstraction.body.abstraction is again.abstraction.body.parameter
+
+        deep = LamPar("λx." * 50000 + "x").parse()
+        assert loads(dumps(deep)) == deep
+
+        path = os.path.join(tempfile.mkdtemp(), "term.sheep")
+        dump(deep, path)
+
+        with Reader.open(path) as reader:
+            assert reader.root.body.body.argument.symbol == "x"
+
+        assert load(path) == deep
+        os.remove(path)
+
+        for data in [b"", b"SHEEP", dumps(tree)[:-1], b"SHEEP\x01" + dumps(tree)[6:]]:
+            try:
+                Reader(data)
+            except SerializeException:
+                continue
+            assert False, data
+
+        # corrupt records raise SerializeException, whichever way they are read
+        data = dumps(LamPar("(λx.x y) (λz.z) w").parse_expression())
+        reader = Reader(data)
+        broken = []
+
+        for i in range(reader.start, reader.end):
+            for byte in range(256):
+                broken.append(data[:i] + bytes([byte]) + data[i + 1:])
+
+        # a symbol table or nodes cut short
+        broken.append(data[:7] + data[reader.start:])
+        broken.append(data[:reader.start] + b"\x80" * (reader.end - reader.start) + data[reader.end:])
+
+        for data in broken:
+            for read in [lambda reader: reader.load_all(), lambda reader: reader.load(reader.start + 1), lambda reader: reader.root.reconstruct(), len]:
+                try:
+                    read(Reader(data))
+                except SerializeException:
+                    pass
+
+        return True
+
+    def bench_binary():
+        tree = random_term(random.Random(3), 50000)
+        text = tree.reconstruct()
+        encoded = objify_json(tree)
+        data = dumps(tree)
+
+        # json only gets as far as dicts, the others build nodes
+        print("%-8s %10s %10s" % ("", "bytes", "load ms"))
+
+        for name, size, run in [
+            ("text", len(text.encode()), lambda: LamPar(text).parse_expression()),
+            ("json", len(encoded.encode()), lambda: json.loads(encoded)),
+            ("binary", len(data), lambda: loads(data)),
+            ("view", len(data), lambda: Reader(data).root.abstraction),
+        ]:
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            gc.enable()
+
+            print("%-8s %10d %10.2f" % (name, size, elapsed * 1000))
+
+        return True
+
+    print(test_binary())
+    print(bench_binary())
\ No newline at end of file
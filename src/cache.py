@@ -0,0 +1,453 @@
+'''
+memoization of parses and normal forms.
+
+keys are de Bruijn terms, which compare and hash alpha-invariantly, so λx.x and
+λy.y share one entry. entries live in an in-memory LRU bounded by a number of
+entries and a total size in term nodes; when it is full the cheapest entry to
+recompute among the least recently used ones goes first. normal forms can also be
+written to a SQLite file, keyed by a blake2b digest of the canonical serialization,
+and survive restarts.
+
+normalize works through head normal forms: a term is head reduced to
+λx1..xn. h M1..Mk and every Mi is normalized through the cache again, so shared
+subterms (library combinators, numerals) hit even inside terms never seen before.
+'''
+
+import collections
+import hashlib
+import sqlite3
+import time
+
+from . import trace
+from .parsex import LamPar
+from .debruijn import Index, Free, Abs, Apply, to_debruijn
+from .reduction import STRATEGIES, Reducer, Reduction
+
+def serialize(term, hints=False):
+    '''
+    prefix form, one token per node: L for a binder (followed by its hint when hints is
+    set), @ for an application, #n for an index and $name for a free variable.
+    '''
+    out = []
+    stack = [term]
+
+    while stack:
+        term = stack.pop()
+        cls = term.__class__
+
+        if cls is Abs:
+            out.append("L" + (term.hint or "") if hints else "L")
+            stack.append(term.body)
+        elif cls is Apply:
+            out.append("@")
+            stack.append(term.arg)
+            stack.append(term.func)
+        elif cls is Index:
+            out.append("#%d" % term.index)
+        else:
+            out.append("$" + term.name)
+
+    return " ".join(out)
+
+def deserialize(text):
+    results = []
+
+    for token in reversed(text.split(" ")):
+        kind = token[0]
+
+        if kind == "#":
+            results.append(Index(int(token[1:])))
+        elif kind == "$":
+            results.append(Free(token[1:]))
+        elif kind == "L":
+            results.append(Abs(results.pop(), token[1:] or None))
+        else:
+            func = results.pop()
+            results.append(Apply(func, results.pop()))
+
+    return results[0]
+
+def digest(term):
+    return hashlib.blake2b(serialize(term).encode(), digest_size=16).hexdigest()
+
+def term_size(term):
+    '''
+    number of distinct node objects in term.
+    '''
+    seen = set()
+    stack = [term]
+
+    while stack:
+        term = stack.pop()
+
+        if id(term) in seen:
+            continue
+        seen.add(id(term))
+
+        if term.__class__ is Abs:
+            stack.append(term.body)
+        elif term.__class__ is Apply:
+            stack.append(term.arg)
+            stack.append(term.func)
+
+    return len(seen)
+
+class LRU:
+    '''
+    least recently used mapping bounded by max_entries and by max_size, the sum of the
+    entry sizes. an eviction removes the entry with the lowest cost per size among the
+    window least recently used ones.
+    '''
+
+    def __init__(self, max_entries=None, max_size=None, window=8):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.window = window
+
+        self.entries = collections.OrderedDict() # key -> (value, size, cost)
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        if (entry := self.entries.get(key)) is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size=1, cost=1):
+        if (old := self.entries.pop(key, None)) is not None:
+            self.size -= old[1]
+
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        self.entries[key] = (value, size, cost)
+        self.size += size
+
+        while self.full():
+            self.evict()
+
+    def full(self):
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            return True
+
+        return self.max_size is not None and self.size > self.max_size
+
+    def evict(self):
+        victim = None
+        best = None
+
+        for i, (key, (_, size, cost)) in enumerate(self.entries.items()):
+            if i == self.window:
+                break
+
+            if best is None or cost / size < best:
+                victim, best = key, cost / size
+
+        self.size -= self.entries.pop(victim)[1]
+        self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+class Store:
+    '''
+    normal forms in a SQLite file, keyed by digest. writes are committed every
+    commit_every puts and on flush or close.
+    '''
+
+    def __init__(self, path, commit_every=256):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS normal (key TEXT PRIMARY KEY, term TEXT, cost INTEGER)")
+        self.commit_every = commit_every
+        self.pending = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, term):
+        row = self.db.execute("SELECT term, cost FROM normal WHERE key = ?", (digest(term),)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return deserialize(row[0]), row[1]
+
+    def put(self, term, normal, cost):
+        self.db.execute("INSERT OR REPLACE INTO normal VALUES (?, ?, ?)", (digest(term), serialize(normal, hints=True), cost))
+        self.pending += 1
+
+        if self.pending >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM normal").fetchone()[0]
+
+class Cache:
+    def __init__(self, max_entries=100000, max_size=10000000, path=None, parses=10000):
+        self.normals = LRU(max_entries, max_size)
+        self.parses = LRU(parses)
+        self.store = Store(path) if path is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def parse(self, program):
+        '''
+        the de Bruijn term of program, parsed once per distinct source text. a program
+        that does not parse raises the ParseException, LexException or EOFError of LamPar.
+        '''
+        if (term := self.parses.get(program)) is None:
+            term = to_debruijn(LamPar(program).parse_expression())
+            self.parses.put(program, term, cost=len(program))
+
+        return term
+
+    def lookup(self, term):
+        if (normal := self.normals.get(term)) is not None:
+            if trace.sink is not None:
+                trace.sink.count("cache_hits")
+
+            return normal
+
+        if self.store is not None and (row := self.store.get(term)) is not None:
+            normal, cost = row
+            self.normals.put(term, normal, term_size(normal), cost)
+
+            if trace.sink is not None:
+                trace.sink.count("cache_hits")
+
+            return normal
+
+        if trace.sink is not None:
+            trace.sink.count("cache_misses")
+
+        return None
+
+    def remember(self, term, normal, size, cost):
+        '''
+        size is the number of nodes normal adds, its arguments are shared with their
+        own entries.
+        '''
+        self.normals.put(term, normal, size, cost)
+
+        if self.store is not None:
+            self.store.put(term, normal, cost)
+
+    @trace.traced("cache")
+    def normalize(self, term, max_steps=None, timeout=None):
+        '''
+        the normal form of term (a LamNode or a de Bruijn term) as a Reduction, every
+        argument of every head normal form on the way is cached too. when a budget
+        runs out the Reduction has no term and nothing partial is cached.
+        '''
+        if not isinstance(term, (Index, Free, Abs, Apply)):
+            term = to_debruijn(term)
+
+        start = time.perf_counter()
+        deadline = start + timeout if timeout is not None else None
+        steps = 0
+
+        results = []
+        tasks = [(term, None)]
+
+        while tasks:
+            term, build = tasks.pop()
+
+            if build is not None:
+                hints, head, n, before = build
+                args = results[len(results) - n:]
+                del results[len(results) - n:]
+
+                for arg in args:
+                    head = Apply(head, arg)
+
+                for hint in reversed(hints):
+                    head = Abs(head, hint)
+
+                self.remember(term, head, 1 + n + len(hints), steps - before)
+                results.append(head)
+                continue
+
+            if (normal := self.lookup(term)) is not None:
+                results.append(normal)
+                continue
+
+            remaining = max_steps - steps if max_steps is not None else None
+            left = deadline - time.perf_counter() if deadline is not None else None
+            head = Reducer(STRATEGIES.HEAD, remaining, left).run(term)
+
+            if not head.normal:
+                return Reduction(None, steps + head.steps, False, time.perf_counter() - start, head.reason)
+
+            hnf = head.term
+            hints = []
+
+            while hnf.__class__ is Abs:
+                hints.append(hnf.hint)
+                hnf = hnf.body
+
+            args = []
+
+            while hnf.__class__ is Apply:
+                args.append(hnf.arg)
+                hnf = hnf.func
+
+            tasks.append((term, (hints, hnf, len(args), steps)))
+            steps += head.steps
+
+            # args are innermost first, the first argument is processed first
+            tasks.extend((arg, None) for arg in args)
+
+        return Reduction(results[0], steps, True, time.perf_counter() - start)
+
+    def stats(self):
+        stats = {
+            "entries": len(self.normals),
+            "size": self.normals.size,
+            "hits": self.normals.hits,
+            "misses": self.normals.misses,
+            "evictions": self.normals.evictions,
+            "parse_hits": self.parses.hits,
+            "parse_misses": self.parses.misses,
+        }
+
+        if self.store is not None:
+            stats["disk_hits"] = self.store.hits
+            stats["disk_misses"] = self.store.misses
+
+        return stats
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    from .parsex import ParseException
+    from .tools import convert_church
+    from .reduction import normalize
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse_expression()))
+
+    def test_serialize():
+        for program in ["λx.λy.x y z", "(λx.x) 1", "λλ 2 (λ 1) 3"]:
+            term = parse(program)
+            assert deserialize(serialize(term)) == term
+            assert deserialize(serialize(term, hints=True)).__repr__() == term.__repr__()
+
+        assert serialize(parse("λx.x")) == serialize(parse("λy.y")) == "L #0"
+        assert serialize(to_debruijn(LamPar("λx. 1").parse_expression())) == "L $1"
+        assert digest(parse("λx.x")) == digest(parse("λy.y")) != digest(parse("λx.λy.x"))
+
+        return True
+
+    def test_LRU():
+        lru = LRU(max_entries=2)
+        lru.put("a", 1)
+        lru.put("b", 2)
+        lru.get("a")
+        lru.put("c", 3)
+        assert "b" not in lru and "a" in lru and lru.evictions == 1
+
+        lru = LRU(max_size=10, window=2)
+        lru.put("cheap", 1, size=5, cost=1)
+        lru.put("dear", 2, size=5, cost=100)
+        lru.put("new", 3, size=5, cost=1)
+        assert "dear" in lru and "cheap" not in lru and lru.size == 10
+
+        lru.put("huge", 4, size=11)
+        assert "huge" not in lru and lru.get("huge") is None and lru.misses == 1
+
+        return True
+
+    def test_Cache():
+        cache = Cache()
+        plus = "(λm.λn.λf.λx.m f (n f x))"
+
+        result = cache.normalize(parse("%s 2 3" % plus))
+        assert result.normal and result.term == parse("5")
+
+        # alpha-equivalent input hits the cache and takes no steps
+        again = cache.normalize(parse("(λa.λb.λg.λy.a g (b g y)) 2 3"))
+        assert again.term == result.term and again.steps == 0
+
+        # arguments of head normal forms are cached and reused by other terms
+        assert cache.normalize(parse("λz.z (%s 2 3)" % plus)).steps == 0
+
+        for program in ["(λx.λy.y) ((λx.x x) (λx.x x)) z", "λx.(λy.λz.y z) x", "(λx.λy.x y) y", "(λm.λn.n m) 2 3"]:
+            assert cache.normalize(parse(program)).term == normalize(parse(program)).term, program
+
+        result = cache.normalize(parse("(λx.x x) (λx.x x)"), max_steps=100)
+        assert not result.normal and result.reason == "steps" and result.term is None
+
+        assert cache.parse("λx.x") is cache.parse("λx.x") and cache.stats()["parse_hits"] == 1
+
+        try:
+            cache.parse("(λx.x")
+        except (ParseException, EOFError):
+            pass
+        else:
+            assert False
+        assert cache.stats()["hits"] > 0
+
+        return True
+
+    def test_Store():
+        path = os.path.join(tempfile.mkdtemp(), "normal.sqlite")
+        term = parse("(λm.λn.λf.m (n f)) 20 20")
+
+        with Cache(path=path) as cache:
+            first = cache.normalize(term)
+
+        with Cache(path=path) as cache:
+            second = cache.normalize(term)
+            assert second.steps == 0 and second.term == first.term
+            assert cache.stats()["disk_hits"] == 1
+
+        os.remove(path)
+        return True
+
+    def bench_Cache():
+        library = ["(λm.λn.λf.m (n f)) %d %d" % (n, n) for n in range(20, 40)]
+        jobs = [parse("λq.q (%s) (%s)" % (library[i % 20], library[(i * 7) % 20])) for i in range(100)]
+
+        for name, run in [("uncached", normalize), ("cached", Cache().normalize)]:
+            start = time.perf_counter()
+            steps = sum(run(job).steps for job in jobs)
+            print("%-8s %7d steps, %8.2f ms" % (name, steps, (time.perf_counter() - start) * 1000))
+
+        return True
+
+    print(test_serialize() and test_LRU() and test_Cache() and test_Store())
+    print(bench_Cache())
\ No newline at end of file
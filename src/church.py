@@ -0,0 +1,306 @@
+'''
+Church numerals without source text.
+
+    n  =  λf.λx. f (f (... (f x)))    n applications of f
+
+numeral builds the LamNode tree of n directly, compact a tree of O(log n) nodes
+with the same normal form, church the de Bruijn term. to_int reads a numeral, a
+normal form or a numeral literal, back into an int.
+
+in the de Bruijn core a number outside anonymous binders stays a Free literal.
+accelerate folds the standard combinators applied to numerals into literals with
+Python ints, the combinators are matched by de Bruijn equality, so any alpha
+variant is recognized:
+
+    succ  λn.λf.λx.f (n f x)          pred  λn.λf.λx.n (λg.λh.h (g f)) (λu.x) (λu.u)
+    plus  λm.λn.λf.λx.m f (n f x)     mult  λm.λn.λf.m (n f)
+    exp   λm.λn.n m
+
+normalize expands whatever literals are left into numerals and reduces the rest
+with the call-by-need machine.
+'''
+
+import time
+
+from .parsex import LamPar, LamNode, Var, Lam, App
+from .debruijn import Term, Index, Free, Abs, Apply, to_debruijn, from_debruijn
+from .reduction import Reduction
+from .machine import LazyKrivine
+
+def numeral(n, f="f", x="x", shared=False):
+    '''
+    the tree of λf.λx. f^n x, with shared every f is the same Var node.
+    '''
+    var = Var(f)
+    body = Var(x)
+
+    for _ in range(n):
+        body = App(var if shared else Var(f), body)
+
+    return Lam(Var(f), Lam(Var(x), body))
+
+def church(n):
+    one = Index(1)
+    body = Index(0)
+
+    for _ in range(n):
+        body = Apply(one, body)
+
+    return Abs(Abs(body, "x"), "f")
+
+def is_literal(term):
+    return term.__class__ is Free and term.name.isdigit()
+
+def to_int(term):
+    '''
+    n when term (a LamNode or a de Bruijn term) is the numeral or literal n, else None.
+    '''
+    if isinstance(term, LamNode):
+        if term.node_type != Lam.node_type:
+            return int(term.symbol) if term.node_type == Var.node_type and term.symbol.isdigit() else None
+
+        f = term.argument.symbol
+        inner = term.body
+
+        if inner.node_type != Lam.node_type or inner.argument.symbol == f:
+            return None
+
+        x = inner.argument.symbol
+        body = inner.body
+        n = 0
+
+        while body.node_type == App.node_type:
+            if body.abstraction.node_type != Var.node_type or body.abstraction.symbol != f:
+                return None
+
+            body = body.parameter
+            n += 1
+
+        return n if body.node_type == Var.node_type and body.symbol == x else None
+
+    if is_literal(term):
+        return int(term.name)
+
+    if term.__class__ is not Abs or term.body.__class__ is not Abs:
+        return None
+
+    body = term.body.body
+    n = 0
+
+    while body.__class__ is Apply:
+        if body.func.__class__ is not Index or body.func.index != 1:
+            return None
+
+        body = body.arg
+        n += 1
+
+    return n if body.__class__ is Index and body.index == 0 else None
+
+def combinator(program):
+    return to_debruijn(LamPar(program).parse_expression())
+
+SUCC = combinator("λn.λf.λx.f (n f x)")
+PLUS = combinator("λm.λn.λf.λx.m f (n f x)")
+MULT = combinator("λm.λn.λf.m (n f)")
+
+# combinator -> (arity, operation on the ints, None where the normal form is no numeral)
+OPERATIONS = {
+    SUCC: (1, lambda n: n + 1),
+    combinator("λn.λf.λx.n f (f x)"): (1, lambda n: n + 1),
+    combinator("λn.λf.λx.n (λg.λh.h (g f)) (λu.x) (λu.u)"): (1, lambda n: max(n - 1, 0)),
+    PLUS: (2, lambda m, n: m + n),
+    MULT: (2, lambda m, n: m * n),
+    # 0 m is λx.x, not a numeral
+    combinator("λm.λn.n m"): (2, lambda m, n: m ** n if n else None),
+}
+
+def compact(n):
+    '''
+    a tree of O(log n) nodes normalizing to n: the binary digits of n from the top,
+    every digit doubles with mult 2 and adds with succ.
+    '''
+    term = numeral(0)
+
+    for digit in bin(n)[2:]:
+        term = App(App(from_debruijn(MULT), numeral(2)), term)
+
+        if digit == "1":
+            term = App(from_debruijn(SUCC), term)
+
+    return term
+
+def fold(term):
+    '''
+    rebuild term bottom up, every combinator applied to as many numerals as its arity
+    becomes the literal of the result. subterms without a fold are shared with term.
+    '''
+    results = []
+    stack = [(term, False)]
+
+    while stack:
+        t, done = stack.pop()
+        cls = t.__class__
+
+        if cls is Abs:
+            if done:
+                body = results.pop()
+                results.append(t if body is t.body else Abs(body, t.hint))
+            else:
+                stack.append((t, True))
+                stack.append((t.body, False))
+        elif cls is Apply:
+            if not done:
+                stack.append((t, True))
+                stack.append((t.arg, False))
+                stack.append((t.func, False))
+                continue
+
+            arg = results.pop()
+            func = results.pop()
+            new = t if func is t.func and arg is t.arg else Apply(func, arg)
+
+            if (operation := OPERATIONS.get(func)) is not None and operation[0] == 1:
+                if (n := to_int(arg)) is not None:
+                    new = literal(operation[1](n), new)
+            elif func.__class__ is Apply and (operation := OPERATIONS.get(func.func)) is not None and operation[0] == 2:
+                if (m := to_int(func.arg)) is not None and (n := to_int(arg)) is not None:
+                    new = literal(operation[1](m, n), new)
+
+            results.append(new)
+        else:
+            results.append(t)
+
+    return results[0]
+
+def literal(value, otherwise):
+    return Free(str(value)) if value is not None else otherwise
+
+def expand(term):
+    '''
+    replace every numeral literal in term by its Church numeral.
+    '''
+    numerals = {}
+    results = []
+    stack = [(term, False)]
+
+    while stack:
+        t, done = stack.pop()
+        cls = t.__class__
+
+        if done:
+            if cls is Abs:
+                body = results.pop()
+                results.append(t if body is t.body else Abs(body, t.hint))
+            else:
+                arg = results.pop()
+                func = results.pop()
+                results.append(t if func is t.func and arg is t.arg else Apply(func, arg))
+        elif cls is Abs:
+            stack.append((t, True))
+            stack.append((t.body, False))
+        elif cls is Apply:
+            stack.append((t, True))
+            stack.append((t.arg, False))
+            stack.append((t.func, False))
+        elif is_literal(t):
+            if (new := numerals.get(t.name)) is None:
+                new = numerals[t.name] = church(int(t.name))
+            results.append(new)
+        else:
+            results.append(t)
+
+    return results[0]
+
+def normalize(tree, accelerate=False, literals=False, max_steps=None, timeout=None):
+    '''
+    normalize tree with numerals read as Church numerals. accelerate folds arithmetic
+    on numerals first; with literals a result that folded into a single number is
+    returned as its literal instead of being expanded.
+    '''
+    start = time.perf_counter()
+    term = tree if isinstance(tree, Term) else to_debruijn(tree)
+
+    if accelerate:
+        term = fold(term)
+
+        if literals and is_literal(term):
+            return Reduction(term, 0, True, time.perf_counter() - start)
+
+    result = LazyKrivine(max_steps, timeout).run(expand(term))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+if __name__ == "__main__":
+    from . import tools
+    from .reduction import normalize as reduce
+
+    def parse(program):
+        return to_debruijn(LamPar(program).parse_expression())
+
+    def test_numeral():
+        for n in [0, 1, 5, 300]:
+            expected = to_debruijn(LamPar(tools.encode_church(n)).parse())
+            assert to_debruijn(numeral(n)) == church(n) == expected
+            assert to_debruijn(numeral(n, shared=True)) == expected
+            assert to_int(numeral(n)) == to_int(church(n)) == n
+            assert to_int(reduce(to_debruijn(compact(n))).term) == n
+
+        assert to_int(Free("42")) == to_int(Var("42")) == 42
+        assert to_int(parse("λf.λx.x f")) is None and to_int(parse("λf.λf.f f")) is None
+        assert to_int(LamPar("λf.λf.f f").parse()) is None
+
+        tree = numeral(1000000, shared=True)
+        assert to_int(tree) == 1000000
+
+        converted = tools.convert_church(LamPar("(λm.m) 3").parse())
+        assert to_int(converted.parameter) == 3 and to_debruijn(converted) == to_debruijn(App(LamPar("λm.m").parse(), numeral(3)))
+
+        return True
+
+    def test_accelerate():
+        programs = [
+            "(λn.λf.λx.f (n f x)) 4",
+            "(λn.λf.λx.n (λg.λh.h (g f)) (λu.x) (λu.u)) 4",
+            "(λn.λf.λx.n (λg.λh.h (g f)) (λu.x) (λu.u)) 0",
+            "(λm.λn.λf.λx.m f (n f x)) 2 3",
+            "(λm.λn.λf.m (n f)) 3 (λa.λb.a (a b))",
+            "(λm.λn.n m) 2 3",
+            "(λm.λn.n m) 0 2",
+            "(λm.λn.n m) 2 0",
+            "(λm.λn.λf.m (n f)) 2 3 g y",
+            "λq.q ((λm.λn.λf.m (n f)) 2 ((λm.λn.λf.λx.m f (n f x)) 1 2))",
+        ]
+
+        for program in programs:
+            plain = normalize(parse(program))
+            fast = normalize(parse(program), accelerate=True)
+            assert plain.term == fast.term == reduce(expand(parse(program))).term, program
+
+        assert fold(parse("(λa.λb.b a) 2 0")) == parse("(λa.λb.b a) 2 0")
+        assert fold(parse("(λm.λn.λf.m (n f)) 2 ((λm.λn.λf.λx.m f (n f x)) 1 2)")) == Free("6")
+
+        result = normalize(parse("(λm.λn.λf.m (n f)) 1000 1000"), accelerate=True, literals=True)
+        assert to_int(result.term) == 1000000 and result.steps == 0
+
+        return True
+
+    def bench_church():
+        for n in [1000, 100000]:
+            start = time.perf_counter()
+            LamPar(tools.encode_church(n)).parse()
+            text = time.perf_counter() - start
+
+            start = time.perf_counter()
+            numeral(n)
+            print("numeral %6d: parsed %8.2f ms, built %8.2f ms" % (n, text * 1000, (time.perf_counter() - start) * 1000))
+
+        program = parse("(λm.λn.λf.m (n f)) 1000 ((λm.λn.n m) 10 3)")
+
+        for accelerate in [False, True]:
+            result = normalize(program, accelerate=accelerate, literals=True)
+            print("accelerate=%-5s %8d steps, %10.3f ms" % (accelerate, result.steps, result.elapsed * 1000))
+
+        return True
+
+    print(test_numeral() and test_accelerate())
+    print(bench_church())
\ No newline at end of file
@@ -0,0 +1,528 @@
+'''
+combinator backend: terms are translated into combinators by bracket abstraction and
+reduced as a graph, without variables or substitution.
+
+    I x        → x              B f g x      → f (g x)
+    K x y      → x              C f g x      → f x g
+    S f g x    → f x (g x)      S' c f g x   → c (f x) (g x)
+    B* c f g x → c (f (g x))    C' c f g x   → c (f x) g
+
+bracket abstraction [x]E removes one binder. plain S K I grows terms quadratically
+with their depth, so Turner's rules are used: [x] only descends into the side of an
+application that x occurs in (B and C), and S (K p) I, S (K p) (B q r), S (B p q) r
+and S (B p q) (K r) become p, B* p q r, S' p q r and C' p q r. binders are de
+Bruijn levels here, so an abstraction never shifts or copies the subterms it leaves.
+
+reduction unwinds the spine of applications to its head and overwrites the root of
+every redex with its contractum, so a shared redex is reduced once for all the
+places it is used. I and K leave an indirection, which later walks skip. a head
+stuck on a variable is read back and its arguments are reduced the same way. a
+combinator short of n arguments is n binders: as nbe reads back functions, it is
+applied to n fresh variables and reduced on, so nothing is ever substituted.
+
+[x](f x) = f only holds up to η, and η changes normal forms when f is a variable,
+so it is used only for closed f. the normal forms are then those of reduction.normalize.
+'''
+
+import time
+
+from . import trace
+from .parsex import LamPar, LamNode
+from .debruijn import Index, Free, Abs, Apply, to_debruijn
+from .reduction import Reduction, report
+
+class Combinator:
+    __slots__ = ("name", "arity", "definition")
+
+    top = -1
+    free = False
+
+    def __init__(self, name, arity, definition):
+        self.name = name
+        self.arity = arity
+        self.definition = to_debruijn(LamPar(definition).parse_expression())
+
+    def __repr__(self):
+        return self.name
+
+I  = Combinator("I",  1, "λ 1")
+K  = Combinator("K",  2, "λλ 2")
+S  = Combinator("S",  3, "λλλ 3 1 (2 1)")
+B  = Combinator("B",  3, "λλλ 3 (2 1)")
+C  = Combinator("C",  3, "λλλ 3 1 2")
+S2 = Combinator("S'", 4, "λλλλ 4 (3 1) (2 1)")
+B2 = Combinator("B*", 4, "λλλλ 4 (3 (2 1))")
+C2 = Combinator("C'", 4, "λλλλ 4 (3 1) 2")
+
+IND = object() # Ap(IND, target) is an indirection to target
+
+class Level:
+    '''
+    a variable during translation, the level of its binder counted from the root.
+    '''
+
+    __slots__ = ("top",)
+
+    free = False
+
+    def __init__(self, level):
+        self.top = level
+
+class Name:
+    '''
+    a free variable.
+    '''
+
+    __slots__ = ("name",)
+
+    top = -1
+    free = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+class Ap:
+    '''
+    an application node of the graph, overwritten in place by reduction. top is the
+    highest level in it and free whether it has free variables, both only kept while
+    translating.
+    '''
+
+    __slots__ = ("func", "arg", "top", "free")
+
+    def __init__(self, func, arg):
+        self.func = func
+        self.arg = arg
+
+    def __repr__(self):
+        return "(%r %r)" % (self.func, self.arg)
+
+def ap(func, arg):
+    node = Ap(func, arg)
+    node.top = max(func.top, arg.top)
+    node.free = func.free or arg.free
+    return node
+
+def is_b(e):
+    '''
+    whether e is B p q.
+    '''
+    return e.__class__ is Ap and e.func.__class__ is Ap and e.func.func is B
+
+def combine(a, b, fa, fb, optimize):
+    '''
+    [x](A B) from [x]A and [x]B, fa and fb are A and B when x does not occur in them.
+    '''
+    if not optimize:
+        return ap(ap(S, a if fa is None else ap(K, fa)), b if fb is None else ap(K, fb))
+
+    if fa is not None:
+        if b is I and fa.top == -1 and not fa.free:
+            return fa # S (K p) I
+
+        if is_b(b):
+            return ap(ap(ap(B2, fa), b.func.arg), b.arg) # S (K p) (B q r)
+
+        return ap(ap(B, fa), b)
+
+    if fb is not None:
+        if is_b(a):
+            return ap(ap(ap(C2, a.func.arg), a.arg), fb) # S (B p q) (K r)
+
+        return ap(ap(C, a), fb)
+
+    if is_b(a):
+        return ap(ap(ap(S2, a.func.arg), a.arg), b) # S (B p q) r
+
+    return ap(ap(S, a), b)
+
+def abstract(expr, level, optimize=True):
+    '''
+    [x]expr for the variable of level, the highest level in expr.
+    '''
+    results = []
+    stack = [(expr, False)]
+
+    while stack:
+        e, done = stack.pop()
+
+        if e.top != level:
+            results.append(ap(K, e))
+        elif e.__class__ is Level:
+            results.append(I)
+        elif done:
+            func, arg = e.func, e.arg
+            b = results.pop() if arg.top == level or not optimize else None
+            a = results.pop() if func.top == level or not optimize else None
+            results.append(combine(a, b, func if func.top != level else None, arg if arg.top != level else None, optimize))
+        else:
+            stack.append((e, True))
+
+            # with optimize the sides without the variable stay as they are
+            if e.arg.top == level or not optimize:
+                stack.append((e.arg, False))
+            if e.func.top == level or not optimize:
+                stack.append((e.func, False))
+
+    return results[0]
+
+def translate(term, optimize=True):
+    '''
+    the combinator graph of term, a LamNode or a de Bruijn term. free variables and
+    indices pointing out of the term become Names. without optimize only S, K and I
+    are used.
+    '''
+    if isinstance(term, LamNode):
+        term = to_debruijn(term)
+
+    results = []
+    stack = [(term, 0, False)]
+
+    while stack:
+        term, depth, done = stack.pop()
+        cls = term.__class__
+
+        if cls is Index:
+            if term.index < depth:
+                results.append(Level(depth - term.index - 1))
+            else:
+                results.append(Name(str(term.index - depth + 1)))
+        elif cls is Free:
+            results.append(Name(term.name))
+        elif cls is Abs:
+            if done:
+                results.append(abstract(results.pop(), depth, optimize))
+            else:
+                stack.append((term, depth, True))
+                stack.append((term.body, depth + 1, False))
+        elif done:
+            arg = results.pop()
+            results.append(ap(results.pop(), arg))
+        else:
+            stack.append((term, depth, True))
+            stack.append((term.arg, depth, False))
+            stack.append((term.func, depth, False))
+
+    return results[0]
+
+def size(expr):
+    '''
+    number of distinct nodes in expr.
+    '''
+    seen = set()
+    stack = [expr]
+
+    while stack:
+        e = stack.pop()
+
+        if id(e) in seen:
+            continue
+
+        seen.add(id(e))
+
+        if e.__class__ is Ap:
+            stack.append(e.func)
+            stack.append(e.arg)
+
+    return len(seen)
+
+def expand(expr):
+    '''
+    expr as a de Bruijn term, the combinators in it replaced by their definitions.
+    '''
+    terms = {}
+    stack = [(expr, False)]
+
+    while stack:
+        e, done = stack.pop()
+
+        while e.__class__ is Ap and e.func is IND:
+            e = e.arg
+
+        if id(e) in terms:
+            continue
+
+        if e.__class__ is Ap:
+            if done:
+                terms[id(e)] = Apply(terms[id(resolve(e.func))], terms[id(resolve(e.arg))])
+            else:
+                stack.append((e, True))
+                stack.append((e.arg, False))
+                stack.append((e.func, False))
+        elif e.__class__ is Name:
+            terms[id(e)] = Free(e.name)
+        else:
+            terms[id(e)] = e.definition
+
+    return terms[id(resolve(expr))]
+
+def resolve(e):
+    while e.__class__ is Ap and e.func is IND:
+        e = e.arg
+
+    return e
+
+class OutOfFuel(Exception):
+    ...
+
+class GraphReducer:
+    def __init__(self, max_steps=None, timeout=None, optimize=True):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.optimize = optimize
+
+    @trace.traced("reduce", report)
+    def run(self, term):
+        '''
+        normalize term, the returned Reduction has no term when a budget ran out. steps
+        counts combinator contractions, allocations the nodes made while reducing.
+        '''
+        start = time.perf_counter()
+        steps = 0
+        allocations = 0
+
+        results = []
+        tasks = [(Ap(IND, translate(term, self.optimize)), 0, None)]
+
+        try:
+            while tasks:
+                node, depth, build = tasks.pop()
+
+                if build is not None:
+                    if build.__class__ is int:
+                        body = results.pop()
+
+                        for _ in range(build):
+                            body = Abs(body)
+
+                        results.append(body)
+                    else:
+                        head, n = build
+                        args = results[len(results) - n:]
+                        del results[len(results) - n:]
+
+                        for arg in args:
+                            head = Apply(head, arg)
+
+                        results.append(head)
+                    continue
+
+                head, spine, taken, made = self.whnf(node, steps, start)
+                steps += taken
+                allocations += made
+
+                if head.__class__ is Combinator:
+                    # short of arguments: a binder for each, applied to fresh variables
+                    missing = head.arity - len(spine)
+
+                    for i in range(missing):
+                        node = Ap(node, Level(depth + i))
+
+                    allocations += missing
+                    tasks.append((None, depth, missing))
+                    tasks.append((node, depth + missing, None))
+                    continue
+
+                head = Free(head.name) if head.__class__ is Name else Index(depth - head.top - 1)
+                tasks.append((None, depth, (head, len(spine))))
+
+                # the first argument is the last node of the spine
+                tasks.extend((ap_node.arg, depth, None) for ap_node in spine)
+        except OutOfFuel as oof:
+            taken, made, reason = oof.args
+            return Reduction(None, steps + taken, False, time.perf_counter() - start, reason, allocations + made)
+
+        return Reduction(results[0], steps, True, time.perf_counter() - start, allocations=allocations)
+
+    def whnf(self, node, steps, start):
+        '''
+        reduce node until its head is stuck, in place. returns the head, the spine of
+        application nodes above it from the outermost, the steps taken and the nodes
+        made.
+        '''
+        max_steps = self.max_steps - steps if self.max_steps is not None else None
+        deadline = start + self.timeout if self.timeout is not None else None
+        taken = 0
+        made = 0
+
+        spine = []
+        e = node
+
+        while True:
+            if e.__class__ is Ap:
+                func = e.func
+
+                if func is IND:
+                    e = e.arg
+                    continue
+
+                if func.__class__ is Ap and func.func is IND:
+                    e.func = resolve(func)
+                    continue
+
+                spine.append(e)
+                e = func
+                continue
+
+            n = e.arity if e.__class__ is Combinator else None
+
+            if n is None or len(spine) < n:
+                return e, spine, taken, made
+
+            if max_steps is not None and taken >= max_steps:
+                raise OutOfFuel(taken, made, "steps")
+
+            if deadline is not None and not taken & 1023 and time.perf_counter() > deadline:
+                raise OutOfFuel(taken, made, "timeout")
+
+            taken += 1
+            redex = spine[-n]
+            x = spine[-1].arg
+
+            if e is I or e is K:
+                redex.func, redex.arg = IND, x
+            else:
+                y = spine[-2].arg
+                z = spine[-3].arg
+
+                if e is S:
+                    redex.func, redex.arg = Ap(x, z), Ap(y, z)
+                    made += 2
+                elif e is B:
+                    redex.func, redex.arg = x, Ap(y, z)
+                    made += 1
+                elif e is C:
+                    redex.func, redex.arg = Ap(x, z), y
+                    made += 1
+                else:
+                    w = spine[-4].arg
+
+                    if e is S2:
+                        redex.func, redex.arg = Ap(x, Ap(y, w)), Ap(z, w)
+                        made += 3
+                    elif e is B2:
+                        redex.func, redex.arg = x, Ap(y, Ap(z, w))
+                        made += 2
+                    else:
+                        redex.func, redex.arg = Ap(x, Ap(y, w)), z
+                        made += 2
+
+            del spine[len(spine) - n:]
+            e = redex
+
+def normalize(tree, max_steps=None, timeout=None, optimize=True):
+    return GraphReducer(max_steps, timeout, optimize).run(tree)
+
+if __name__ == "__main__":
+    import random
+
+    from .tools import convert_church
+    from . import reduction
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse_expression()))
+
+    def random_term(rng, size):
+        results = []
+        stack = [(size, 0)]
+
+        while stack:
+            n, depth = stack.pop()
+
+            if n is None:
+                arg = results.pop()
+                results.append(Apply(results.pop(), arg))
+            elif n == "λ":
+                results.append(Abs(results.pop()))
+            elif n <= 1:
+                results.append(Index(rng.randrange(depth)) if depth and rng.random() < 0.8 else Free(rng.choice("abc")))
+            elif rng.random() < 0.35:
+                stack.append(("λ", depth))
+                stack.append((n - 1, depth + 1))
+            else:
+                k = rng.randint(1, n - 1)
+                stack.append((None, depth))
+                stack.append((n - k, depth))
+                stack.append((k, depth))
+
+        return results[0]
+
+    def test_translate():
+        assert repr(translate(parse("λx.x"))) == "I"
+        assert repr(translate(parse("λx.λy.x"))) == "K"
+        assert repr(translate(parse("λx.λy.y x"))) == "(C I)"
+        assert repr(translate(parse("λx.f x"))) == "((B f) I)"
+        assert repr(translate(parse("λx.x x"))) == "((S I) I)"
+
+        # Turner's rules keep the size of deep terms down
+        term = parse("λa.λb.λc.λd.λe.λf.λg.λh.h g f e d c b a")
+        assert size(translate(term)) < size(translate(term, optimize=False)) // 4
+
+        for program in ["λf.λg.λx.f (g x)", "λx.λy.y (x x) z", "λm.λn.λf.λx.m f (n f x)"]:
+            for optimize in (True, False):
+                assert reduction.normalize(expand(translate(parse(program), optimize))).term == parse(program)
+
+        return True
+
+    def test_GraphReducer():
+        for program in [
+            "(λx.x) y",
+            "(λx.λy.x y) y",
+            "(λm.λn.λf.λx.m f (n f x)) 2 3",
+            "(λm.λn.λf.m (n f)) 3 4 s z",
+            "(λm.λn.n m) 2 3",
+            "(λx.λy.y) ((λx.x x) (λx.x x)) z",
+            "λx.(λy.λz.y z) x",
+            "(λf.(λx.f (x x)) (λx.f (x x))) (λr.λb.b c (r (λx.λy.x))) (λx.λy.y)",
+        ]:
+            result = normalize(parse(program))
+            assert result.normal and result.term == reduction.normalize(parse(program)).term, program
+
+        rng = random.Random(24)
+
+        for _ in range(300):
+            term = random_term(rng, rng.randint(1, 30))
+            expected = reduction.normalize(term, max_steps=200)
+
+            if expected.normal:
+                for optimize in (True, False):
+                    result = normalize(term, max_steps=100000, optimize=optimize)
+                    assert result.normal and result.term == expected.term, term
+
+        result = normalize(parse("(λx.x x) (λx.x x)"), max_steps=1000)
+        assert not result.normal and result.reason == "steps" and result.steps == 1000
+
+        assert normalize(parse("(λx.x x x) (λx.x x x)"), timeout=0.05).reason == "timeout"
+
+        # an argument used four times is reduced once
+        work = "((λm.λn.λf.m (n f)) 3 4 (λy.y) a)"
+        assert normalize(parse("(λx.f x x x x) " + work)).steps < normalize(parse("(λx.f x) " + work)).steps + 8
+
+        return True
+
+    def bench_GraphReducer():
+        for program in [
+            "(λm.λn.λf.m (n f)) 30 30 s z",
+            "(λm.λn.λf.λx.m f (n f x)) 300 300 s z",
+            "(λm.λn.n m) 3 5 s z",
+            "(λn.n (λb.λx.λy.b y x) (λx.λy.x)) ((λm.λn.λf.m (n f)) 20 21)",
+        ]:
+            term = parse(program)
+            print(program)
+
+            for name, run in [
+                ("zipper", lambda: reduction.normalize(term)),
+                ("SKI", lambda: normalize(term, optimize=False)),
+                ("combinators", lambda: normalize(term)),
+            ]:
+                result = run()
+                assert result.term == reduction.normalize(term).term
+                print("    %-12s %8d steps %9.2f ms" % (name, result.steps, result.elapsed * 1000))
+
+        return True
+
+    print(test_translate() and test_GraphReducer())
+    print(bench_GraphReducer())
\ No newline at end of file
@@ -0,0 +1,270 @@
+'''
+compilation of closed terms to Python source.
+
+a term is turned into Python code once and every application of it afterwards is
+ordinary Python calls, no walking or copying of its body. values are those of nbe:
+a lambda is a Python function of a Thunk, anything stuck is a Neutral, so results
+read back with NbE.quote and arguments can be any term.
+
+the source stays flat: every lambda is a def in the def of the binder around it, every
+argument that is an application a def next to it, run when the argument is
+forced (call-by-need), and a spine f a b c is one statement per argument. a term
+Python can not compile (binders nested too deep) falls back to nbe's closures.
+
+compiled terms are kept in an LRU keyed by the term, so alpha-equivalent terms share
+one artifact and a process compiles a combinator once.
+'''
+
+from .parsex import LamNode
+from .debruijn import Index, Free, Abs, Apply, to_debruijn, from_debruijn
+from .nbe import NbE, Thunk, Neutral
+from .cache import LRU
+
+MAX_ENTRIES = 4096
+
+class CompileException(Exception):
+    ...
+
+def source(term):
+    '''
+    the source of a function main() returning the value of term, and the free names
+    its constants c0, c1, ... (values) and t0, t1, ... (thunks) stand for.
+    '''
+    names = {}
+    counter = 0
+
+    # (defs, statements, expression of the value): defs only make closures and go to
+    # the block of the innermost binder, statements compute the value
+    results = []
+    stack = [(term, 0, False)]
+
+    while stack:
+        term, depth, done = stack.pop()
+        cls = term.__class__
+
+        if cls is Index:
+            if term.index >= depth:
+                raise CompileException("only closed terms are compiled, index %d is free" % (term.index + 1))
+
+            results.append(([], [], "v%d.force()" % (depth - term.index - 1)))
+        elif cls is Free:
+            if (i := names.get(term.name)) is None:
+                i = names[term.name] = len(names)
+
+            results.append(([], [], "c%d" % i))
+        elif cls is Abs:
+            if done:
+                defs, statements, value = results.pop()
+                name = "f%d" % counter
+                counter += 1
+                results.append(([("def %s(v%d):" % (name, depth), defs + statements + ["return " + value])], [], name))
+            else:
+                stack.append((term, depth, True))
+                stack.append((term.body, depth + 1, False))
+        elif done:
+            arg_defs, arg_statements, arg_value = results.pop()
+            defs, statements, value = results.pop()
+            arg = term.arg
+            defs += arg_defs
+
+            if arg.__class__ is Index:
+                thunk = "v%d" % (depth - arg.index - 1) # the thunk is passed on, not forced
+            elif arg.__class__ is Free:
+                thunk = "t" + arg_value[1:]
+            elif arg.__class__ is Abs:
+                thunk = "Thunk(None, None, %s)" % arg_value
+            else:
+                name = "a%d" % counter
+                counter += 1
+                defs.append(("def %s(_):" % name, arg_statements + ["return " + arg_value]))
+                thunk = "Thunk(%s, None)" % name
+
+            name = "r%d" % counter
+            counter += 1
+            statements.append("%s = %s(%s)" % (name, value, thunk))
+            results.append((defs, statements, name))
+        else:
+            stack.append((term, depth, True))
+            stack.append((term.arg, depth, False))
+            stack.append((term.func, depth, False))
+
+    defs, statements, value = results[0]
+    lines = []
+    stack = [(("def main():", defs + statements + ["return " + value]), 0)]
+
+    while stack:
+        item, indent = stack.pop()
+
+        if item.__class__ is str:
+            lines.append("    " * indent + item)
+        else:
+            header, body = item
+            lines.append("    " * indent + header)
+            stack.extend((line, indent + 1) for line in reversed(body))
+
+    return "\n".join(lines) + "\n", list(names)
+
+class Compiled:
+    '''
+    a compiled term: its value, and the source it came from, None for closures.
+    '''
+
+    __slots__ = ("term", "source", "value")
+
+    def __init__(self, term, source, value):
+        self.term = term
+        self.source = source
+        self.value = value
+
+    def apply(self, *args):
+        '''
+        the value of the term applied to args, terms, LamNodes or Compiled.
+        '''
+        value = self.value
+
+        for arg in args:
+            value = value(thunk_of(arg))
+
+        return value
+
+    def __call__(self, *args):
+        '''
+        the normal form of the term applied to args, as a de Bruijn term. as with NbE,
+        a result that needs deeper Python nesting than the recursion limit raises
+        RecursionError.
+        '''
+        return NbE.quote(self.apply(*args))
+
+    def __repr__(self):
+        return "Compiled(%s)" % (self.term,)
+
+def thunk_of(term):
+    '''
+    an argument, evaluated when it is forced through nbe's closures, which costs less
+    than compiling an argument that is used once.
+    '''
+    if isinstance(term, Compiled):
+        return Thunk(None, None, term.value)
+
+    if isinstance(term, LamNode):
+        term = to_debruijn(term)
+
+    return Thunk(NbE().compile(term, tick), None)
+
+def tick():
+    ...
+
+def build(term):
+    '''
+    compile term without the cache.
+    '''
+    try:
+        text, names = source(term)
+        namespace = {"Thunk": Thunk}
+
+        for i, name in enumerate(names):
+            namespace["c%d" % i] = constant = Neutral(Free(name))
+            namespace["t%d" % i] = Thunk(None, None, constant)
+
+        exec(compile(text, "<sheep %x>" % (term.hash & 0xffffffff), "exec"), namespace)
+        return Compiled(term, text, namespace["main"]())
+    except (RecursionError, MemoryError, SyntaxError):
+        return Compiled(term, None, NbE().compile(term, tick)(None))
+
+artifacts = LRU(max_entries=MAX_ENTRIES)
+
+def compile_term(term):
+    '''
+    the Compiled of a closed term, a LamNode or a de Bruijn term, from the cache when
+    an alpha-equivalent term was compiled before.
+    '''
+    if isinstance(term, LamNode):
+        term = to_debruijn(term)
+
+    if term.loose:
+        raise CompileException("only closed terms are compiled, %s has free indices" % (term,))
+
+    if (compiled := artifacts.get(term)) is None:
+        compiled = build(term)
+        artifacts.put(term, compiled)
+
+    return compiled
+
+def readback(value):
+    '''
+    a value as a LamNode tree.
+    '''
+    return from_debruijn(NbE.quote(value))
+
+if __name__ == "__main__":
+    import time
+
+    from .parsex import LamPar
+    from .tools import convert_church
+    from . import reduction, nbe
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse_expression()))
+
+    def test_compile():
+        plus = compile_term(parse("λm.λn.λf.λx.m f (n f x)"))
+        assert plus.source is not None and plus(parse("2"), parse("3")) == parse("5")
+        assert readback(plus.apply(parse("2"), parse("3"))).reconstruct() == "λx0.λx1.(x0) (x0) (x0) (x0) (x0) x1"
+
+        for program, args in [
+            ("λx.x", ["y"]),
+            ("λf.λx.f (f x)", ["λy.y"]),
+            ("λx.λy.y ((λz.z) x) (λw.x w w)", ["a", "b"]),
+            ("λm.λn.n m", ["2", "3"]),
+            ("λx.λy.x y", ["y"]),
+            ("λa.λb.(λx.x x) (λx.a) b", ["u", "v"]),
+            ("(λx.x) (λy.z y)", ["q"]),
+            ("λx.λy.y", ["(λx.x x) (λx.x x)", "w"]),
+        ]:
+            term = parse(program)
+            expected = reduction.normalize(parse("(%s) %s" % (program, " ".join("(%s)" % arg for arg in args))))
+            assert compile_term(term)(*[parse(arg) for arg in args]) == expected.term, program
+
+        # alpha-equivalent terms share an artifact
+        assert compile_term(LamPar("λa.λb.a").parse_expression()) is compile_term(parse("λx.λy.x"))
+
+        # too deep for Python's compiler, closures instead
+        deep = compile_term(parse("λx." * 5000 + "x"))
+        assert deep.source is None and deep(*[parse("a")] * 4999, parse("b")) == Free("b")
+
+        numeral = compile_term(parse("1000"))
+        assert numeral.source is not None and numeral(parse("λy.s y"), parse("z")) == parse("s" + " (s" * 999 + " z" + ")" * 999)
+
+        try:
+            compile_term(Abs(Index(1)))
+        except CompileException:
+            pass
+        else:
+            assert False
+
+        return True
+
+    def bench_compile():
+        # n ↦ (n + 2n) * 3 mod 2, a combinator of some size applied to many numerals
+        program = "λn.(λp.p (λb.λx.λy.b y x) (λx.λy.x)) ((λm.λk.λf.m (k f)) ((λm.λk.λf.λx.m f (k f x)) n ((λm.λk.λf.λx.m f (k f x)) n n)) 3)"
+        term = parse(program)
+        inputs = [parse(str(i % 100)) for i in range(500)]
+
+        start = time.perf_counter()
+        compiled = compile_term(term)
+        print("compile       %9.2f ms" % ((time.perf_counter() - start) * 1000))
+
+        for name, run in [
+            ("zipper", lambda arg: reduction.normalize(Apply(term, arg)).term),
+            ("NbE", lambda arg: nbe.normalize(Apply(term, arg)).term),
+            ("compiled", compiled),
+        ]:
+            start = time.perf_counter()
+            results = [run(arg) for arg in inputs]
+            print("%-12s %10.2f ms" % (name, (time.perf_counter() - start) * 1000))
+            assert results[1] == parse("λx.λy.y") and results[2] == parse("λx.λy.x")
+
+        return True
+
+    print(test_compile())
+    print(bench_compile())
\ No newline at end of file
@@ -0,0 +1,420 @@
+'''
+locally nameless core terms: bound variables are de Bruijn indices, free variables
+keep their names.
+
+    λx.λy. x y z  ->  Abs(Abs(Apply(Apply(Index(1), Index(0)), Free(z))))
+
+indices are 0-based internally and printed 1-based, as LamPar reads them.
+binder names are only kept as hints for printing, so alpha-equivalent terms are
+structurally equal, hash equal and usable as cache keys.
+
+every term also knows loose, one more than the largest index pointing out of it
+(0 for closed terms), shifting and substitution skip subterms they cannot touch
+and share them with the input.
+'''
+
+import zlib
+
+from .parsex import Var, Lam, App, NODES
+
+class Term:
+    __slots__ = ("hash", "loose")
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if not isinstance(other, Term):
+            return False
+
+        stack = [(self, other)]
+
+        while stack:
+            a, b = stack.pop()
+
+            if a is b:
+                continue
+
+            if a.hash != b.hash or a.__class__ is not b.__class__:
+                return False
+
+            if a.__class__ is Abs:
+                stack.append((a.body, b.body))
+            elif a.__class__ is Apply:
+                stack.append((a.arg, b.arg))
+                stack.append((a.func, b.func))
+            elif a.__class__ is Index:
+                if a.index != b.index:
+                    return False
+            elif a.name != b.name:
+                return False
+
+        return True
+
+    def __repr__(self):
+        out = []
+        stack = [self]
+
+        while stack:
+            term = stack.pop()
+
+            if isinstance(term, str):
+                out.append(term)
+            elif term.__class__ is Abs:
+                out.append("λ")
+                stack.append(term.body)
+            elif term.__class__ is Apply:
+                out.append("(")
+                stack.extend((term.arg, ") ", term.func))
+            elif term.__class__ is Index:
+                out.append(str(term.index + 1))
+            else:
+                out.append(term.name)
+
+        return "".join(out)
+
+class Index(Term):
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+        self.loose = index + 1
+        self.hash = hash((1, index))
+
+class Free(Term):
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+        self.loose = 0
+        self.hash = hash((2, zlib.crc32(name.encode())))
+
+class Abs(Term):
+    __slots__ = ("body", "hint")
+
+    def __init__(self, body, hint=None):
+        self.body = body
+        self.hint = hint
+        self.loose = body.loose - 1 if body.loose else 0
+        self.hash = hash((3, body.hash))
+
+class Apply(Term):
+    __slots__ = ("func", "arg")
+
+    def __init__(self, func, arg):
+        self.func = func
+        self.arg = arg
+        self.loose = func.loose if func.loose > arg.loose else arg.loose
+        self.hash = hash((4, func.hash, arg.hash))
+
+def is_anonymous(symbol):
+    return symbol.startswith("α")
+
+def to_debruijn(root, indices=True):
+    '''
+    convert a LamNode tree. with indices, a number n inside an anonymous abstraction
+    is read as the de Bruijn index of the n-th enclosing binder, when there are that
+    many, otherwise numbers stay free variables (numerals).
+    '''
+    scope = {}
+    depth = 0
+    anonymous = 0
+
+    results = []
+    stack = [(root, False)]
+
+    while stack:
+        node, done = stack.pop()
+        node_type = node.node_type
+
+        if node_type == NODES.L_VARIABLE:
+            symbol = node.symbol
+
+            if (binders := scope.get(symbol)):
+                results.append(Index(depth - binders[-1] - 1))
+            elif indices and anonymous and symbol.isdigit() and 0 < int(symbol) <= depth:
+                results.append(Index(int(symbol) - 1))
+            else:
+                results.append(Free(symbol))
+        elif node_type == NODES.L_APPLICATION:
+            if done:
+                arg = results.pop()
+                results.append(Apply(results.pop(), arg))
+            else:
+                stack.append((node, True))
+                stack.append((node.parameter, False))
+                stack.append((node.abstraction, False))
+        else:
+            symbol = node.argument.symbol
+
+            if done:
+                depth -= 1
+                scope[symbol].pop()
+
+                if is_anonymous(symbol):
+                    anonymous -= 1
+                    results.append(Abs(results.pop()))
+                else:
+                    results.append(Abs(results.pop(), symbol))
+            else:
+                scope.setdefault(symbol, []).append(depth)
+                depth += 1
+
+                if is_anonymous(symbol):
+                    anonymous += 1
+
+                stack.append((node, True))
+                stack.append((node.body, False))
+
+    return results[0]
+
+def shape(term):
+    '''
+    (number of distinct nodes, depth) of term.
+    '''
+    root = term
+    depths = {}
+    stack = [(term, False)]
+
+    while stack:
+        term, done = stack.pop()
+
+        if id(term) in depths:
+            continue
+
+        if term.__class__ is Abs:
+            if done:
+                depths[id(term)] = depths[id(term.body)] + 1
+            else:
+                stack.append((term, True))
+                stack.append((term.body, False))
+        elif term.__class__ is Apply:
+            if done:
+                depths[id(term)] = max(depths[id(term.func)], depths[id(term.arg)]) + 1
+            else:
+                stack.append((term, True))
+                stack.append((term.arg, False))
+                stack.append((term.func, False))
+        else:
+            depths[id(term)] = 1
+
+    return len(depths), depths[id(root)]
+
+def free_names(term):
+    names = set()
+    seen = set()
+    stack = [term]
+
+    while stack:
+        term = stack.pop()
+
+        if id(term) in seen:
+            continue
+        seen.add(id(term))
+
+        if term.__class__ is Free:
+            names.add(term.name)
+        elif term.__class__ is Abs:
+            stack.append(term.body)
+        elif term.__class__ is Apply:
+            stack.append(term.arg)
+            stack.append(term.func)
+
+    return names
+
+def is_valid_name(name):
+    return bool(name) and name.isascii() and name[0].isalpha() and name.isalnum()
+
+def from_debruijn(term):
+    '''
+    convert back to a LamNode tree. binders keep their hint when that cannot capture,
+    anything else gets a fresh x0, x1, ... name. no binder shadows another one or a
+    free variable, so the tree reconstructs to a term LamPar reads back alpha-equivalently.
+    '''
+    avoid = free_names(term)
+    names = []
+    counter = 0
+
+    results = []
+    stack = [(term, False)]
+
+    while stack:
+        term, done = stack.pop()
+        cls = term.__class__
+
+        if cls is Index:
+            if term.index >= len(names):
+                results.append(Var(str(term.index - len(names) + 1)))
+            else:
+                results.append(Var(names[-term.index - 1]))
+        elif cls is Free:
+            results.append(Var(term.name))
+        elif cls is Apply:
+            if done:
+                arg = results.pop()
+                results.append(App(results.pop(), arg))
+            else:
+                stack.append((term, True))
+                stack.append((term.arg, False))
+                stack.append((term.func, False))
+        elif done:
+            name = names.pop()
+            avoid.discard(name)
+            results.append(Lam(Var(name), results.pop()))
+        else:
+            name = term.hint
+
+            if not (name and is_valid_name(name)) or name in avoid:
+                while (name := "x%d" % counter) in avoid:
+                    counter += 1
+                counter += 1
+
+            names.append(name)
+            avoid.add(name)
+
+            stack.append((term, True))
+            stack.append((term.body, False))
+
+    return results[0]
+
+def map_indices(term, cutoff, leaf):
+    '''
+    rebuild term, replacing every Index(k) with k >= c by leaf(index, c), where c is
+    cutoff plus the number of binders above it. subterms without such indices are
+    shared with term.
+    '''
+    results = []
+    stack = [(term, cutoff, False)]
+
+    while stack:
+        t, c, done = stack.pop()
+
+        if done:
+            if t.__class__ is Abs:
+                body = results.pop()
+                results.append(t if body is t.body else Abs(body, t.hint))
+            else:
+                arg = results.pop()
+                func = results.pop()
+                results.append(t if func is t.func and arg is t.arg else Apply(func, arg))
+        elif t.loose <= c:
+            results.append(t)
+        elif t.__class__ is Index:
+            results.append(leaf(t, c))
+        elif t.__class__ is Abs:
+            stack.append((t, c, True))
+            stack.append((t.body, c + 1, False))
+        else:
+            stack.append((t, c, True))
+            stack.append((t.arg, c, False))
+            stack.append((t.func, c, False))
+
+    return results[0]
+
+def shift(term, d, cutoff=0):
+    '''
+    add d to every index of term that points above cutoff binders.
+    '''
+    if d == 0 or term.loose <= cutoff:
+        return term
+
+    return map_indices(term, cutoff, lambda index, c: Index(index.index + d))
+
+def substitute(term, j, s):
+    '''
+    [j := s] term, capture-avoiding: s is shifted under every binder it is moved below.
+    '''
+    shifted = {}
+
+    def leaf(index, c):
+        if index.index != c:
+            return index
+
+        if (new := shifted.get(c)) is None:
+            new = shifted[c] = shift(s, c - j)
+
+        return new
+
+    return map_indices(term, j, leaf)
+
+def instantiate(body, arg):
+    '''
+    the contractum of (λ.body) arg: index 0 of body becomes arg, the binder disappears.
+    '''
+    shifted = {}
+
+    def leaf(index, c):
+        if index.index != c:
+            return Index(index.index - 1)
+
+        if (new := shifted.get(c)) is None:
+            new = shifted[c] = shift(arg, c)
+
+        return new
+
+    return map_indices(body, 0, leaf)
+
+if __name__ == "__main__":
+    from .parsex import LamPar
+
+    def parse(program):
+        return to_debruijn(LamPar(program).parse())
+
+    def test_conversion():
+        assert parse("λx.λy.x") == parse("λa.λb.a") == parse("λλ 2")
+        assert parse("λx.λy.x") != parse("λx.λy.y")
+        assert hash(parse("λx.x z")) == hash(parse("λq.q z"))
+        assert parse("λx.x z") != parse("λx.x y")
+        assert parse("λλλ 3 1 (2 1)") == parse("λx.λy.λz.x z (y z)")
+        assert parse("λx. 1") == Abs(Free("1"))
+
+        for program in ["λx.λx.x", "λx.λy.x y (λx.x y)", "(λx.x) y x", "λλ 1 (λ (λ 2 1 4) 1)"]:
+            tree = from_debruijn(parse(program))
+            assert parse(tree.reconstruct()) == parse(program), tree
+
+        assert from_debruijn(parse("λy.λx.y x")).reconstruct() == "λy.λx.(y) x"
+        assert from_debruijn(parse("λx. x0 x")).reconstruct() == "λx.(x0) x"
+        assert from_debruijn(parse("λx.λx.x")).reconstruct() == "λx.λx0.x0"
+        assert from_debruijn(parse("λ x0 1")).reconstruct() == "λx1.(x0) x1"
+
+        return True
+
+    def test_substitution():
+        # (λx.λy.x) y -> λz.y, no capture
+        redex = parse("(λx.λy.x) y")
+        assert instantiate(redex.func.body, redex.arg) == parse("λz.y")
+
+        # (λx.λy.x y) (λz.z w) under one binder
+        term = parse("λq.(λx.λy.x y q) (λz.z q)")
+        assert instantiate(term.body.func.body, term.body.arg) == parse("λq.λy.(λz.z q) y q").body
+
+        assert shift(parse("λx.x y"), 3) is not None
+        assert shift(Index(0), 2) == Index(2) and shift(Index(0), 2, 1) == Index(0)
+        assert substitute(Apply(Index(0), Abs(Index(1))), 0, Free("s")) == Apply(Free("s"), Abs(Free("s")))
+
+        closed = parse("λx.x")
+        assert instantiate(Apply(Index(0), Free("y")), closed).func is closed
+
+        return True
+
+    def test_normalize_debruijn():
+        assert LamPar("λλλ 3 1 (2 1)").normalize_debruijn().reconstruct() == "λx0.λx1.λx2.((x0) x2) (x1) x2"
+        assert LamPar("λ λ 1 (λ (λ 2 1 4) 1)").normalize_debruijn().reconstruct() == "λx0.λx1.(x1) λx2.(λx3.((x2) x3) x0) x2"
+
+        p = LamPar("λλ 2 x")
+        normalized = p.normalize_debruijn()
+        assert p.parse() == normalized
+
+        return True
+
+    def test_deep():
+        depth = 50000
+        term = parse("λx." * depth + "x")
+        assert from_debruijn(term).reconstruct().count("λ") == depth
+        assert shift(parse("λx." * depth + "y"), 1) is not None
+        assert term == parse("λ" * depth + " 1")
+        assert parse("λx." + "λy." * (depth - 1) + "x") == parse("λ" * depth + " %d" % depth)
+
+        return True
+
+    print(test_conversion() and test_substitution() and test_normalize_debruijn() and test_deep())
\ No newline at end of file
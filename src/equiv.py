@@ -0,0 +1,203 @@
+'''
+equivalence of terms: alpha-equivalence, and beta(-eta) convertibility decided lazily.
+
+de Bruijn terms are alpha-invariant and carry a structural hash, so alpha-equivalence
+is one linear comparison, and terms with different hashes differ at once.
+
+convertibility does not normalize either side. both are head reduced to
+λx1..xn. h M1..Mk, the binders and heads compared, and only when those agree the
+arguments are compared pairwise, breadth first, so a difference near the root is
+found before any deep argument is reduced. pairs that are alpha-equivalent are
+equal without reducing, which also decides some terms without a normal form. with
+eta the side with fewer binders is eta-expanded to the other's, λx. M x = M.
+
+the budget counts the steps of all head reductions. when it runs out before an
+answer, the Comparison has equal None.
+'''
+
+import collections
+import time
+
+from . import trace
+from .parsex import LamNode
+from .debruijn import Index, Abs, Apply, to_debruijn, shift
+from .reduction import STRATEGIES, Reducer
+
+class Comparison:
+    '''
+    outcome of a comparison: equal is True, False, or None when the budget ran out
+    ("steps" or "timeout" in reason). difference is a pair of head normal forms of
+    corresponding subterms that differ, when there is one.
+    '''
+
+    def __init__(self, equal, steps, elapsed, reason=None, difference=None):
+        self.equal = equal
+        self.steps = steps
+        self.elapsed = elapsed
+        self.reason = reason
+        self.difference = difference
+
+    def __bool__(self):
+        return self.equal is True
+
+    def __repr__(self):
+        return "Comparison(%s, steps=%d%s)" % (self.equal, self.steps, ", reason=%s" % self.reason if self.reason else "")
+
+def debruijn(term):
+    return to_debruijn(term) if isinstance(term, LamNode) else term
+
+def alpha_equivalent(a, b):
+    '''
+    whether a and b, LamNodes or de Bruijn terms, are equal up to the names of binders.
+    '''
+    a, b = debruijn(a), debruijn(b)
+    return a.hash == b.hash and a == b
+
+def spine(term):
+    '''
+    (number of binders, head, arguments from the first) of a head normal form.
+    '''
+    binders = 0
+
+    while term.__class__ is Abs:
+        binders += 1
+        term = term.body
+
+    args = []
+
+    while term.__class__ is Apply:
+        args.append(term.arg)
+        term = term.func
+
+    args.reverse()
+    return binders, term, args
+
+def expand(binders, head, args, n):
+    '''
+    the spine of λ^binders. head args eta-expanded to n binders.
+    '''
+    d = n - binders
+    return n, shift(head, d), [shift(arg, d) for arg in args] + [Index(i) for i in range(d - 1, -1, -1)]
+
+@trace.traced("equiv")
+def convertible(a, b, max_steps=None, timeout=None, eta=True):
+    '''
+    whether a and b, LamNodes or de Bruijn terms, are beta-convertible, or beta-eta with
+    eta, as a Comparison.
+    '''
+    a, b = debruijn(a), debruijn(b)
+    start = time.perf_counter()
+    deadline = start + timeout if timeout is not None else None
+    steps = 0
+
+    pairs = collections.deque([(a, b)])
+
+    while pairs:
+        a, b = pairs.popleft()
+
+        if a is b or a.hash == b.hash and a == b:
+            continue
+
+        sides = []
+
+        for term in (a, b):
+            remaining = max_steps - steps if max_steps is not None else None
+            left = deadline - time.perf_counter() if deadline is not None else None
+            head = Reducer(STRATEGIES.HEAD, remaining, left).run(term)
+            steps += head.steps
+
+            if not head.normal:
+                return Comparison(None, steps, time.perf_counter() - start, head.reason)
+
+            sides.append(head.term)
+
+        (na, ha, aa), (nb, hb, ab) = spine(sides[0]), spine(sides[1])
+
+        if eta and na < nb:
+            na, ha, aa = expand(na, ha, aa, nb)
+        elif eta and nb < na:
+            nb, hb, ab = expand(nb, hb, ab, na)
+
+        if na != nb or len(aa) != len(ab) or ha != hb:
+            return Comparison(False, steps, time.perf_counter() - start, difference=tuple(sides))
+
+        pairs.extend(zip(aa, ab))
+
+    return Comparison(True, steps, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    from .parsex import LamPar
+    from .tools import convert_church
+    from .reduction import normalize
+
+    def parse(program):
+        return convert_church(LamPar(program).parse_expression())
+
+    def test_alpha_equivalent():
+        assert alpha_equivalent(parse("λx.λy.x y"), parse("λa.λb.a b"))
+        assert alpha_equivalent(parse("λx.x z"), to_debruijn(parse("λy.y z")))
+        assert not alpha_equivalent(parse("λx.λy.y"), parse("λx.λy.x"))
+        assert not alpha_equivalent(parse("λx.x y"), parse("λx.x z"))
+
+        deep = "λx." * 50000 + "x"
+        assert alpha_equivalent(parse(deep), parse(deep.replace("x", "y")))
+
+        return True
+
+    def test_convertible():
+        plus = "(λm.λn.λf.λx.m f (n f x))"
+        mult = "(λm.λn.λf.m (n f))"
+        Y = "(λf.(λx.f (x x)) (λx.f (x x)))"
+
+        for a, b, expected in [
+            ("%s 2 3" % plus, "5", True),
+            ("%s 2 3" % plus, "6", False),
+            ("%s 2 3" % mult, "%s 3 2" % mult, True),
+            ("λx.f x", "f", True),
+            ("λx.λy.x y", "λx.x", True),
+            ("λx.λy.y x", "λx.x", False),
+            ("%s g" % Y, "g (%s g)" % Y, True),
+            ("(λx.x x) (λx.x x)", "(λy.y y) (λy.y y)", True),
+            ("x ((λx.x x) (λx.x x))", "y ((λx.x x) (λx.x x))", False),
+        ]:
+            result = convertible(parse(a), parse(b), max_steps=10000)
+            assert result.equal is expected, (a, b, result)
+
+        assert convertible(parse("λx.f x"), parse("f"), eta=False).equal is False
+
+        result = convertible(parse("f ((λx.x x) (λx.x x))"), parse("f ((λx.x x x) (λx.x x x))"), max_steps=1000)
+        assert result.equal is None and result.reason == "steps" and not result
+
+        # a difference at the root does not reduce the arguments
+        big = "(%s 100 100 (λb.b) z)" % mult
+        result = convertible(parse("f %s" % big), parse("g %s" % big))
+        assert result.equal is False and result.steps == 0
+        assert result.difference[0].func.name == "f"
+
+        result = convertible(parse("λx.x (%s 3 4) %s" % (mult, big)), parse("λx.x 11 %s" % big))
+        assert result.equal is False and result.steps < 50
+
+        return True
+
+    def bench_convertible():
+        mult = "(λm.λn.λf.m (n f))"
+
+        for a, b in [
+            ("f (%s 40 40) (%s 30 30)" % (mult, mult), "f (%s 40 41) (%s 30 30)" % (mult, mult)),
+            ("λx.x (%s 40 40) (%s 50 50)" % (mult, mult), "λx.x (%s 40 40) (%s 25 100)" % (mult, mult)),
+            ("f 1 (%s 40 40)" % mult, "f 2 (%s 40 40)" % mult),
+        ]:
+            a, b = to_debruijn(parse(a)), to_debruijn(parse(b))
+
+            start = time.perf_counter()
+            expected = normalize(a).term == normalize(b).term
+            full = time.perf_counter() - start
+
+            result = convertible(a, b)
+            assert result.equal is expected
+            print("%-5s normalize both %9.2f ms, convertible %9.2f ms, %6d steps" % (expected, full * 1000, result.elapsed * 1000, result.steps))
+
+        return True
+
+    print(test_alpha_equivalent() and test_convertible())
+    print(bench_convertible())
\ No newline at end of file
@@ -0,0 +1,343 @@
+'''
+graph export of terms for the viewer: a DAG of unique nodes and the edges between
+them, as JSON lines or Graphviz DOT, produced as a stream.
+
+    {"node": 0, "kind": "apply", "label": "@"}
+    {"node": 1, "kind": "abs", "label": "λx"}
+    {"edge": [0, 1], "role": "func"}
+    {"binder": [3, 1]}                          variable 3 is bound by 1
+    {"node": 7, "kind": "apply", "label": "@", "collapsed": true}
+
+terms are exported in their de Bruijn form, so structurally equal subterms are one
+node wherever they occur, and shared objects are visited once. they are found by
+the hash every term carries, equality is only checked when two hashes match. nodes
+come in pre-order with the root first, every edge right after the node it leads to.
+
+with binders every variable also gets an edge to its abstraction. an open subterm
+is bound by different abstractions in different places, so only closed subterms are
+shared then. with max_depth the walk stops at that depth: nodes there are collapsed
+and opened later with Graph.expand, which continues the same numbering. nothing
+below them is looked at until then, Graph.size counts what a collapsed node holds
+when the viewer asks for it.
+'''
+
+import json
+
+from .parsex import LamNode
+from .debruijn import Index, Free, Abs, Apply, to_debruijn
+
+KINDS = {Index: "index", Free: "free", Abs: "abs", Apply: "apply"}
+
+class Graph:
+    def __init__(self, term, binders=False, max_depth=None):
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        self.term = term
+        self.binders = binders
+        self.max_depth = max_depth
+
+        self.count = 0
+        self.unique = {}    # hash -> (term, node), the same node for structurally equal terms
+        self.collapsed = {} # node -> (term, depth, scope) of collapsed nodes
+
+    def records(self):
+        '''
+        the records of the term, down to max_depth.
+        '''
+        limit = self.max_depth
+        return self.walk([(self.term, None, None, 0, None)], limit)
+
+    def expand(self, node, levels=None):
+        '''
+        the records below the collapsed node, levels more levels of them, all when None.
+        '''
+        term, depth, scope = self.collapsed.pop(node)
+        items = []
+
+        if term.__class__ is Abs:
+            items.append((term.body, node, "body", depth + 1, (node, scope) if self.binders else None))
+        else:
+            items.append((term.arg, node, "arg", depth + 1, scope))
+            items.append((term.func, node, "func", depth + 1, scope))
+
+        return self.walk(items, depth + levels if levels is not None else None)
+
+    def walk(self, stack, limit):
+        binders = self.binders
+        unique = self.unique
+
+        while stack:
+            term, parent, role, depth, scope = stack.pop()
+            shareable = not binders or term.loose == 0
+            seen = None
+
+            if shareable and (seen := unique.get(term.hash)) is not None:
+                if seen[0] is term or seen[0] == term:
+                    yield {"edge": [parent, seen[1]], "role": role}
+                    continue
+
+            node = self.count
+            self.count += 1
+
+            # another term with the same hash keeps its entry, this one is not shared
+            if shareable and seen is None:
+                unique[term.hash] = (term, node)
+
+            cls = term.__class__
+            record = {"node": node, "kind": KINDS[cls], "label": label(term)}
+            collapse = limit is not None and depth >= limit and (cls is Abs or cls is Apply)
+
+            if collapse:
+                record["collapsed"] = True
+                self.collapsed[node] = (term, depth, scope)
+
+            yield record
+
+            if parent is not None:
+                yield {"edge": [parent, node], "role": role}
+
+            if cls is Index and binders:
+                # the index-th binder on the way up
+                binder = scope
+
+                for _ in range(term.index):
+                    binder = binder[1] if binder is not None else None
+
+                if binder is not None:
+                    yield {"binder": [node, binder[0]]}
+
+            if collapse:
+                continue
+
+            if cls is Abs:
+                stack.append((term.body, node, "body", depth + 1, (node, scope) if binders else None))
+            elif cls is Apply:
+                stack.append((term.arg, node, "arg", depth + 1, scope))
+                stack.append((term.func, node, "func", depth + 1, scope))
+
+    def size(self, node):
+        '''
+        number of nodes below the collapsed node, itself included and shared subterms
+        counted every time.
+        '''
+        sizes = {}
+        term = self.collapsed[node][0]
+        stack = [(term, False)]
+
+        while stack:
+            t, done = stack.pop()
+
+            if id(t) in sizes:
+                continue
+
+            if t.__class__ is Abs:
+                if done:
+                    sizes[id(t)] = sizes[id(t.body)] + 1
+                else:
+                    stack.append((t, True))
+                    stack.append((t.body, False))
+            elif t.__class__ is Apply:
+                if done:
+                    sizes[id(t)] = sizes[id(t.func)] + sizes[id(t.arg)] + 1
+                else:
+                    stack.append((t, True))
+                    stack.append((t.arg, False))
+                    stack.append((t.func, False))
+            else:
+                sizes[id(t)] = 1
+
+        return sizes[id(term)]
+
+def label(term):
+    cls = term.__class__
+
+    if cls is Abs:
+        return "λ" + (term.hint or "")
+
+    if cls is Apply:
+        return "@"
+
+    if cls is Index:
+        return str(term.index + 1)
+
+    return term.name
+
+def write_jsonl(records, stream, size=1 << 16):
+    '''
+    write records as JSON lines, returns how many. the lines are what json.dumps makes
+    of the records, formatted directly and written in batches of about size lines.
+    '''
+    labels = {} # label -> its JSON string
+    lines = []
+    count = 0
+
+    for record in records:
+        if "edge" in record:
+            edge = record["edge"]
+            lines.append('{"edge": [%d, %d], "role": "%s"}\n' % (edge[0], edge[1], record["role"]))
+        elif "node" in record:
+            text = record["label"]
+
+            if (encoded := labels.get(text)) is None:
+                encoded = labels[text] = json.dumps(text, ensure_ascii=False)
+
+            if len(record) == 3:
+                lines.append('{"node": %d, "kind": "%s", "label": %s}\n' % (record["node"], record["kind"], encoded))
+            else:
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            lines.append('{"binder": [%d, %d]}\n' % tuple(record["binder"]))
+
+        count += 1
+
+        if len(lines) >= size:
+            stream.write("".join(lines))
+            lines = []
+
+    stream.write("".join(lines))
+    return count
+
+def write_dot(records, stream, name="term"):
+    '''
+    write records as a Graphviz digraph, binder edges dashed and collapsed nodes grey.
+    '''
+    stream.write("digraph %s {\n    node [shape=box, fontname=\"monospace\"];\n" % name)
+
+    for record in records:
+        if "node" in record:
+            text = record["label"]
+
+            if record.get("collapsed"):
+                stream.write("    n%d [label=%s, style=filled, fillcolor=lightgrey];\n" % (record["node"], json.dumps("%s …" % text, ensure_ascii=False)))
+            else:
+                stream.write("    n%d [label=%s];\n" % (record["node"], json.dumps(text, ensure_ascii=False)))
+        elif "edge" in record:
+            stream.write("    n%d -> n%d [label=%s];\n" % (record["edge"][0], record["edge"][1], record["role"]))
+        else:
+            stream.write("    n%d -> n%d [style=dashed, constraint=false];\n" % tuple(record["binder"]))
+
+    stream.write("}\n")
+
+def export(term, stream, format="jsonl", binders=False, max_depth=None):
+    '''
+    write the graph of term to stream as "jsonl" or "dot", returns the Graph to expand.
+    '''
+    graph = Graph(term, binders, max_depth)
+
+    if format == "dot":
+        write_dot(graph.records(), stream)
+    else:
+        write_jsonl(graph.records(), stream)
+
+    return graph
+
+if __name__ == "__main__":
+    import io
+    import time
+
+    from .parsex import LamPar
+    from .church import church
+
+    def parse(program):
+        return to_debruijn(LamPar(program).parse_expression())
+
+    def rebuild(records):
+        '''
+        the term of the records of a whole graph.
+        '''
+        nodes = {}
+        children = {}
+        root = None
+
+        for record in records:
+            if "node" in record:
+                nodes[record["node"]] = record
+                root = record["node"] if root is None else root
+            elif "edge" in record:
+                children.setdefault(record["edge"][0], {})[record["role"]] = record["edge"][1]
+
+        terms = {}
+        stack = [(root, False)]
+
+        while stack:
+            node, done = stack.pop()
+            record = nodes[node]
+            kind = record["kind"]
+
+            if kind == "index":
+                terms[node] = Index(int(record["label"]) - 1)
+            elif kind == "free":
+                terms[node] = Free(record["label"])
+            elif not done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children[node].values())
+            elif kind == "abs":
+                terms[node] = Abs(terms[children[node]["body"]], record["label"][1:] or None)
+            else:
+                terms[node] = Apply(terms[children[node]["func"]], terms[children[node]["arg"]])
+
+        return terms[root]
+
+    def test_Graph():
+        term = parse("(λx.x) (λy.y)")
+        records = list(Graph(term).records())
+        assert sum("node" in r for r in records) == 3 and rebuild(records) == term
+
+        term = parse("λx.x x")
+        assert sum("node" in r for r in Graph(term).records()) == 3
+
+        records = list(Graph(term, binders=True).records())
+        assert sum("node" in r for r in records) == 4 and [r["binder"][1] for r in records if "binder" in r] == [0, 0]
+
+        term = parse("(λm.λn.λf.λx.m f (n f x)) (λf.λx.f (f x)) (λf.λx.f x) z")
+        for binders in (False, True):
+            assert rebuild(Graph(term, binders).records()) == term
+
+        # levels of detail
+        graph = Graph(church(1000), max_depth=3)
+        records = list(graph.records())
+        collapsed = [r for r in records if r.get("collapsed")]
+        assert len(collapsed) == 1 and graph.size(collapsed[0]["node"]) == 1999
+
+        more = list(graph.expand(collapsed[0]["node"], 2))
+        assert sum("node" in r for r in more) == 2 and len(graph.collapsed) == 1
+        assert rebuild(records + more + list(graph.expand(next(iter(graph.collapsed))))) == church(1000)
+
+        stream = io.StringIO()
+        write_dot(Graph(parse("λx.x y"), binders=True).records(), stream)
+        dot = stream.getvalue()
+        assert dot.startswith("digraph term {") and "style=dashed" in dot and "n0 -> n1 [label=body];" in dot
+
+        stream = io.StringIO()
+        export(term, stream)
+        assert rebuild(json.loads(line) for line in stream.getvalue().splitlines()) == term
+
+        # the lines are those of json.dumps
+        for records in [list(Graph(term, binders=True).records()), records + more, [{"node": 0, "kind": "free", "label": 'a"λ'}]]:
+            stream = io.StringIO()
+            assert write_jsonl(records, stream, size=3) == len(records)
+            assert stream.getvalue() == "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+        # structurally equal terms are one node, also when they are different objects
+        records = list(Graph(Apply(church(50), church(50))).records())
+        assert sum("node" in r for r in records) == sum("node" in r for r in Graph(church(50)).records()) + 1
+
+        return True
+
+    def bench_Graph():
+        term = Apply(church(250000), church(250000))
+
+        for name, run in [
+            ("jsonl", lambda: write_jsonl(Graph(term).records(), io.StringIO())),
+            ("depth 20", lambda: write_jsonl(Graph(term, max_depth=20).records(), io.StringIO())),
+            ("binders", lambda: write_jsonl(Graph(term, binders=True).records(), io.StringIO())),
+        ]:
+            start = time.perf_counter()
+            count = run()
+            print("%-8s %8d records %9.2f ms" % (name, count, (time.perf_counter() - start) * 1000))
+
+        return True
+
+    print(test_Graph())
+    print(bench_Graph())
\ No newline at end of file
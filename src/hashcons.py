@@ -0,0 +1,192 @@
+'''
+hash-consing for terms: every node built through a HashCons is interned by its
+structure, so structurally equal terms are the same object, equality between
+them is an identity check and repeated subterms are stored once.
+
+the table only holds weak references, unused terms are collected as usual.
+'''
+
+import weakref
+
+from .parsex import LamNode, Var, Lam, App, NODES
+
+def interned_eq(self, other):
+    if self is other:
+        return True
+
+    if getattr(other, "factory", None) is self.factory:
+        return False
+
+    return LamNode.__eq__(self, other)
+
+def interned_hash(self):
+    return self.hash
+
+def interned_setitem(self, key, value):
+    raise TypeError("interned nodes are immutable")
+
+class InternedVar(Var):
+    __slots__ = ("factory", "hash", "__weakref__")
+
+    __eq__ = interned_eq
+    __hash__ = interned_hash
+    __setitem__ = interned_setitem
+
+class InternedLam(Lam):
+    __slots__ = ("factory", "hash", "__weakref__")
+
+    __eq__ = interned_eq
+    __hash__ = interned_hash
+    __setitem__ = interned_setitem
+
+class InternedApp(App):
+    __slots__ = ("factory", "hash", "__weakref__")
+
+    __eq__ = interned_eq
+    __hash__ = interned_hash
+    __setitem__ = interned_setitem
+
+class HashCons:
+    def __init__(self):
+        self.table = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.table)
+
+    def owns(self, node):
+        return getattr(node, "factory", None) is self
+
+    def make(self, cls, key, **fields):
+        if (node := self.table.get(key)) is not None:
+            return node
+
+        node = object.__new__(cls)
+        node.factory = self
+        node.hash = hash(key)
+
+        for k, v in fields.items():
+            setattr(node, k, v)
+
+        self.table[key] = node
+        return node
+
+    def var(self, symbol):
+        return self.make(InternedVar, (NODES.L_VARIABLE, symbol), symbol=symbol)
+
+    def lam(self, argument, body):
+        if not self.owns(argument):
+            argument = self.intern(argument)
+        if not self.owns(body):
+            body = self.intern(body)
+
+        return self.make(InternedLam, (NODES.L_ABSTRACTION, argument, body), argument=argument, body=body)
+
+    def app(self, abstraction, parameter):
+        if not self.owns(abstraction):
+            abstraction = self.intern(abstraction)
+        if not self.owns(parameter):
+            parameter = self.intern(parameter)
+
+        return self.make(InternedApp, (NODES.L_APPLICATION, abstraction, parameter), abstraction=abstraction, parameter=parameter)
+
+    def intern(self, root):
+        '''
+        the interned copy of any LamNode tree, shared input subterms are visited once.
+        '''
+        memo = {}
+        results = []
+        stack = [(root, False)]
+
+        while stack:
+            node, done = stack.pop()
+
+            if done:
+                if node.node_type == NODES.L_ABSTRACTION:
+                    body = results.pop()
+                    new = self.lam(results.pop(), body)
+                else:
+                    parameter = results.pop()
+                    new = self.app(results.pop(), parameter)
+
+                memo[id(node)] = new
+                results.append(new)
+            elif self.owns(node):
+                results.append(node)
+            elif (new := memo.get(id(node))) is not None:
+                results.append(new)
+            elif node.node_type == NODES.L_VARIABLE:
+                results.append(self.var(node.symbol))
+            elif node.node_type == NODES.L_ABSTRACTION:
+                stack.append((node, True))
+                stack.append((node.body, False))
+                stack.append((node.argument, False))
+            else:
+                stack.append((node, True))
+                stack.append((node.parameter, False))
+                stack.append((node.abstraction, False))
+
+        return results[0]
+
+if __name__ == "__main__":
+    import gc
+
+    from .parsex import LamPar
+    from . import tools
+
+    def test_HashCons():
+        factory = HashCons()
+
+        a = factory.intern(LamPar("(λx.x x) (λx.x x)").parse())
+        b = factory.intern(LamPar("(λx.x x)  (λx.x x)").parse())
+
+        assert a is b
+        assert a.abstraction is a.parameter
+        assert a == LamPar("(λx.x x) (λx.x x)").parse()
+        assert a != factory.intern(LamPar("(λx.x x) (λy.y y)").parse())
+        assert len({a, b}) == 1
+
+        reduced = tools.substitute(a, factory.var("x"), factory.var("y"))
+        assert reduced.factory is factory
+        assert reduced is factory.intern(LamPar("(λy.y y) (λy.y y)").parse())
+
+        try:
+            a["abstraction"] = factory.var("z")
+        except TypeError:
+            pass
+        else:
+            assert False
+
+        del a, b, reduced
+        gc.collect()
+        assert len(factory) == 0
+
+        return True
+
+    def bench_sharing():
+        import time
+
+        program = "λf.λx." + "f (" * 2000 + "x" + ")" * 2000
+        root = LamPar("(%s) (%s)" % (program, program)).parse()
+
+        factory = HashCons()
+        interned = factory.intern(root)
+
+        nodes = 0
+        stack = [root]
+
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            stack.extend(v for v in node.values.values() if isinstance(v, LamNode))
+
+        print("unique nodes: %d of %d" % (len(factory), nodes))
+
+        for name, tree, var in [("plain", root, LamPar("f").parse()), ("interned", interned, factory.var("f"))]:
+            start = time.perf_counter()
+            tools.substitute(tree, var, var)
+            print("%-8s substitute %.2f ms" % (name, (time.perf_counter() - start) * 1000))
+
+        return True
+
+    print(test_HashCons())
+    print(bench_sharing())
\ No newline at end of file
@@ -0,0 +1,570 @@
+'''
+incremental parsing for editors.
+
+a Document keeps its text as a tree of parenthesized groups: every group holds
+its items, tokens and child groups, with their offsets relative to the group, its
+width and the tree LamPar makes of its items. a group's interior is parsed on its
+own (a group is an operand and always ends at its ")"), the only context it needs
+is the number of abstractions before it, which names its anonymous binders α<n>.
+
+an edit descends to the smallest group whose interior contains it, re-lexes the run
+of tokens it touches, re-parses the items of that group, where child groups are
+operands whose trees are reused, and hangs the new tree into the slot of the old
+one. every node above stays the same object, so everything outside the group is
+reused. edits that change the parentheses across groups, or the numbering of
+anonymous binders outside the group, fall back to a full parse.
+'''
+
+import bisect
+
+from . import lambex
+from .lambex import TOKENS, RUNS, Token, TokenStream, LexException
+from .parsex import LamPar, ParseException, LamNode, KEYS
+
+class Rebuild(Exception):
+    ...
+
+class Group:
+    __slots__ = ("items", "starts", "width", "lambdas", "anonymous", "base", "node")
+
+    def __init__(self):
+        self.items = []     # tokens as (token_type, value) and Groups
+        self.starts = []    # offset of every item from the start of the group
+        self.width = 0      # characters, parentheses included
+        self.lambdas = 0    # abstractions inside, nested ones included
+        self.anonymous = 0  # anonymous abstractions inside, nested ones included
+        self.base = None    # abstractions before the group when node was parsed
+        self.node = None
+
+    def end(self, i):
+        item = self.items[i]
+        return self.starts[i] + (item.width if item.__class__ is Group else len(item[1]))
+
+    def count(self):
+        '''
+        recount lambdas and anonymous from the items.
+        '''
+        items = self.items
+        lambdas = anonymous = 0
+
+        for i, item in enumerate(items):
+            if item.__class__ is Group:
+                lambdas += item.lambdas
+                anonymous += item.anonymous
+            elif item[0] is TOKENS.T_LAMB:
+                lambdas += 1
+
+                # as parse_abstraction_head decides
+                second = items[i + 2] if i + 2 < len(items) else None
+
+                if second is None or second.__class__ is Group or second[0] is not TOKENS.T_OP:
+                    anonymous += 1
+
+        self.lambdas = lambdas
+        self.anonymous = anonymous
+
+class GroupToken(Token):
+    '''
+    a child group among the tokens its parent is parsed from, punctuation as its "(" is.
+    '''
+
+    __slots__ = ("group",)
+
+    def __init__(self, group, position):
+        super().__init__(TOKENS.T_PUNC, "()", position)
+        self.group = group
+
+class ItemStream(TokenStream):
+    '''
+    the tokens of one group, child groups included as GroupTokens.
+    '''
+
+    def __init__(self, tokens, document, end):
+        self.container = document.text
+        self.scanner = None
+        self.error = None
+        self.buffer = tokens
+        self.pos = 0
+        self.save_pos = []
+        self.document = document
+        self.end = end
+
+    def get_position(self):
+        token = self.peek()
+        return self.document.position(token.position if token is not None else self.end)
+
+class ItemParser(LamPar):
+    def __init__(self, stream, base):
+        self.lamb = stream
+        self.number_of_abstractions = base
+        self.allow_anonymous_abstractions = True
+
+    def parse_variable(self):
+        token = self.lamb.peek()
+
+        if token.__class__ is GroupToken:
+            # its abstractions come before the ones that follow
+            self.number_of_abstractions += token.group.lambdas
+            return self.lamb.advance().group.node
+
+        return super().parse_variable()
+
+def build(tokens, start=0):
+    '''
+    the items of tokens, (token_type, value, offset) with offsets from the group that
+    will hold them, nested into Groups at their parentheses. raises Rebuild when the
+    parentheses do not pair up.
+    '''
+    top = Group()
+    stack = [(top, start)]
+
+    for token_type, value, offset in tokens:
+        group, origin = stack[-1]
+
+        if token_type is TOKENS.T_PUNC:
+            if value == "(":
+                child = Group()
+                group.items.append(child)
+                group.starts.append(offset - origin)
+                stack.append((child, offset))
+                continue
+
+            if len(stack) == 1:
+                raise Rebuild("unmatched )")
+
+            stack.pop()
+            group.width = offset + 1 - origin
+            group.count()
+            continue
+
+        group.items.append((token_type, value))
+        group.starts.append(offset - origin)
+
+    if len(stack) > 1:
+        raise Rebuild("unmatched (")
+
+    return top
+
+class Document:
+    def __init__(self, text=""):
+        self.text = text
+        self.rebuild()
+
+    def position(self, offset):
+        '''
+        (index, line, column) of offset, as tokens carry it.
+        '''
+        line_start = self.text.rfind("\n", 0, offset) + 1
+        return (offset, self.text.count("\n", 0, offset), offset - line_start)
+
+    def rebuild(self):
+        '''
+        parse the whole text. a document whose parentheses do not pair up keeps no
+        groups, it is parsed with LamPar and fully again after every edit.
+        '''
+        self.root = None
+        self.parents = {} # id(node of a group) -> (parent node, key) it hangs from
+        self.tree = None
+        self.error = None
+
+        try:
+            root = build((token_type, value, offset) for token_type, value, offset, _, _ in lambex.scan(self.text))
+        except LexException as le:
+            self.error = "LexException: %s" % le
+            return self.tree
+        except Rebuild:
+            try:
+                self.tree = LamPar(self.text).parse_expression()
+            except (ParseException, LexException, EOFError) as e:
+                self.error = "%s: %s" % (e.__class__.__name__, e)
+            return self.tree
+
+        root.width = len(self.text)
+        root.count()
+        self.root = root
+
+        try:
+            self.parse_groups(root, 0, 0)
+        except (ParseException, EOFError) as e:
+            self.error = "%s: %s" % (e.__class__.__name__, e)
+            return self.tree
+
+        self.tree = root.node
+        return self.tree
+
+    def parse_groups(self, group, base, start):
+        '''
+        parse group, and every group below it that has no tree or whose anonymous
+        binders are numbered from a different base now.
+        '''
+        order = []
+        stack = [(group, base, start, True)]
+
+        while stack:
+            g, b, s, force = stack.pop()
+
+            if not force and g.node is not None and (g.base == b or not g.anonymous):
+                g.base = b
+                continue
+
+            order.append((g, b, s))
+            g.base = b
+
+            if g.node is not None:
+                self.parents.pop(id(g.node), None)
+                g.node = None
+
+            for item, offset in zip(g.items, g.starts):
+                if item.__class__ is Group:
+                    stack.append((item, b, s + offset, False))
+                    b += item.lambdas
+                elif item[0] is TOKENS.T_LAMB:
+                    b += 1
+
+        # children come after their parents in order
+        for g, b, s in reversed(order):
+            self.parse_group(g, b, s)
+
+    def parse_group(self, group, base, start):
+        tokens = []
+        children = set()
+
+        for item, offset in zip(group.items, group.starts):
+            if item.__class__ is Group:
+                tokens.append(GroupToken(item, start + offset))
+                children.add(id(item.node))
+            else:
+                tokens.append(Token(item[0], item[1], start + offset))
+
+        inner = 0 if group is self.root else 1
+        stream = ItemStream(tokens, self, start + group.width - inner)
+        node = ItemParser(stream, base).parse_expression()
+
+        group.node = node
+        group.base = base
+
+        # remember where the trees of the child groups hang now
+        stack = [node] if id(node) not in children else []
+
+        while stack:
+            parent = stack.pop()
+
+            for key in KEYS[parent.node_type]:
+                child = getattr(parent, key)
+
+                if not isinstance(child, LamNode):
+                    continue
+
+                if id(child) in children:
+                    self.parents[id(child)] = (parent, key)
+                else:
+                    stack.append(child)
+
+    def forget(self, group):
+        '''
+        drop the slots of group and everything below it, it left the document.
+        '''
+        stack = [group]
+
+        while stack:
+            g = stack.pop()
+
+            if g.node is not None:
+                self.parents.pop(id(g.node), None)
+
+            stack.extend(item for item in g.items if item.__class__ is Group)
+
+    def edit(self, offset, deleted=0, inserted=""):
+        '''
+        replace deleted characters at offset by inserted and return the new tree, None
+        when the text does not parse, error then says why.
+        '''
+        text = self.text
+
+        if not 0 <= offset <= offset + deleted <= len(text):
+            raise ValueError("edit (%d, %d) outside of the document" % (offset, deleted))
+
+        self.text = text[:offset] + inserted + text[offset + deleted:]
+
+        if self.root is None:
+            return self.rebuild()
+
+        try:
+            self.update(offset, deleted, len(inserted) - deleted)
+        except (Rebuild, LexException):
+            return self.rebuild()
+
+        return self.tree
+
+    def update(self, offset, deleted, delta):
+        end = offset + deleted
+
+        # the smallest group whose interior holds the edit, with the groups above it
+        path = []
+        group, start = self.root, 0
+
+        while True:
+            i = bisect.bisect_right(group.starts, offset - start) - 1
+
+            if i >= 0 and (child := group.items[i]).__class__ is Group:
+                child_start = start + group.starts[i]
+
+                if child_start < offset and end <= child_start + child.width - 1:
+                    path.append((group, start, i))
+                    group, start = child, child_start
+                    continue
+
+            break
+
+        items, starts = group.items, group.starts
+        low, high = offset - start, end - start
+
+        # the items the edit touches, an insertion touches the tokens around it
+        first = bisect.bisect_right(starts, low)
+        last = bisect.bisect_left(starts, high) - 1
+
+        if first and (group.end(first - 1) > low or group.end(first - 1) == low and items[first - 1].__class__ is not Group):
+            first -= 1
+
+        if last + 1 < len(items) and starts[last + 1] == high and items[last + 1].__class__ is not Group:
+            last += 1
+
+        if first <= last:
+            low = min(low, starts[first])
+            high = max(high, group.end(last))
+
+        # and the names and numbers glued to those, the new text may join them
+        while first and items[first - 1].__class__ is not Group and items[first - 1][0] in RUNS and group.end(first - 1) == low:
+            first -= 1
+            low = starts[first]
+
+        while last + 1 < len(items) and items[last + 1].__class__ is not Group and items[last + 1][0] in RUNS and starts[last + 1] == high:
+            last += 1
+            high = group.end(last)
+
+        # re-lex only that run of the new text
+        segment = self.text[start + low:start + high + delta]
+        fresh = build(((token_type, value, low + index) for token_type, value, index, _, _ in lambex.scan(segment)))
+
+        for item in items[first:last + 1]:
+            if item.__class__ is Group:
+                self.forget(item)
+
+        items[first:last + 1] = fresh.items
+        starts[first:last + 1] = fresh.starts
+        after = first + len(fresh.items)
+        starts[after:] = [s + delta for s in starts[after:]]
+
+        group.width += delta
+        lambdas, anonymous = group.lambdas, group.anonymous
+        group.count()
+
+        for parent, _, i in path:
+            parent.width += delta
+            parent.starts[i + 1:] = [s + delta for s in parent.starts[i + 1:]]
+            parent.lambdas += group.lambdas - lambdas
+            parent.anonymous += group.anonymous - anonymous
+
+        if group.lambdas != lambdas and self.root.anonymous > group.anonymous:
+            # anonymous binders after the group would be numbered differently
+            raise Rebuild("numbering")
+
+        old = group.node
+        slot = self.parents.pop(id(old), None) if old is not None else None
+        group.node = None
+
+        try:
+            self.parse_groups(group, group.base, start)
+
+            if old is None:
+                # an earlier error left the groups above without a tree
+                for parent, parent_start, _ in reversed(path):
+                    self.parse_groups(parent, parent.base, parent_start)
+            else:
+                for parent, _, _ in reversed(path):
+                    if parent.node is not old:
+                        break
+                    parent.node = group.node
+
+                if slot is None:
+                    self.tree = group.node
+                else:
+                    setattr(slot[0], slot[1], group.node)
+                    self.parents[id(group.node)] = slot
+        except (ParseException, EOFError) as e:
+            for parent, _, _ in path:
+                if parent.node is not None:
+                    self.parents.pop(id(parent.node), None)
+                    parent.node = None
+
+            self.tree = None
+            self.error = "%s: %s" % (e.__class__.__name__, e)
+            return
+
+        self.tree = self.root.node
+
+        if self.tree is not None:
+            self.error = None
+
+    def node_at(self, offset):
+        '''
+        (node, start, end) of the innermost group around offset, or of the whole document.
+        '''
+        if self.root is None:
+            return (self.tree, 0, len(self.text))
+
+        group, start = self.root, 0
+
+        while True:
+            i = bisect.bisect_right(group.starts, offset - start) - 1
+
+            if i >= 0 and (child := group.items[i]).__class__ is Group and offset < start + group.starts[i] + child.width:
+                group, start = child, start + group.starts[i]
+                continue
+
+            return (group.node, start, start + group.width)
+
+    def tokens(self):
+        '''
+        the tokens of the document with their (index, line, column), without lexing.
+        '''
+        if self.root is None:
+            yield from lambex.tokenize(self.text)
+            return
+
+        text = self.text
+        line, line_start, last = 0, 0, 0
+        stack = [(self.root, 0, 0)]
+
+        while stack:
+            group, start, i = stack.pop()
+
+            if i == 0 and group is not self.root:
+                stack.append((group, start, 1))
+                yield self.token(TOKENS.T_PUNC, "(", start)
+                continue
+
+            index = i - (group is not self.root)
+
+            if index == len(group.items):
+                if group is not self.root:
+                    yield self.token(TOKENS.T_PUNC, ")", start + group.width - 1)
+                continue
+
+            stack.append((group, start, i + 1))
+            item, offset = group.items[index], start + group.starts[index]
+
+            if item.__class__ is Group:
+                stack.append((item, offset, 0))
+            else:
+                yield self.token(item[0], item[1], offset)
+
+    def token(self, token_type, value, offset):
+        return Token(token_type, value, self.position(offset))
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    def parse(text):
+        try:
+            return LamPar(text).parse_expression()
+        except (ParseException, LexException, EOFError):
+            return None
+
+    def random_program(rng, size):
+        parts = []
+        stack = [size]
+
+        while stack:
+            n = stack.pop()
+
+            if isinstance(n, str):
+                parts.append(n)
+            elif n <= 1:
+                parts.append(rng.choice(["x", "y", "z", "f", "1", "2", "ab"]))
+            elif rng.random() < 0.3:
+                parts.append(rng.choice(["λx.", "λy. ", "\\f.", "λ", "λ "]))
+                stack.append(n - 1)
+            else:
+                k = rng.randint(1, n - 1)
+                stack.extend([")", n - k, ") (", k, "("])
+
+        return "".join(parts)
+
+    def test_Document():
+        doc = Document("(λx.x y) (λz.(z w) q)")
+        assert doc.tree == parse(doc.text)
+
+        reused = doc.tree.parameter
+        doc.edit(doc.text.index("y"), 1, "(a b)")
+        assert doc.text == "(λx.x (a b)) (λz.(z w) q)" and doc.tree == parse(doc.text)
+        assert doc.tree.parameter is reused
+
+        doc.edit(2, 0, "x")
+        assert doc.tree == parse(doc.text) and doc.tree.parameter is reused
+
+        doc.edit(0, 0, "(")
+        assert doc.tree is None and doc.error
+        doc.edit(len(doc.text), 0, ")")
+        assert doc.tree == parse(doc.text)
+
+        doc = Document("λ (λ 1 2) 1")
+        doc.edit(0, 0, "λ")
+        assert doc.tree == parse(doc.text)
+
+        node, start, end = Document("a (b (c d))").node_at(6)
+        assert (node.reconstruct(), start, end) == ("(c) d", 5, 10)
+
+        doc = Document("λx.\n(x  y)")
+        assert [(t.value, t.position) for t in doc.tokens()] == [(t.value, t.position) for t in lambex.tokenize(doc.text)]
+
+        return True
+
+    def test_Document_random():
+        rng = random.Random(1)
+        alphabet = ["(", ")", " ", "x", "y", "λ", ".", "λz.", "1", "ab", "(q)"]
+
+        for _ in range(300):
+            doc = Document(random_program(rng, rng.randint(1, 30)))
+            assert doc.tree == parse(doc.text), doc.text
+
+            for _ in range(20):
+                offset = rng.randint(0, len(doc.text))
+                deleted = rng.randint(0, min(3, len(doc.text) - offset))
+                inserted = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 2)))
+                before = doc.text
+
+                doc.edit(offset, deleted, inserted)
+                assert doc.tree == parse(doc.text), (before, offset, deleted, inserted, doc.text)
+                assert [t.value for t in doc.tokens()] == [t.value for t in lambex.tokenize(doc.text)], doc.text
+
+        return True
+
+    def bench_Document():
+        rng = random.Random(2)
+        text = random_program(rng, 25000)
+        doc = Document(text)
+
+        print("document: %d tokens" % len(lambex.tokenize(text)))
+
+        start = time.perf_counter()
+        parse(text)
+        print("full parse      %8.2f ms" % ((time.perf_counter() - start) * 1000))
+
+        times = []
+
+        for _ in range(200):
+            offset = max(doc.text.find("x", rng.randint(0, len(doc.text))), 0)
+            start = time.perf_counter()
+            doc.edit(offset, 1, "y")
+            times.append(time.perf_counter() - start)
+
+        times.sort()
+        print("edit p50 %6.3f ms, p99 %6.3f ms" % (times[len(times) // 2] * 1000, times[int(len(times) * 0.99)] * 1000))
+        assert doc.tree == parse(doc.text)
+
+        return True
+
+    print(test_Document() and test_Document_random())
+    print(bench_Document())
\ No newline at end of file
@@ -8,6 +8,10 @@ tokens:
 
 import string
 import enum
+import re
+from array import array
+
+from . import trace
 
 class TOKENS(enum.Enum):
     T_LAMB = enum.auto()
@@ -19,54 +23,60 @@ class TOKENS(enum.Enum):
 
     @staticmethod
     def get_charset(token_type):
-        if token_type == TOKENS.T_LAMB:
-            return "λ\\"
-
-        if token_type == TOKENS.T_OP:
-            return "."
-
-        if token_type == TOKENS.T_PUNC:
-            return "()"
-
-        if token_type == TOKENS.T_VAR:
-            return string.ascii_letters + string.digits
-
-        if token_type == TOKENS.T_NUM:
-            return string.digits
-        
-        if token_type == TOKENS.T_WHITESPACE:
-            return " \t\r\n"
-
-        return ""
+        return CHARSETS.get(token_type, "")
 
     @staticmethod
     def is_whitespace(letter):
-        return letter in TOKENS.get_charset(TOKENS.T_WHITESPACE)
+        return letter in CHARCLASSES[TOKENS.T_WHITESPACE]
 
     @staticmethod
     def is_lamb(tok):
-        return tok in TOKENS.get_charset(TOKENS.T_LAMB)
+        return tok in CHARCLASSES[TOKENS.T_LAMB]
     
     @staticmethod
     def is_op(tok):
-        return tok in TOKENS.get_charset(TOKENS.T_OP)
+        return tok in CHARCLASSES[TOKENS.T_OP]
     
     @staticmethod
     def is_punc(tok):
-        return tok in TOKENS.get_charset(TOKENS.T_PUNC)
+        return tok in CHARCLASSES[TOKENS.T_PUNC]
     
     @staticmethod
     def is_var(tok):
-        return tok in TOKENS.get_charset(TOKENS.T_VAR)
+        return tok in CHARCLASSES[TOKENS.T_VAR]
 
     @staticmethod
     def is_num(tok):
-        return tok in TOKENS.get_charset(TOKENS.T_NUM)
+        return tok in CHARCLASSES[TOKENS.T_NUM]
+
+CHARSETS = {
+    TOKENS.T_LAMB: "λ\\",
+    TOKENS.T_OP: ".",
+    TOKENS.T_PUNC: "()",
+    TOKENS.T_VAR: string.ascii_letters + string.digits,
+    TOKENS.T_NUM: string.digits,
+    TOKENS.T_WHITESPACE: " \t\r\n",
+}
+
+# lookup tables, built once: the members of every charset, the token type a
+# character starts (digits start numbers, not variables) and the run matchers
+# used for tokens that span several characters.
+CHARCLASSES = {token_type: frozenset(charset) for token_type, charset in CHARSETS.items()}
+
+STARTS = {}
+
+for token_type in (TOKENS.T_VAR, TOKENS.T_NUM, TOKENS.T_LAMB, TOKENS.T_OP, TOKENS.T_PUNC, TOKENS.T_WHITESPACE):
+    STARTS.update(dict.fromkeys(CHARSETS[token_type], token_type))
+
+RUNS = {token_type: re.compile("[%s]+" % re.escape(CHARSETS[token_type])) for token_type in (TOKENS.T_VAR, TOKENS.T_NUM, TOKENS.T_WHITESPACE)}
 
 class Token:
-    def __init__(self, token_type, value):
+    __slots__ = ("token_type", "value", "position")
+
+    def __init__(self, token_type, value, position=None):
         self.token_type = token_type
         self.value = value
+        self.position = position # (index, line, column) of the first character, when known
 
     def __eq__(self, other):
         if not isinstance(other, Token):
@@ -122,7 +132,186 @@ class LanguageStream:
 class LexException(Exception):
     ...
 
+class TokenArray:
+    '''
+    column-oriented token storage, one compact array per field.
+    indexing materializes a Token carrying its (index, line, column).
+    '''
+
+    def __init__(self):
+        self.types = array("B")
+        self.offsets = array("L")
+        self.lines = array("L")
+        self.columns = array("L")
+        self.values = []
+
+    def append(self, token_type, value, offset, line, column):
+        self.types.append(token_type.value)
+        self.offsets.append(offset)
+        self.lines.append(line)
+        self.columns.append(column)
+        self.values.append(value)
+
+    def position(self, i):
+        return (self.offsets[i], self.lines[i], self.columns[i])
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return Token(TOKENS(self.types[i]), self.values[i], self.position(i))
+
+    def __iter__(self):
+        for i in range(len(self.values)):
+            yield self[i]
+
+def scan(program):
+    '''
+    single pass over program, yields (token_type, value, index, line, column) per token.
+    '''
+    starts = STARTS
+    runs = RUNS
+    whitespace = TOKENS.T_WHITESPACE
+    interned = {}
+
+    pos = 0
+    end = len(program)
+    line = 0
+    line_start = 0
+
+    while pos < end:
+        curr = program[pos]
+        token_type = starts.get(curr)
+
+        if token_type is None:
+            raise LexException("Could not lex \"%s\" at (index, line, column): %s" % (curr, (pos, line, pos - line_start)))
+
+        if token_type is whitespace:
+            run_end = runs[whitespace].match(program, pos).end()
+
+            if (newlines := program.count("\n", pos, run_end)):
+                line += newlines
+                line_start = program.rindex("\n", pos, run_end) + 1
+
+            pos = run_end
+            continue
+
+        if token_type in runs:
+            run_end = runs[token_type].match(program, pos).end()
+            value = program[pos:run_end]
+            value = interned.setdefault(value, value)
+        else:
+            run_end = pos + 1
+            value = curr
+
+        yield token_type, value, pos, line, pos - line_start
+
+        pos = run_end
+
+@trace.traced("lex", lambda tracer, tokens: tracer.count("tokens", len(tokens)))
+def tokenize(program):
+    '''
+    lex the whole program up front into a TokenArray.
+    '''
+    tokens = TokenArray()
+    append = tokens.append
+
+    for token in scan(program):
+        append(*token)
+
+    return tokens
+
+class TokenStream:
+    '''
+    buffered token source for the parser: tokens are pulled from scan() on demand and
+    kept, so every token is lexed exactly once and peek(n), advance() and mark()/reset()
+    only move an index around.
+    '''
+
+    def __init__(self, program):
+        self.container = program
+        self.scanner = scan(program)
+        self.error = None
+        self.buffer = []
+        self.pos = 0
+        self.save_pos = []
+
+    def fill(self, n):
+        buffer = self.buffer
+
+        while len(buffer) < n and self.scanner is not None:
+            try:
+                token_type, value, *position = next(self.scanner)
+            except StopIteration:
+                self.scanner = None
+                break
+            except LexException as le:
+                self.scanner = None
+                self.error = le
+                break
+
+            buffer.append(Token(token_type, value, tuple(position)))
+        
+        if len(buffer) < n and self.error is not None:
+            raise self.error
+
+        return len(buffer) >= n
+
+    def peek(self, n=1):
+        i = self.pos + n - 1
+
+        if i < len(self.buffer) or self.fill(i + 1):
+            return self.buffer[i]
+
+        return None
+
+    def advance(self):
+        token = self.peek()
+
+        if token is None:
+            raise EOFError(self.get_position())
+
+        self.pos += 1
+        return token
+
+    def mark(self):
+        self.save_pos.append(self.pos)
+
+    def reset(self):
+        self.pos = self.save_pos.pop()
+
+    def release(self):
+        self.save_pos.pop()
+
+    def has_token(self):
+        return self.peek() is not None
+
+    def has_n_tokens_available(self, n):
+        return self.peek(n) is not None
+
+    def get_position(self):
+        if (token := self.peek()) is not None:
+            return token.position
+
+        end = len(self.container)
+        return (end, self.container.count("\n"), end - (self.container.rfind("\n") + 1))
+
+    next_token = advance
+    peek_token = peek
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.has_token():
+            return self.advance()
+
+        raise StopIteration
+
 class LambEx(LanguageStream):
+    def tokenize(self):
+        return tokenize(self.container)
+
     def read_multitoken(self, allowed_variable_charset):
         token = ""
 
@@ -222,7 +411,8 @@ if __name__ == "__main__":
             pass
         
         assert l.first() == " "
-        assert l.get_position() == (len("this is\nan "), 1, 2), l.get_position()
+        # the column of the next character, "e", as tokenize gives the columns of tokens
+        assert l.get_position() == (len("this is\nan "), 1, len("an ")), l.get_position()
 
         while l.first() != "!":
             pass
@@ -248,5 +438,73 @@ if __name__ == "__main__":
 
         return True
     
+    def test_tokenize():
+        programs = ["(\\x.λy.x) fo456obar 5672", "λλλ 3 1 (2 1)", "λx . x\tλy. y\r\n", "(λm.λn.m (λn.λf.λx.f (n f x)) n)\n  12ab\n\n (x)"]
+
+        for program in programs:
+            assert list(tokenize(program)) == list(LambEx(program)), program
+
+        tokens = tokenize("(λx.x)\n  yz 12")
+
+        assert tokens.position(0) == (0, 0, 0)
+        assert tokens[6] == Token(TOKENS.T_VAR, "yz") and tokens[6].position == (9, 1, 2)
+        assert tokens[7] == Token(TOKENS.T_NUM, "12") and tokens[7].position == (12, 1, 5)
+
+        try:
+            tokenize("x ? y")
+        except LexException:
+            pass
+        else:
+            assert False
+
+        return True
+
+    def bench_tokenize():
+        import timeit
+
+        term = "(λm.λn.λf.λx.m f (n f x)) (\\f.\\x.f (f x))\n"
+
+        for size in (20, 80, 320):
+            program = term * size
+            count = len(tokenize(program))
+
+            legacy = min(timeit.repeat(lambda: list(LambEx(program)), number=1, repeat=3))
+            table = min(timeit.repeat(lambda: tokenize(program), number=1, repeat=3))
+
+            print("%7d chars, %6d tokens: LambEx %9.0f tokens/s, tokenize %9.0f tokens/s (%.0fx)" % (len(program), count, count / legacy, count / table, legacy / table))
+
+        return True
+
+    def test_TokenStream():
+        stream = TokenStream("(\\x.λy.x) fo456obar 5672")
+
+        assert stream.peek(3) == Token(TOKENS.T_VAR, "x")
+        assert len(stream.buffer) == 3
+
+        stream.mark()
+        assert [stream.advance().value for _ in range(4)] == ["(", "\\", "x", "."]
+        stream.reset()
+
+        assert list(stream) == list(LambEx("(\\x.λy.x) fo456obar 5672"))
+        assert stream.peek() is None and not stream.has_token()
+        assert stream.get_position() == (24, 0, 24)
+
+        stream = TokenStream("x ? y")
+
+        assert stream.advance() == Token(TOKENS.T_VAR, "x")
+
+        for _ in range(2):
+            try:
+                stream.peek()
+            except LexException:
+                pass
+            else:
+                assert False
+
+        return True
+
+    print(test_tokenize())
+    print(test_TokenStream())
+    print(bench_tokenize())
     print(test_LanguageStream())
     print(test_LambEx())
\ No newline at end of file
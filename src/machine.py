@@ -0,0 +1,428 @@
+'''
+Krivine machine: call-by-name evaluation with closures and environments instead of
+substitution, terms are never copied.
+
+    closure      (term, env)
+    environment  linked pairs (closure, rest) with the closure for index 0 in front
+    stack        argument closures of the applications passed on the way down
+
+a term is evaluated to weak head normal form, then read back: under a lambda the
+machine continues with a neutral variable for the binder (a closure whose term is
+None and whose env is the binder's level), the arguments of a neutral head are read
+back one after another. evaluation and readback share one flat loop driven by a
+task stack, so nothing recurses in Python.
+
+call-by-name evaluates an argument again every time its variable is reached, so
+(λx. x x x) M reduces M three times. LazyKrivine is the call-by-need variant: an
+argument becomes a Thunk shared by every environment it is put in. the first time
+it is reached an Update marker goes on the stack, and when its weak head normal
+form shows up (a lambda with the marker on top, or a neutral term) the thunk is
+overwritten in place, later uses continue from the value.
+'''
+
+import time
+
+from .parsex import LamNode
+from .debruijn import Index, Abs, Apply, to_debruijn
+from . import trace
+from .reduction import Reduction, report
+
+# readback tasks
+EVAL      = 0 # (EVAL, term, env, depth)
+BUILD_ABS = 1 # (BUILD_ABS, hint)
+BUILD_APP = 2 # (BUILD_APP, head, number of arguments)
+FORCE     = 3 # (FORCE, thunk, depth), LazyKrivine only
+
+class Krivine:
+    def __init__(self, max_steps=None, timeout=None):
+        self.max_steps = max_steps
+        self.timeout = timeout
+
+    @trace.traced("reduce", report)
+    def run(self, term):
+        '''
+        normalize term, the returned Reduction has no term when a budget ran out.
+        '''
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        max_steps = self.max_steps
+        start = time.perf_counter()
+        deadline = start + self.timeout if self.timeout is not None else None
+        steps = 0
+        allocations = 0
+
+        results = []
+        tasks = [(EVAL, term, None, 0)]
+
+        while tasks:
+            task = tasks.pop()
+
+            if task[0] == BUILD_ABS:
+                results.append(Abs(results.pop(), task[1]))
+                continue
+
+            if task[0] == BUILD_APP:
+                head, n = task[1], task[2]
+                args = results[len(results) - n:]
+                del results[len(results) - n:]
+
+                for arg in args:
+                    head = Apply(head, arg)
+
+                results.append(head)
+                continue
+
+            _, term, env, depth = task
+            stack = []
+
+            while True:
+                cls = term.__class__
+
+                if cls is Apply:
+                    arg = term.arg
+
+                    if arg.__class__ is Index:
+                        # pass on the closure the variable stands for, wrapping it
+                        # again would make chains of lookups that only get longer
+                        i = arg.index
+                        bound = env
+
+                        while i and bound is not None:
+                            bound = bound[1]
+                            i -= 1
+
+                        if bound is not None and bound[0][0] is not None:
+                            stack.append(bound[0])
+                            term = term.func
+                            continue
+
+                    stack.append((arg, env))
+                    term = term.func
+                    allocations += 1
+                elif cls is Abs:
+                    if not stack:
+                        tasks.append((BUILD_ABS, term.hint))
+                        tasks.append((EVAL, term.body, ((None, depth), env), depth + 1))
+                        allocations += 2
+                        break
+
+                    env = (stack.pop(), env)
+                    term = term.body
+                    steps += 1
+                    allocations += 1
+
+                    if max_steps is not None and steps > max_steps:
+                        return Reduction(None, steps - 1, False, time.perf_counter() - start, "steps", allocations)
+
+                    if deadline is not None and not steps & 255 and time.perf_counter() > deadline:
+                        return Reduction(None, steps, False, time.perf_counter() - start, "timeout", allocations)
+                elif cls is Index:
+                    i = term.index
+
+                    while i and env is not None:
+                        env = env[1]
+                        i -= 1
+
+                    if env is None:
+                        head = Index(i + depth)
+                    elif env[0][0] is None:
+                        head = Index(depth - env[0][1] - 1)
+                    else:
+                        term, env = env[0]
+                        continue
+
+                    self.spine(tasks, head, stack, depth)
+                    break
+                else:
+                    self.spine(tasks, term, stack, depth)
+                    break
+
+        return Reduction(results[0], steps, True, time.perf_counter() - start, allocations=allocations)
+
+    @staticmethod
+    def spine(tasks, head, stack, depth):
+        '''
+        schedule the readback of a neutral head applied to the closures on stack.
+        '''
+        tasks.append((BUILD_APP, head, len(stack)))
+
+        # the innermost argument is on top of stack and must be read back first
+        for arg_term, arg_env in stack:
+            tasks.append((EVAL, arg_term, arg_env, depth))
+
+class Thunk:
+    '''
+    a shared argument. before it is forced args is None and (term, env) the suspended
+    closure, afterwards it holds its weak head normal form: either a lambda closure
+    (term, env) with args == (), or a neutral head applied to the thunks in args. a
+    head is a binder level (int, negative for indices pointing out of the input) or a
+    Free term.
+    '''
+
+    __slots__ = ("term", "env", "head", "args")
+
+    def __init__(self, term, env, head=None, args=None):
+        self.term = term
+        self.env = env
+        self.head = head
+        self.args = args
+
+class Update:
+    __slots__ = ("thunk",)
+
+    def __init__(self, thunk):
+        self.thunk = thunk
+
+class LazyKrivine(Krivine):
+    @trace.traced("reduce", report)
+    def run(self, term):
+        '''
+        normalize term call-by-need, the returned Reduction has no term when a budget ran
+        out. allocations counts thunks and environment cells.
+        '''
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        max_steps = self.max_steps
+        start = time.perf_counter()
+        deadline = start + self.timeout if self.timeout is not None else None
+        steps = 0
+        allocations = 0
+
+        results = []
+        tasks = [(EVAL, term, None, 0)]
+
+        while tasks:
+            task = tasks.pop()
+            stack = []
+
+            if task[0] == BUILD_ABS:
+                results.append(Abs(results.pop(), task[1]))
+                continue
+
+            if task[0] == BUILD_APP:
+                head, n = task[1], task[2]
+                args = results[len(results) - n:]
+                del results[len(results) - n:]
+
+                for arg in args:
+                    head = Apply(head, arg)
+
+                results.append(head)
+                continue
+
+            if task[0] == FORCE:
+                _, thunk, depth = task
+
+                if thunk.head is not None:
+                    self.spine(tasks, thunk.head, thunk.args, depth)
+                    continue
+
+                if thunk.args is None:
+                    stack.append(Update(thunk))
+
+                term, env = thunk.term, thunk.env
+            else:
+                _, term, env, depth = task
+
+            while True:
+                cls = term.__class__
+
+                if cls is Apply:
+                    stack.append(Thunk(term.arg, env))
+                    term = term.func
+                    allocations += 1
+                elif cls is Abs:
+                    while stack and stack[-1].__class__ is Update:
+                        thunk = stack.pop().thunk
+                        thunk.term, thunk.env, thunk.args = term, env, ()
+
+                    if not stack:
+                        tasks.append((BUILD_ABS, term.hint))
+                        tasks.append((EVAL, term.body, (Thunk(None, None, depth, ()), env), depth + 1))
+                        allocations += 2
+                        break
+
+                    env = (stack.pop(), env)
+                    term = term.body
+                    steps += 1
+                    allocations += 1
+
+                    if max_steps is not None and steps > max_steps:
+                        return Reduction(None, steps - 1, False, time.perf_counter() - start, "steps", allocations)
+
+                    if deadline is not None and not steps & 255 and time.perf_counter() > deadline:
+                        return Reduction(None, steps, False, time.perf_counter() - start, "timeout", allocations)
+                elif cls is Index:
+                    i = term.index
+
+                    while i and env is not None:
+                        env = env[1]
+                        i -= 1
+
+                    if env is None:
+                        self.neutral(tasks, -i - 1, (), stack, depth)
+                        break
+
+                    thunk = env[0]
+
+                    if thunk.head is not None:
+                        self.neutral(tasks, thunk.head, thunk.args, stack, depth)
+                        break
+
+                    if thunk.args is None:
+                        stack.append(Update(thunk))
+
+                    term, env = thunk.term, thunk.env
+                else:
+                    self.neutral(tasks, term, (), stack, depth)
+                    break
+
+        return Reduction(results[0], steps, True, time.perf_counter() - start, allocations=allocations)
+
+    @staticmethod
+    def neutral(tasks, head, args, stack, depth):
+        '''
+        head applied to args and then to the thunks on stack is in weak head normal
+        form: update the thunks marked on the way and schedule the readback.
+        '''
+        args = list(args)
+
+        while stack:
+            entry = stack.pop()
+
+            if entry.__class__ is Update:
+                thunk = entry.thunk
+                thunk.term = thunk.env = None
+                thunk.head, thunk.args = head, tuple(args)
+            else:
+                args.append(entry)
+
+        LazyKrivine.spine(tasks, head, args, depth)
+
+    @staticmethod
+    def spine(tasks, head, args, depth):
+        '''
+        schedule the readback of head applied to the thunks in args, in order.
+        '''
+        tasks.append((BUILD_APP, Index(depth - head - 1) if head.__class__ is int else head, len(args)))
+
+        for arg in reversed(args):
+            tasks.append((FORCE, arg, depth))
+
+def evaluate(tree, max_steps=None, timeout=None, lazy=False):
+    return (LazyKrivine if lazy else Krivine)(max_steps, timeout).run(tree)
+
+if __name__ == "__main__":
+    from .parsex import LamPar
+    from .tools import convert_church
+    from .reduction import normalize
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse()))
+
+    def test_Krivine():
+        programs = [
+            "(λx.x) y",
+            "(λm.λn.λf.λx.m f (n f x)) 2 3",
+            "(λx.λy.y) ((λx.x x) (λx.x x)) z",
+            "λx.(λy.λz.y z) x",
+            "(λx.λy.x y) y",
+            "λλ 2 ((λ 1) 1)",
+            "(λf.f (f a)) (λx.λy.x y)",
+        ]
+
+        for program in programs:
+            result = evaluate(parse(program))
+            assert result.normal and result.term == normalize(parse(program)).term, program
+
+        assert evaluate(parse("(λx.λy.x y) y")).tree.reconstruct() == "λx0.(y) x0"
+
+        result = evaluate(parse("(λx.x x) (λx.x x)"), max_steps=1000)
+        assert not result.normal and result.reason == "steps" and result.term is None
+
+        result = evaluate(parse("(λx.x x) (λx.x x)"), timeout=0.05)
+        assert result.reason == "timeout"
+
+        assert evaluate(parse("(λm.λn.λf.m (n f)) 200 200")).term == parse("40000")
+
+        return True
+
+    def test_LazyKrivine():
+        programs = [
+            "(λx.x) y",
+            "(λm.λn.λf.λx.m f (n f x)) 2 3",
+            "(λx.λy.y) ((λx.x x) (λx.x x)) z",
+            "λx.(λy.λz.y z) x",
+            "(λx.λy.x y) y",
+            "λλ 2 ((λ 1) 1)",
+            "(λf.f (f a)) (λx.λy.x y)",
+            "(λx.x x x) ((λy.y) z)",
+            "(λx.x (x a)) ((λy.y) (λz.z))",
+            "(λm.λn.n m) 2 3",
+            "(λx. x 2) λ 3",
+        ]
+
+        for program in programs:
+            result = evaluate(parse(program), lazy=True)
+            assert result.normal and result.term == normalize(parse(program)).term, program
+
+        assert evaluate(parse("(λx.λy.x y) y"), lazy=True).tree.reconstruct() == "λx0.(y) x0"
+
+        # the argument is reduced once and shared by all three uses
+        assert evaluate(parse("(λx.x x x) ((λy.y) (λz.z))"), lazy=True).steps == 4
+        assert evaluate(parse("(λx.x x x) ((λy.y) (λz.z))")).steps == 6
+        assert evaluate(parse(duplicating(14)), lazy=True).steps == 29
+
+        result = evaluate(parse("(λx.x x) (λx.x x)"), max_steps=1000, lazy=True)
+        assert not result.normal and result.reason == "steps" and result.term is None
+
+        result = evaluate(parse("(λx.x x) (λx.x x)"), timeout=0.05, lazy=True)
+        assert result.reason == "timeout"
+
+        assert evaluate(parse("(λm.λn.λf.m (n f)) 200 200"), lazy=True).term == parse("40000")
+
+        return True
+
+    def bench_Krivine():
+        for program in ["(λm.λn.λf.m (n f)) 100 100 (λb.b) x", "(λm.λn.n m) 3 5 (λb.b) x"]:
+            for name, run in [("zipper", normalize), ("Krivine", evaluate)]:
+                result = run(parse(program))
+                print("%-12s %6d steps, %9.0f steps/s" % (name, result.steps, result.steps / result.elapsed))
+
+        return True
+
+    def duplicating(k):
+        '''
+        x_k where x_i = x_i-1 x_i-1 and x_0 = λz.z: 2^k uses of x_0 by name, k by need.
+        '''
+        program = "x%d" % k
+
+        for i in range(k, 0, -1):
+            program = "(λx%d.%s) (x%d x%d)" % (i, program, i - 1, i - 1)
+
+        return "(λx0.%s) (λz.z)" % program
+
+    def bench_sharing():
+        redex = "((λm.λn.λf.m (n f)) 30 30 (λb.b) (λz.z))"
+        programs = [
+            "(λx.x x x) %s" % redex,
+            "(λx.x (x (x (x y)))) %s" % redex,
+            "(λm.λn.n m) 2 3 (λb.b) (λz.z)",
+            duplicating(14),
+        ]
+
+        for program in programs:
+            print(program)
+
+            for name, run in [("zipper", normalize), ("by name", evaluate), ("by need", lambda term: evaluate(term, lazy=True))]:
+                result = run(parse(program))
+                allocations = "-" if result.allocations is None else result.allocations
+                print("    %-12s %8d steps, %8s allocations, %8.2f ms" % (name, result.steps, allocations, result.elapsed * 1000))
+
+        return True
+
+    print(test_Krivine() and test_LazyKrivine())
+    print(bench_Krivine())
+    print(bench_sharing())
\ No newline at end of file
@@ -0,0 +1,255 @@
+'''
+normalization by evaluation.
+
+a de Bruijn term is first compiled into Python closures, code(env) -> value, once.
+values are native Python functions for lambdas, their argument is a Thunk, so
+evaluation is lazy (call-by-need), or Neutral terms, a free variable or the level of
+a binder applied to a spine of thunks. applying a value is an ordinary Python call,
+which is where the work of substitute goes.
+
+quote reads a value back: a function is applied to a fresh neutral variable and its
+result quoted under one more binder, a neutral is quoted head first and then its
+arguments. binders come back without names, from_debruijn gives them fresh ones.
+'''
+
+import time
+
+from .parsex import LamNode
+from .debruijn import Index, Free, Abs, Apply, to_debruijn
+from . import trace
+from .reduction import Reduction, report
+
+class OutOfFuel(Exception):
+    ...
+
+class Thunk:
+    __slots__ = ("code", "env", "value")
+
+    def __init__(self, code, env, value=None):
+        self.code = code
+        self.env = env
+        self.value = value
+
+    def force(self):
+        if self.code is not None:
+            self.value = self.code(self.env)
+            self.code = self.env = None
+
+        return self.value
+
+class Neutral:
+    '''
+    head applied to arguments: head is a binder level (int) or a Free term, the spine
+    is linked through func.
+    '''
+
+    __slots__ = ("head", "func", "arg")
+
+    def __init__(self, head, func=None, arg=None):
+        self.head = head
+        self.func = func
+        self.arg = arg
+
+    def __call__(self, arg):
+        return Neutral(self.head, self, arg)
+
+def lookup(index):
+    if index == 0:
+        return lambda env: env[0].force()
+
+    if index == 1:
+        return lambda env: env[1][0].force()
+
+    def code(env):
+        for _ in range(index):
+            env = env[1]
+        return env[0].force()
+
+    return code
+
+def constant(value):
+    return lambda env: value
+
+def application(func, arg):
+    return lambda env: func(env)(Thunk(arg, env))
+
+class NbE:
+    def __init__(self, fuel=None, timeout=None):
+        self.fuel = fuel
+        self.timeout = timeout
+
+    def compile(self, term, tick):
+        '''
+        turn term into code(env) -> value, every lambda calls tick when applied.
+        '''
+        results = []
+        stack = [(term, False)]
+
+        while stack:
+            term, done = stack.pop()
+            cls = term.__class__
+
+            if cls is Index:
+                results.append(lookup(term.index))
+            elif cls is Free:
+                results.append(constant(Neutral(term)))
+            elif cls is Abs:
+                if done:
+                    results.append(self.abstraction(results.pop(), tick))
+                else:
+                    stack.append((term, True))
+                    stack.append((term.body, False))
+            elif done:
+                arg = results.pop()
+                results.append(application(results.pop(), arg))
+            else:
+                stack.append((term, True))
+                stack.append((term.arg, False))
+                stack.append((term.func, False))
+
+        return results[0]
+
+    @staticmethod
+    def abstraction(body, tick):
+        def code(env):
+            def closure(arg):
+                tick()
+                return body((arg, env))
+
+            return closure
+
+        return code
+
+    @staticmethod
+    def quote(value):
+        '''
+        read a value back into a de Bruijn term, without recursion.
+        '''
+        results = []
+        tasks = [(value, 0, None)]
+
+        while tasks:
+            value, depth, build = tasks.pop()
+
+            if build is not None:
+                if build == -1:
+                    results.append(Abs(results.pop()))
+                else:
+                    head = value
+                    args = results[len(results) - build:]
+                    del results[len(results) - build:]
+
+                    for arg in args:
+                        head = Apply(head, arg)
+
+                    results.append(head)
+                continue
+
+            if isinstance(value, Thunk):
+                value = value.force()
+
+            if value.__class__ is not Neutral:
+                tasks.append((None, depth, -1))
+                tasks.append((value(Thunk(None, None, Neutral(depth))), depth + 1, None))
+                continue
+
+            args = []
+
+            while value.func is not None:
+                args.append(value.arg)
+                value = value.func
+
+            head = value.head
+            head = Index(depth - head - 1) if head.__class__ is int else head
+
+            tasks.append((head, depth, len(args)))
+
+            for arg in args:
+                tasks.append((arg, depth, None))
+
+        return results[0]
+
+    @trace.traced("reduce", report)
+    def run(self, term):
+        '''
+        normalize term, the returned Reduction has no term when fuel or time ran out.
+        steps counts applied lambdas, including the ones quote applies to fresh variables;
+        terms that need deeper Python nesting than the recursion limit stop with "depth".
+        '''
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        start = time.perf_counter()
+        fuel = self.fuel
+        deadline = start + self.timeout if self.timeout is not None else None
+        steps = 0
+
+        def tick():
+            nonlocal steps
+            steps += 1
+
+            if fuel is not None and steps > fuel:
+                raise OutOfFuel("fuel")
+
+            if deadline is not None and not steps & 1023 and time.perf_counter() > deadline:
+                raise OutOfFuel("timeout")
+
+        try:
+            value = self.compile(term, tick)(None)
+            result = self.quote(value)
+        except OutOfFuel as oof:
+            return Reduction(None, min(steps, fuel) if fuel is not None else steps, False, time.perf_counter() - start, str(oof))
+        except RecursionError:
+            return Reduction(None, steps, False, time.perf_counter() - start, "depth")
+
+        return Reduction(result, steps, True, time.perf_counter() - start)
+
+def normalize(tree, fuel=None, timeout=None):
+    return NbE(fuel, timeout).run(tree)
+
+if __name__ == "__main__":
+    from .parsex import LamPar
+    from .tools import convert_church
+    from . import reduction, machine
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse()))
+
+    def test_NbE():
+        programs = [
+            "(λx.x) y",
+            "(λm.λn.λf.λx.m f (n f x)) 2 3",
+            "(λx.λy.y) ((λx.x x) (λx.x x)) z",
+            "λx.(λy.λz.y z) x",
+            "(λx.λy.x y) y",
+            "λλ 2 ((λ 1) 1)",
+            "(λf.f (f a)) (λx.λy.x y)",
+            "(λm.λn.n m) 2 3",
+        ]
+
+        for program in programs:
+            result = normalize(parse(program))
+            assert result.normal and result.term == reduction.normalize(parse(program)).term, program
+
+        assert normalize(parse("(λx.λy.x y) y")).tree.reconstruct() == "λx0.(y) x0"
+
+        result = normalize(parse("(λx.x x) (λx.x x)"), fuel=100)
+        assert not result.normal and result.reason == "fuel" and result.steps == 100
+
+        result = normalize(parse("(λx.x x) (λx.x x)"), timeout=0.05)
+        assert result.reason in ("timeout", "depth")
+
+        assert normalize(parse("(λm.λn.λf.m (n f)) 200 200")).term == parse("40000")
+
+        return True
+
+    def bench_NbE():
+        for program in ["(λm.λn.λf.m (n f)) 100 100 (λb.b) x", "(λm.λn.n m) 3 5 (λb.b) x", "(λm.λn.n m) 2 10"]:
+            for name, run in [("zipper", reduction.normalize), ("Krivine", machine.evaluate), ("NbE", normalize)]:
+                result = run(parse(program))
+                print("%-12s %7d steps, %8.2f ms" % (name, result.steps, result.elapsed * 1000))
+
+        return True
+
+    print(test_NbE())
+    print(bench_NbE())
\ No newline at end of file
@@ -0,0 +1,252 @@
+'''
+parallel normalization of wide terms over a process pool.
+
+normal order reduces a term to its head normal form λx1..xn. h M1..Mk first and
+then M1 to Mk one after the other, and nothing in one argument depends on another.
+so the root is head reduced here, and every argument is head reduced here for at
+most threshold steps. an argument that needs more goes to a worker process as far
+as it got, in the binary format, which is compact and has no recursion limit. the
+others are taken apart the same way, their own costly arguments go out too. how
+big a term is says little about the work in it, a small redex can have a big
+normal form, so the steps taken are what decides. the normal forms are stitched
+back under the head in order, the result and the number of steps are exactly those
+of reduction.normalize, normal order continues from where the probe stopped.
+
+budgets are shared: every worker gets what is left of them when its argument is
+sent, and a run that goes over them ends with no term, as Cache.normalize does.
+'''
+
+import concurrent.futures
+import os
+import time
+
+from . import trace
+from . import binary
+from .parsex import LamNode
+from .debruijn import Abs, Apply, to_debruijn
+from .reduction import STRATEGIES, Reducer, Reduction, report, normalize
+
+THRESHOLD = 1000 # steps an argument may take here before it goes to a worker
+
+def reduce_remote(data, max_steps, timeout):
+    '''
+    normalize the term in data in a worker, (data of the normal form or None, steps, reason).
+    '''
+    result = normalize(binary.loads(data), max_steps=max_steps, timeout=timeout)
+    return binary.dumps(result.term) if result.normal else None, result.steps, result.reason
+
+class ParallelReducer:
+    '''
+    normal order reduction with the costly arguments of head normal forms reduced by
+    workers processes (one per core by default), or by a pool that is passed in.
+    while tracing, the arguments sent are counted as "offloaded".
+    '''
+
+    def __init__(self, workers=None, threshold=THRESHOLD, max_steps=None, timeout=None, pool=None):
+        self.threshold = threshold
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.own = pool is None
+        self.pool = pool if pool is not None else concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count() or 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.own:
+            self.pool.shutdown(cancel_futures=True)
+
+    @trace.traced("reduce", report)
+    def run(self, term):
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        max_steps = self.max_steps
+        start = time.perf_counter()
+        deadline = start + self.timeout if self.timeout is not None else None
+        steps = 0
+
+        # post-order plan: normal forms, futures of normal forms and heads to build
+        plan = []
+        futures = []
+        tasks = [(term, None, False)] # the root is never sent, it is what is taken apart
+
+        def fail(reason):
+            for future in futures:
+                future.cancel()
+
+            return Reduction(None, steps, False, time.perf_counter() - start, reason)
+
+        while tasks:
+            term, build, probe = tasks.pop()
+
+            if build is not None:
+                plan.append(build)
+                continue
+
+            remaining = max_steps - steps if max_steps is not None else None
+            budget = remaining
+
+            if probe and (remaining is None or remaining > self.threshold):
+                budget = self.threshold
+
+            left = deadline - time.perf_counter() if deadline is not None else None
+            head = Reducer(STRATEGIES.HEAD, budget, left).run(term)
+            steps += head.steps
+
+            if not head.normal:
+                if head.reason != "steps" or budget == remaining:
+                    return fail(head.reason)
+
+                # too much work for here, the worker goes on from where the probe stopped
+                remaining = max_steps - steps if max_steps is not None else None
+                left = deadline - time.perf_counter() if deadline is not None else None
+                future = self.pool.submit(reduce_remote, binary.dumps(head.term), remaining, left)
+                futures.append(future)
+                plan.append(future)
+
+                if trace.sink is not None:
+                    trace.sink.count("offloaded")
+
+                continue
+
+            hnf = head.term
+            hints = []
+
+            while hnf.__class__ is Abs:
+                hints.append(hnf.hint)
+                hnf = hnf.body
+
+            args = []
+
+            while hnf.__class__ is Apply:
+                args.append(hnf.arg)
+                hnf = hnf.func
+
+            if not args:
+                plan.append(head.term)
+                continue
+
+            tasks.append((None, (hints, hnf, len(args)), False))
+
+            # args are innermost first, the first argument is planned first
+            tasks.extend((arg, None, True) for arg in args)
+
+        results = []
+
+        for item in plan:
+            if item.__class__ is tuple:
+                hints, head, n = item
+                args = results[len(results) - n:]
+                del results[len(results) - n:]
+
+                for arg in args:
+                    head = Apply(head, arg)
+
+                for hint in reversed(hints):
+                    head = Abs(head, hint)
+
+                results.append(head)
+            elif isinstance(item, concurrent.futures.Future):
+                data, taken, reason = item.result()
+                steps += taken
+
+                if data is None:
+                    return fail(reason)
+
+                results.append(binary.loads(data))
+            else:
+                results.append(item)
+
+        if max_steps is not None and steps > max_steps:
+            return fail("steps")
+
+        if deadline is not None and time.perf_counter() > deadline:
+            return fail("timeout")
+
+        return Reduction(results[0], steps, True, time.perf_counter() - start)
+
+def normalize_parallel(term, workers=None, threshold=THRESHOLD, max_steps=None, timeout=None):
+    with ParallelReducer(workers, threshold, max_steps, timeout) as reducer:
+        return reducer.run(term)
+
+if __name__ == "__main__":
+    from .parsex import LamPar
+    from .tools import convert_church
+
+    # run as a script this file is __main__, the workers need the package's copy
+    from . import parallel
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse_expression()))
+
+    def wide(n, size):
+        '''
+        f applied to n products of Church numerals, every one about size steps of work.
+        '''
+        args = " ".join("((λm.λn.λf.m (n f)) %d %d)" % (size, size + i) for i in range(n))
+        return parse("(λg.λf.g f) (λf.f %s)" % args)
+
+    PARITY = "(λn.n (λb.λx.λy.b y x) (λx.λy.x))"
+
+    def test_ParallelReducer():
+        with parallel.ParallelReducer(workers=2, threshold=50) as reducer:
+            for term, offloaded in [
+                (wide(6, 10), 0), # products of numerals come apart in cheap pieces
+                (parse("λf.f %s" % " ".join("(%s ((λm.λn.λf.m (n f)) 8 %d))" % (PARITY, 8 + i) for i in range(8))), 8),
+                (parse("λx.x ((λm.λn.λf.m (n f)) 3 4) (λy.(λz.z z) y ((λm.λn.λf.m (n f)) 5 5))"), 0),
+                (parse("(λx.x) y"), 0),
+                (parse("λf.f 60 ((λx.λy.y x) 70 f)"), 0),
+                # big and cheap arguments stay, small and costly ones go
+                (parse("(λg.g) (λf.f %s)" % " ".join(["(λx.x) 300"] * 8)), 0),
+                (parse("λf.f (λx.x (%s ((λm.λn.λf.m (n f)) 10 11)))" % PARITY), 1),
+            ]:
+                expected = normalize(term)
+
+                with trace.tracing() as tracer:
+                    result = reducer.run(term)
+
+                assert result.normal and result.term == expected.term and result.steps == expected.steps
+                assert tracer.counters["offloaded"] == offloaded, (tracer.counters["offloaded"], offloaded)
+
+            # budgets are shared by the workers
+            term = wide(6, 10)
+            expected = normalize(term)
+            assert not (result := parallel.ParallelReducer(pool=reducer.pool, threshold=50, max_steps=expected.steps - 1).run(term)).normal and result.reason == "steps"
+            assert parallel.ParallelReducer(pool=reducer.pool, threshold=50, max_steps=expected.steps).run(term).normal
+
+            result = parallel.ParallelReducer(pool=reducer.pool, threshold=50, max_steps=100000).run(parse("λf.f ((λx.x x) (λx.x x)) 70"))
+            assert not result.normal and result.term is None and result.reason == "steps"
+
+        return True
+
+    def bench_parallel():
+        # parities of products, much work for every argument and a small normal form
+        term = parse("λf.f %s" % " ".join("(%s ((λm.λn.λf.m (n f)) 40 %d))" % (PARITY, 40 + i) for i in range(8)))
+        workers = os.cpu_count() or 1
+
+        start = time.perf_counter()
+        expected = normalize(term)
+        sequential = time.perf_counter() - start
+        print("sequential %8d steps %9.2f ms" % (expected.steps, sequential * 1000))
+
+        for n in sorted({1, 2, workers}):
+            with parallel.ParallelReducer(workers=n) as reducer:
+                # start the workers
+                reducer.run(parse("λf.f %s" % " ".join(["(%s ((λm.λn.λf.m (n f)) 20 20))" % PARITY] * n)))
+
+                with trace.tracing() as tracer:
+                    start = time.perf_counter()
+                    result = reducer.run(term)
+                    elapsed = time.perf_counter() - start
+
+            assert result.term == expected.term and tracer.counters["offloaded"] == 8
+            print("%2d workers %8d steps %9.2f ms  %.2fx" % (n, result.steps, elapsed * 1000, sequential / elapsed))
+
+        return True
+
+    print(test_ParallelReducer())
+    print(bench_parallel())
\ No newline at end of file
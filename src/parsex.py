@@ -30,7 +30,9 @@ testcase:
 '''
 
 from . import lambex
+from . import trace
 import enum
+import json
 
 def objify_node(root):
     if not root:
@@ -39,53 +41,211 @@ def objify_node(root):
     if isinstance(root, str):
         return root
 
-    return {
-        "type": root.node_type.name,
-        **{k:objify_node(v) if isinstance(v, LamNode) else v.value for k,v in root.values.items()}
-    }
+    obj = {}
+    stack = [(root, obj)]
+
+    while stack:
+        node, target = stack.pop()
+        node_type = node.node_type
+        target["type"] = node_type.name
+
+        if node_type == NODES.L_VARIABLE:
+            target["name"] = node.symbol
+            continue
+
+        for k in KEYS[node_type]:
+            target[k] = child = {}
+            stack.append((getattr(node, k), child))
+
+    return obj
+
+def objify_json(root):
+    '''
+    json.dumps(objify_node(root)) without recursion, for trees deeper than the
+    recursion limit.
+    '''
+    out = []
+    stack = [root]
+
+    while stack:
+        node = stack.pop()
+
+        if isinstance(node, str):
+            out.append(node)
+            continue
+
+        node_type = node.node_type
+        out.append('{"type": "%s"' % node_type.name)
+
+        if node_type == NODES.L_VARIABLE:
+            out.append(', "name": %s}' % json.dumps(node.symbol))
+            continue
+
+        stack.append("}")
+
+        for k in reversed(KEYS[node_type]):
+            stack.append(getattr(node, k))
+            stack.append(', "%s": ' % k)
+
+    return "".join(out)
 
 class NODES(enum.Enum):
     L_ABSTRACTION = enum.auto()
     L_APPLICATION = enum.auto()
     L_VARIABLE    = enum.auto()
 
+KEYS = {
+    NODES.L_ABSTRACTION: ("argument", "body"),
+    NODES.L_APPLICATION: ("abstraction", "parameter"),
+    NODES.L_VARIABLE:    ("name",),
+}
+
 class LamNode:
-    def __init__(self, node_type, **kw):
-        self.node_type = node_type
-        self.values = kw
-    
+    '''
+    common base of Var, Lam and App. LamNode(node_type, **values) builds the matching
+    slotted node, node.values and node[key] give the keyed view of its fields.
+    '''
+
+    __slots__ = ()
+
+    node_type = None
+
+    def __new__(cls, node_type=None, **kw):
+        node = object.__new__(NODE_CLASSES[node_type])
+
+        for slot in node.__slots__:
+            setattr(node, slot, None)
+
+        node.append(**kw)
+        return node
+
+    @property
+    def values(self):
+        return {k: getattr(self, k) for k in KEYS[self.node_type]}
+
+    @property
+    def name(self):
+        symbol = self.symbol
+        return lambex.Token(lambex.TOKENS.T_NUM if lambex.TOKENS.is_num(symbol[0]) else lambex.TOKENS.T_VAR, symbol)
+
+    @name.setter
+    def name(self, token):
+        self.symbol = token.value if isinstance(token, lambex.Token) else token
+
     def reconstruct(self):
-        if self.node_type == NODES.L_ABSTRACTION:
-            return "λ%s.%s" % (self.values["argument"].reconstruct(), self.values["body"].reconstruct())
-        elif self.node_type == NODES.L_APPLICATION:
-            return "(%s) %s" % (self.values["abstraction"].reconstruct(), self.values["parameter"].reconstruct())
-        elif self.node_type == NODES.L_VARIABLE:
-            return self.values["name"].value
+        out = []
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+
+            if isinstance(node, str):
+                out.append(node)
+            elif node.node_type == NODES.L_ABSTRACTION:
+                out.append("λ")
+                stack.extend((node.body, ".", node.argument))
+            elif node.node_type == NODES.L_APPLICATION:
+                out.append("(")
+                stack.extend((node.parameter, ") ", node.abstraction))
+            elif node.node_type == NODES.L_VARIABLE:
+                out.append(node.symbol)
+
+        return "".join(out)
 
     def __getitem__(self, key):
-        return self.values[key]
+        if key not in KEYS[self.node_type]:
+            raise KeyError(key)
+        return getattr(self, key)
     
     def __setitem__(self, key, value):
-        self.values[key] = value
+        if key not in KEYS[self.node_type]:
+            raise KeyError(key)
+        setattr(self, key, value)
 
     def append(self, **kw):
         for k, v in kw.items():
-            self.values[k] = v
+            self[k] = v
     
     def __eq__(self, other):
         if not isinstance(other, LamNode):
             return False
-        return self.node_type == other.node_type and self.values == other.values
+
+        stack = [(self, other)]
+
+        while stack:
+            a, b = stack.pop()
+
+            if a is b:
+                continue
+
+            if a.node_type != b.node_type:
+                return False
+
+            if a.node_type == NODES.L_VARIABLE:
+                if a.symbol != b.symbol:
+                    return False
+            elif a.node_type == NODES.L_ABSTRACTION:
+                stack.append((a.body, b.body))
+                stack.append((a.argument, b.argument))
+            else:
+                stack.append((a.parameter, b.parameter))
+                stack.append((a.abstraction, b.abstraction))
+
+        return True
 
     def __repr__(self):
         return self.reconstruct()
 
+class Var(LamNode):
+    __slots__ = ("symbol",)
+
+    node_type = NODES.L_VARIABLE
+
+    def __new__(cls, symbol):
+        node = object.__new__(cls)
+        node.symbol = symbol
+        return node
+
+class Lam(LamNode):
+    __slots__ = ("argument", "body")
+
+    node_type = NODES.L_ABSTRACTION
+
+    def __new__(cls, argument, body):
+        node = object.__new__(cls)
+        node.argument = argument
+        node.body = body
+        return node
+
+class App(LamNode):
+    __slots__ = ("abstraction", "parameter")
+
+    node_type = NODES.L_APPLICATION
+
+    def __new__(cls, abstraction, parameter):
+        node = object.__new__(cls)
+        node.abstraction = abstraction
+        node.parameter = parameter
+        return node
+
+NODE_CLASSES = {
+    NODES.L_ABSTRACTION: Lam,
+    NODES.L_APPLICATION: App,
+    NODES.L_VARIABLE:    Var,
+}
+
 class ParseException(Exception):
     ...
 
+# frames of the explicit parser stack
+PARSE_EXPRESSION  = 0 # [kind, application spine so far]
+PARSE_OPERAND     = 1 # [kind, None], a single operand
+PARSE_GROUP       = 2 # [kind, position of "("]
+PARSE_ABSTRACTION = 3 # [kind, bound variable]
+
 class LamPar:
     def __init__(self, program):
-        self.lamb = lambex.LambEx(program)
+        self.lamb = lambex.TokenStream(program)
         self.number_of_abstractions = 0
         self.allow_anonymous_abstractions = True
     
@@ -96,123 +256,111 @@ class LamPar:
             raise ParseException("Expected a Lambda abstraction token \"%s\", got \"%s\" at (position, line, column): %s" % (lambex.TOKENS.get_charset(expect), token.value, pos))
 
     def next_token_of_type(self, expect):
-        token = self.lamb.next_token()
+        token = self.lamb.advance()
 
         self.assert_same_type(token, expect)
         return token
 
     def next_token_is_type(self, expect):
-        try:
-            token = self.lamb.peek_token()
-        except:
-            return False
-        
-        return token.token_type == expect
+        token = self.lamb.peek()
+
+        return token is not None and token.token_type == expect
 
-    def parse_abstraction(self):
+    def parse_abstraction_head(self):
         '''
         anonymous_abstraction = lambex.TOKENS.T_LAMB expression
         abstraction = lambex.TOKENS.T_LAMB lambex.TOKENS.T_VAR lambex.TOKENS.T_OP expression
                     | anonymous_abstraction if allow_anonymous_abstractions
-        '''
 
-        if not self.next_token_is_type(lambex.TOKENS.T_LAMB):
-            return False
-        
-        startpos = self.lamb.get_position()
+        consumes the abstraction up to its body and returns the bound variable.
+        '''
 
         self.next_token_of_type(lambex.TOKENS.T_LAMB)
 
         self.number_of_abstractions += 1
 
         next_token_is_var = self.next_token_is_type(lambex.TOKENS.T_VAR)
-        has_two_more_tokens = self.lamb.has_n_tokens_available(2)
-    
-        if not has_two_more_tokens:
-            second_token_is_op = False
-        else:
-            second_token_is_op = self.lamb.peek_token(2).token_type == lambex.TOKENS.T_OP
+        second_token = self.lamb.peek(2)
+        second_token_is_op = second_token is not None and second_token.token_type == lambex.TOKENS.T_OP
 
         if not (next_token_is_var and second_token_is_op):
             if not second_token_is_op and self.allow_anonymous_abstractions:
-                return LamNode(NODES.L_ABSTRACTION, argument=LamNode(NODES.L_VARIABLE, name=lambex.Token(lambex.TOKENS.T_VAR, f"α{self.number_of_abstractions}")), body=self.parse_expression())
+                return Var(f"α{self.number_of_abstractions}")
             if not next_token_is_var:
-                raise ParseException("Expected a variable at position %s, recieved \"%s\"" % (repr(self.lamb.get_position()), self.lamb.peek_token().token_type.name))
+                raise ParseException("Expected a variable at position %s, recieved \"%s\"" % (repr(self.lamb.get_position()), self.lamb.peek().token_type.name))
             raise ParseException("Anonymous abstractions are not allowed, encountered anonymous abstraction at position %s." % repr(self.lamb.get_position()))
 
         var = self.next_token_of_type(lambex.TOKENS.T_VAR)
 
-        if not second_token_is_op:
-            raise ParseException("Expected token \".\" at %s, recieved \"%s\"" % (repr(self.lamb.get_position(), self.lamb.peek_token().token_type.name)))
-        
         self.next_token_of_type(lambex.TOKENS.T_OP)
 
-        return LamNode(NODES.L_ABSTRACTION, argument=LamNode(NODES.L_VARIABLE, name=var), body=self.parse_expression())
-
-    def parse_grouped_expression(self):
-        '''
-        expression = '(' expression ')'
-        '''
-
-        if not self.next_token_is_type(lambex.TOKENS.T_PUNC):
-            return False
-
-        startpos = self.lamb.get_position()
-        
-        if self.lamb.next_token().value != "(":
-            return False
-
-        expr = self.parse_expression()
+        return Var(var.value)
 
-        if not self.next_token_is_type(lambex.TOKENS.T_PUNC):
-            raise ParseException("Tried to parse grouped expression starting at %s, missing end parenthesis." % repr(startpos))
-
-        if (token := self.lamb.next_token()).value != ")":
-            raise ParseException("Recieved \"%s\" at %s, expected \")\"" % (token.value, self.lamb.get_position()))
-
-        return expr
-    
     def parse_variable(self):
         '''
         expression = lambex.TOKENS.T_VAR
         '''
 
         if not self.next_token_is_type(lambex.TOKENS.T_VAR) and not self.next_token_is_type(lambex.TOKENS.T_NUM):
-            raise ParseException("Expected a variable or number at position %s, got \"%s\"" % (repr(self.lamb.get_position()), self.lamb.next_token().token_type))
+            raise ParseException("Expected a variable or number at position %s, got \"%s\"" % (repr(self.lamb.get_position()), self.lamb.advance().token_type))
 
-        return LamNode(NODES.L_VARIABLE, name=self.lamb.next_token())
-
-    def parse_application(self, abstraction):
-        '''
-        application = abstraction expression
-        '''
+        return Var(self.lamb.advance().value)
 
-        return LamNode(NODES.L_APPLICATION, abstraction=abstraction, parameter=self.parse_expression(is_abstraction=True))
-    
+    @trace.traced("parse")
     def parse_expression(self, is_abstraction=False):
         '''
         expression := lambex.TOKENS.T_PUNC expression lambex.TOKENS.T_PUNC
                     | abstraction
                     | application
                     | lambex.TOKENS.T_VAR
+        application = expression expression
+
+        pending groups, abstraction bodies and application spines are kept on an explicit
+        stack of frames, so nesting is only bounded by memory. with is_abstraction only a
+        single operand is parsed, applications are left-associative.
         '''
 
-        expression = None
+        lamb = self.lamb
+        frames = [[PARSE_OPERAND if is_abstraction else PARSE_EXPRESSION, None]]
 
-        if (expr := self.parse_grouped_expression()):
-            expression = expr
-        elif (expr := self.parse_abstraction()):
-            expression = expr
-        else:
-            expression = self.parse_variable()
+        while True:
+            token = lamb.peek()
 
-        if is_abstraction:
-            return expression # left-assoc
+            if token is not None and token.token_type == lambex.TOKENS.T_PUNC and token.value == "(":
+                frames.append([PARSE_GROUP, lamb.get_position()])
+                lamb.advance()
+                frames.append([PARSE_EXPRESSION, None])
+                continue
 
-        while self.lamb.has_token() and self.lamb.peek_token().value != ")":
-            expression = self.parse_application(expression)
-        
-        return expression
+            if token is not None and token.token_type == lambex.TOKENS.T_LAMB:
+                frames.append([PARSE_ABSTRACTION, self.parse_abstraction_head()])
+                frames.append([PARSE_EXPRESSION, None])
+                continue
+
+            node = self.parse_variable()
+
+            while True:
+                frame = frames.pop()
+
+                if frame[0] == PARSE_EXPRESSION:
+                    if frame[1] is not None:
+                        node = App(frame[1], node) # left-assoc
+
+                    if (token := lamb.peek()) is not None and token.value != ")":
+                        frame[1] = node
+                        frames.append(frame)
+                        break
+                elif frame[0] == PARSE_GROUP:
+                    if not self.next_token_is_type(lambex.TOKENS.T_PUNC):
+                        raise ParseException("Tried to parse grouped expression starting at %s, missing end parenthesis." % repr(frame[1]))
+
+                    if (token := lamb.advance()).value != ")":
+                        raise ParseException("Recieved \"%s\" at %s, expected \")\"" % (token.value, lamb.get_position()))
+                elif frame[0] == PARSE_ABSTRACTION:
+                    node = Lam(frame[1], node)
+
+                if not frames:
+                    return node
     
     def normalize_debruijn(self):
         '''
@@ -220,11 +368,20 @@ class LamPar:
         
         λ λ 1 (λ (λ 2 1 4) 1) -> λx0.λx1. x1 (λx2. (λx3. x2 x3 x0) x2) 
 
-        Visit each anonymous lambda, insert "x[lambda-number]."
-        Visit each number, swap with "x[lambda-number for reverse lambda depth]"        
-        Unlex the normalized string to self.lamb
+        Convert to the de Bruijn core, where numbers inside anonymous lambdas are indices,
+        and back: every anonymous lambda gets a fresh "x[lambda-number]" and every index
+        the name of its binder. The normalized string is unlexed to self.lamb and the
+        normalized tree returned.
         '''
-        pass
+        from . import debruijn
+
+        root = LamPar(self.lamb.container).parse_expression()
+        normalized = debruijn.from_debruijn(debruijn.to_debruijn(root))
+
+        self.lamb = lambex.TokenStream(normalized.reconstruct())
+        self.number_of_abstractions = 0
+
+        return normalized
 
     
     def parse(self, allow_anonymous_abstractions=True):
@@ -241,8 +398,6 @@ class LamPar:
             print("Recieved EOF while parsing, %s" % pe)
 
 if __name__ == "__main__":
-    import json
-
     def test_LambEx_simple():
         p = LamPar("\\x.\\y. x")
         root = p.parse_expression()
@@ -276,4 +431,32 @@ if __name__ == "__main__":
 
         return True
 
-    print(test_LambEx_simple() and test_LambEx_application_assoc() and test_LambEx_testcase())
\ No newline at end of file
+    def test_LamPar_deep():
+        depth = 20000
+
+        for program, size in [("λx." * depth + "x", 2 * depth + 1), ("(" * depth + "x" + ")" * depth, 1), ("x " * depth, 2 * depth - 1)]:
+            root = LamPar(program).parse()
+
+            assert root is not None
+            assert root == LamPar(root.reconstruct()).parse()
+            objs = [objify_node(root)]
+            count = 0
+
+            while objs:
+                count += 1
+                objs.extend(v for v in objs.pop().values() if isinstance(v, dict))
+
+            assert count == size
+            assert objify_json(root).count("{") == size
+
+        for program in ["\\x.\\y. x", "(\\x. x y z) 4 5 6", "λx.x λy.y"]:
+            root = LamPar(program).parse()
+            assert objify_json(root) == json.dumps(objify_node(root))
+
+        from .tools import encode_church
+
+        assert LamPar(encode_church(5000)).parse().reconstruct().count("(") == 5000
+
+        return True
+
+    print(test_LambEx_simple() and test_LambEx_application_assoc() and test_LambEx_testcase() and test_LamPar_deep())
\ No newline at end of file
@@ -0,0 +1,324 @@
+'''
+streaming printer for terms, in text LamPar reads back.
+
+output comes in chunks from a generator, so a term with millions of nodes is never
+one string, and every node is visited once from an explicit stack. parentheses go
+only where LamPar needs them: around an application that is an argument, and around
+an abstraction that something follows (its body would swallow it otherwise).
+
+a named tree is printed with its own names, which read back as the same tree. only
+when a binder has a name LamPar does not read as one, as the α1, α2, ... of
+anonymous abstractions, is it converted to de Bruijn first. there binders keep
+their names when that cannot capture, as debruijn.from_debruijn names them, so
+what is printed parses to an alpha-equivalent term. an index pointing out of the
+term has no name, it can only be printed nameless. with debruijn set the term is
+printed nameless, λλ 2 1, as LamPar reads anonymous abstractions.
+'''
+
+from .parsex import LamNode, NODES
+from .debruijn import Index, Free, Abs, Apply, to_debruijn, free_names, is_valid_name
+
+class PrintException(Exception):
+    ...
+
+CLOSE = object() # leave the innermost binder
+
+def chunks(term, debruijn=False, size=1 << 16):
+    '''
+    yield the text of term, a LamNode tree or a de Bruijn term, in chunks of about size
+    characters.
+    '''
+    if isinstance(term, LamNode):
+        if not debruijn and named(term):
+            yield from named_chunks(term, size)
+            return
+
+        term = to_debruijn(term)
+
+    avoid = free_names(term)
+    names = []
+    counter = 0
+
+    out = []
+    length = 0
+    stack = [(term, True, False)] # (term, nothing follows it, it is an argument)
+
+    while stack:
+        item = stack.pop()
+
+        if item.__class__ is str:
+            out.append(item)
+            length += len(item)
+        elif item is CLOSE:
+            avoid.discard(names.pop())
+        else:
+            term, last, argument = item
+            cls = term.__class__
+
+            if cls is Index:
+                if term.index < len(names):
+                    text = str(term.index + 1) if debruijn else names[-term.index - 1]
+                elif debruijn:
+                    raise PrintException("index %d points out of the term, it has no nameless form" % (term.index + 1))
+                else:
+                    raise PrintException("index %d points out of the term, it has no name" % (term.index + 1))
+            elif cls is Free:
+                text = term.name
+
+                if debruijn and text.isdigit() and int(text) <= len(names):
+                    raise PrintException("free variable %s would read as an index" % text)
+            elif cls is Apply:
+                if argument:
+                    out.append("(")
+                    stack.append(")")
+                    last = True
+
+                stack.append((term.arg, last, True))
+                stack.append(" ")
+                stack.append((term.func, False, False))
+                continue
+            else:
+                if not last:
+                    out.append("(")
+                    stack.append(")")
+
+                text = []
+
+                # a run of binders at once
+                while term.__class__ is Abs:
+                    if debruijn:
+                        name = None
+                        text.append("λ")
+                    else:
+                        name = term.hint
+
+                        if not (name and is_valid_name(name)) or name in avoid:
+                            while (name := "x%d" % counter) in avoid:
+                                counter += 1
+                            counter += 1
+
+                        avoid.add(name)
+                        text.append("λ%s." % name)
+
+                    names.append(name)
+                    stack.append(CLOSE)
+                    term = term.body
+
+                if debruijn:
+                    text.append(" ")
+
+                text = "".join(text)
+                stack.append((term, True, False))
+
+            out.append(text)
+            length += len(text)
+
+        if length >= size:
+            yield "".join(out)
+            out = []
+            length = 0
+
+    if out:
+        yield "".join(out)
+
+def named(tree):
+    '''
+    whether every binder of tree has a name LamPar reads back as that name.
+    '''
+    stack = [tree]
+
+    while stack:
+        node = stack.pop()
+        node_type = node.node_type
+
+        if node_type == NODES.L_APPLICATION:
+            stack.append(node.parameter)
+            stack.append(node.abstraction)
+        elif node_type == NODES.L_ABSTRACTION:
+            if not is_valid_name(node.argument.symbol):
+                return False
+
+            stack.append(node.body)
+
+    return True
+
+def named_chunks(tree, size):
+    '''
+    the text of a named tree, with its own names, in chunks as chunks makes them.
+    '''
+    out = []
+    length = 0
+    stack = [(tree, True, False)]
+
+    while stack:
+        item = stack.pop()
+
+        if item.__class__ is str:
+            out.append(item)
+            length += len(item)
+        else:
+            node, last, argument = item
+            node_type = node.node_type
+
+            if node_type == NODES.L_APPLICATION:
+                if argument:
+                    out.append("(")
+                    stack.append(")")
+                    last = True
+
+                stack.append((node.parameter, last, True))
+                stack.append(" ")
+                stack.append((node.abstraction, False, False))
+                continue
+
+            if node_type == NODES.L_ABSTRACTION:
+                if not last:
+                    out.append("(")
+                    stack.append(")")
+
+                text = []
+
+                while node.node_type == NODES.L_ABSTRACTION:
+                    text.append("λ%s." % node.argument.symbol)
+                    node = node.body
+
+                text = "".join(text)
+                stack.append((node, True, False))
+            else:
+                text = node.symbol
+
+            out.append(text)
+            length += len(text)
+
+        if length >= size:
+            yield "".join(out)
+            out = []
+            length = 0
+
+    if out:
+        yield "".join(out)
+
+def write(term, stream, debruijn=False):
+    '''
+    print term to a text stream, returns the number of characters written.
+    '''
+    written = 0
+
+    for chunk in chunks(term, debruijn):
+        stream.write(chunk)
+        written += len(chunk)
+
+    return written
+
+def pretty(term, debruijn=False):
+    return "".join(chunks(term, debruijn))
+
+if __name__ == "__main__":
+    import io
+    import random
+    import time
+
+    from .parsex import LamPar, Var, Lam, App
+    from .reduction import normalize
+
+    def parse(program):
+        return to_debruijn(LamPar(program).parse_expression())
+
+    def random_term(rng, size):
+        hints = [None, "x", "y", "x0", "x1", "f"]
+        results = []
+        stack = [(size, 0)]
+
+        while stack:
+            n, depth = stack.pop()
+
+            if n is None:
+                arg = results.pop()
+                results.append(Apply(results.pop(), arg))
+            elif n == "λ":
+                results.append(Abs(results.pop(), rng.choice(hints)))
+            elif n <= 1:
+                if depth and rng.random() < 0.7:
+                    results.append(Index(rng.randrange(depth)))
+                else:
+                    results.append(Free(rng.choice(["x", "y", "x0", "z"])))
+            elif rng.random() < 0.3:
+                stack.append(("λ", depth))
+                stack.append((n - 1, depth + 1))
+            else:
+                k = rng.randint(1, n - 1)
+                stack.append((None, depth))
+                stack.append((n - k, depth))
+                stack.append((k, depth))
+
+        return results[0]
+
+    def test_pretty():
+        for program, expected in [
+            ("(λx.x) y", "(λx.x) y"),
+            ("f (g x) y", "f (g x) y"),
+            ("f λx.x", "f λx.x"),
+            ("(f λx.x) y", "f (λx.x) y"),
+            ("λx.λy.x (y x)", "λx.λy.x (y x)"),
+            ("(λx.x x) (λx.x x)", "(λx.x x) λx.x x"),
+            ("λλλ 3 1 (2 1)", "λx0.λx1.λx2.x0 x2 (x1 x2)"),
+        ]:
+            assert pretty(LamPar(program).parse_expression()) == expected, (program, pretty(LamPar(program).parse_expression()))
+            assert parse(pretty(parse(program))) == parse(program)
+
+        assert pretty(parse("λx.λy.x (y x)"), debruijn=True) == "λλ 2 (1 2)"
+        assert parse(pretty(parse("(λx.λy.x y z) (λz.z)"), debruijn=True)) == parse("(λx.λy.x y z) (λz.z)")
+
+        # names of a reduced term are fresh where the hints would capture
+        assert pretty(normalize(parse("(λx.λy.x y) y")).term) == "λx0.y x0"
+        assert pretty(Abs(Abs(Apply(Index(1), Free("x")), "x"), "x")) == "λx0.λx1.x0 x"
+
+        for bad, nameless in [(Abs(Free("1")), True), (Index(0), True), (Index(0), False), (Abs(Apply(Index(0), Index(1)), "x"), False)]:
+            try:
+                pretty(bad, debruijn=nameless)
+            except PrintException:
+                continue
+            assert False, bad
+
+        # named trees keep their own names, shadowing and all, and read back as themselves
+        for program in ["λx.λx.x", "λx.λy.x0 (y x)", "f (λa.a) (g h)", "(λx.x 1) λy.y"]:
+            tree = LamPar(program).parse_expression()
+            assert pretty(tree) == program and LamPar(pretty(tree)).parse_expression() == tree
+
+        deep = LamPar("λx." * 50000 + "x").parse_expression()
+        assert parse(pretty(deep)) == to_debruijn(deep)
+
+        stream = io.StringIO()
+        assert write(Lam(Var("x"), App(Var("x"), Var("y"))), stream) == 6 and stream.getvalue() == "λx.x y"
+
+        return True
+
+    def test_pretty_random():
+        rng = random.Random(4)
+
+        for _ in range(500):
+            term = random_term(rng, rng.randint(1, 40))
+            assert parse(pretty(term)) == term, pretty(term)
+
+            if term.loose == 0:
+                assert parse(pretty(term, debruijn=True)) == term
+
+        return True
+
+    def bench_pretty():
+        term = random_term(random.Random(5), 300000)
+        tree = LamPar(pretty(term)).parse_expression()
+
+        for name, run in [
+            ("reconstruct", lambda: len(tree.reconstruct())),
+            ("pretty", lambda: sum(len(chunk) for chunk in chunks(term))),
+            ("pretty tree", lambda: sum(len(chunk) for chunk in chunks(tree))),
+        ]:
+            start = time.perf_counter()
+            length = run()
+            print("%-12s %9d characters %8.2f ms" % (name, length, (time.perf_counter() - start) * 1000))
+
+        return True
+
+    print(test_pretty() and test_pretty_random())
+    print(bench_pretty())
\ No newline at end of file
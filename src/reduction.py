@@ -0,0 +1,448 @@
+'''
+reduction engine over the de Bruijn core.
+
+strategies:
+    NORMAL       leftmost outermost redex first, reaches the beta-normal form when there is one
+    APPLICATIVE  leftmost innermost redex first, arguments are normal before they are substituted
+    HEAD         only the head redex, stops at head normal form   λx1..xn. y M1..Mk
+    WEAK_HEAD    like HEAD, but never under a lambda, stops at weak head normal form
+
+the term is walked with a zipper: the focus is the subterm being looked at and the
+context the list of frames above it, each remembering the parent it was taken from.
+a contraction only replaces the focus, parents are rebuilt on the way back up and
+every subterm that did not change is shared with the input, so a step costs the
+size of the contractum and not the size of the term.
+'''
+
+import enum
+import time
+
+from . import trace
+from .parsex import LamNode
+from .debruijn import Abs, Apply, to_debruijn, from_debruijn, instantiate, shape
+
+class STRATEGIES(enum.Enum):
+    NORMAL      = enum.auto()
+    APPLICATIVE = enum.auto()
+    HEAD        = enum.auto()
+    WEAK_HEAD   = enum.auto()
+
+# zipper frames, (kind, parent, function) where function is only set for IN_ARG
+IN_BODY = 0 # focus is the body of parent
+IN_FUNC = 1 # focus is the function of parent
+IN_ARG  = 2 # focus is the argument of parent, next to the already reduced function
+
+def rebuild(frame, focus):
+    kind, parent, func = frame
+
+    if kind == IN_BODY:
+        return parent if focus is parent.body else Abs(focus, parent.hint)
+
+    if kind == IN_FUNC:
+        return parent if focus is parent.func else Apply(focus, parent.arg)
+
+    return parent if func is parent.func and focus is parent.arg else Apply(func, focus)
+
+def plug(ctx, focus):
+    '''
+    the whole term, focus put back into its context.
+    '''
+    for frame in reversed(ctx):
+        focus = rebuild(frame, focus)
+
+    return focus
+
+def redexes(term, strategy=STRATEGIES.NORMAL):
+    '''
+    walk term in the order of strategy. before every contraction (ctx, redex) is
+    yielded, ctx is live and only valid until the generator is resumed; the final
+    term is the return value.
+    '''
+    if strategy == STRATEGIES.APPLICATIVE:
+        return (yield from innermost(term))
+
+    return (yield from outermost(term, strategy))
+
+def outermost(term, strategy):
+    under_binders = strategy != STRATEGIES.WEAK_HEAD
+    spine_only = strategy != STRATEGIES.NORMAL
+
+    ctx = []
+    focus = term
+
+    while True:
+        cls = focus.__class__
+
+        if cls is Apply:
+            if focus.func.__class__ is Abs:
+                yield ctx, focus
+                focus = instantiate(focus.func.body, focus.arg)
+
+                # the contractum may turn its parent into the next redex
+                if ctx and ctx[-1][0] == IN_FUNC and focus.__class__ is Abs:
+                    focus = Apply(focus, ctx.pop()[1].arg)
+            else:
+                ctx.append((IN_FUNC, focus, None))
+                focus = focus.func
+
+            continue
+
+        if cls is Abs and under_binders:
+            ctx.append((IN_BODY, focus, None))
+            focus = focus.body
+            continue
+
+        if spine_only:
+            break
+
+        # continue with the next argument to the right
+        while ctx:
+            frame = ctx.pop()
+
+            if frame[0] == IN_FUNC:
+                ctx.append((IN_ARG, frame[1], focus))
+                focus = frame[1].arg
+                break
+
+            focus = rebuild(frame, focus)
+        else:
+            break
+
+    return plug(ctx, focus)
+
+def innermost(term):
+    ctx = []
+    focus = term
+
+    while True:
+        cls = focus.__class__
+
+        if cls is Apply:
+            ctx.append((IN_FUNC, focus, None))
+            focus = focus.func
+            continue
+
+        if cls is Abs:
+            ctx.append((IN_BODY, focus, None))
+            focus = focus.body
+            continue
+
+        # both sides of every parent on the way up are normal when it is visited
+        while ctx:
+            frame = ctx.pop()
+
+            if frame[0] == IN_FUNC:
+                ctx.append((IN_ARG, frame[1], focus))
+                focus = frame[1].arg
+                break
+
+            focus = rebuild(frame, focus)
+
+            if focus.__class__ is Apply and focus.func.__class__ is Abs:
+                yield ctx, focus
+                focus = instantiate(focus.func.body, focus.arg)
+                break
+        else:
+            return focus
+
+class Reduction:
+    '''
+    outcome of a run: the reached term, the number of contractions, whether the term is
+    normal for the strategy and why the run stopped early ("steps" or "timeout").
+    backends that count them also report the closures, thunks and cells they allocated,
+    the others leave allocations None.
+    '''
+
+    def __init__(self, term, steps, normal, elapsed, reason=None, allocations=None):
+        self.term = term
+        self.steps = steps
+        self.normal = normal
+        self.elapsed = elapsed
+        self.reason = reason
+        self.allocations = allocations
+
+    @property
+    def tree(self):
+        return from_debruijn(self.term)
+
+    def __repr__(self):
+        return "Reduction(%s, steps=%d, normal=%s%s)" % (self.term, self.steps, self.normal, ", reason=%s" % self.reason if self.reason else "")
+
+def report(tracer, result):
+    '''
+    count what a Reduction tells while tracing.
+    '''
+    tracer.count("beta_steps", result.steps)
+
+    if result.allocations is not None:
+        tracer.count("allocations", result.allocations)
+
+    if result.reason is not None:
+        tracer.count("stopped_%s" % result.reason)
+
+    if result.term is not None:
+        size, depth = shape(result.term)
+        tracer.peak("term_size", size)
+        tracer.peak("term_depth", depth)
+
+def report_substitutions(tracer, result):
+    report(tracer, result)
+    tracer.count("substitutions", result.steps)
+
+class Reducer:
+    def __init__(self, strategy=STRATEGIES.NORMAL, max_steps=None, timeout=None):
+        self.strategy = strategy
+        self.max_steps = max_steps
+        self.timeout = timeout
+
+    @trace.traced("reduce", report_substitutions)
+    def run(self, term):
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        max_steps = self.max_steps
+        start = time.perf_counter()
+        deadline = start + self.timeout if self.timeout is not None else None
+
+        steps = 0
+        walk = redexes(term, self.strategy)
+
+        try:
+            while True:
+                ctx, redex = next(walk)
+
+                if max_steps is not None and steps >= max_steps:
+                    return Reduction(plug(ctx, redex), steps, False, time.perf_counter() - start, "steps")
+
+                if deadline is not None and not steps & 63 and time.perf_counter() > deadline:
+                    return Reduction(plug(ctx, redex), steps, False, time.perf_counter() - start, "timeout")
+
+                steps += 1
+        except StopIteration as stop:
+            return Reduction(stop.value, steps, True, time.perf_counter() - start)
+
+def normalize(tree, strategy=STRATEGIES.NORMAL, max_steps=None, timeout=None):
+    return Reducer(strategy, max_steps, timeout).run(tree)
+
+class Step:
+    '''
+    one contraction: its number (from 1), the path from the root to the redex as
+    zipper frame kinds (IN_BODY, IN_FUNC, IN_ARG), the redex and the whole term after it.
+    '''
+
+    __slots__ = ("number", "path", "redex", "term")
+
+    def __init__(self, number, path, redex, term):
+        self.number = number
+        self.path = path
+        self.redex = redex
+        self.term = term
+
+    def __repr__(self):
+        return "Step(%d, %s)" % (self.number, self.term)
+
+def steps(term, strategy=STRATEGIES.NORMAL):
+    '''
+    yield a Step for every contraction of term, one at a time. the terms are plugged
+    from the zipper, so a step only allocates the path down to its redex and the
+    contractum, everything else is shared with the term before it.
+    '''
+    if isinstance(term, LamNode):
+        term = to_debruijn(term)
+
+    walk = redexes(term, strategy)
+    number = 0
+
+    try:
+        ctx, redex = next(walk)
+    except StopIteration:
+        return
+
+    while True:
+        number += 1
+        path = tuple(frame[0] for frame in ctx)
+
+        # the term after this step is the one the next redex is found in
+        try:
+            following = next(walk)
+        except StopIteration as stop:
+            yield Step(number, path, redex, stop.value)
+            return
+
+        yield Step(number, path, redex, plug(*following))
+        ctx, redex = following
+
+class Stepper:
+    '''
+    the history of a reduction, taken lazily: stepper[n] is the term after n steps and
+    reduces only as far as needed. the terms share every unchanged subterm, so the
+    history grows with the changes, not with steps times the size of the term.
+    '''
+
+    def __init__(self, term, strategy=STRATEGIES.NORMAL):
+        if isinstance(term, LamNode):
+            term = to_debruijn(term)
+
+        self.terms = [term]
+        self.history = [] # Steps taken so far
+        self.walk = steps(term, strategy)
+
+    def __len__(self):
+        return len(self.history)
+
+    @property
+    def normal(self):
+        '''
+        whether the last term is known to be normal for the strategy.
+        '''
+        return self.walk is None
+
+    def step(self):
+        '''
+        take the next step, None when the term is normal.
+        '''
+        if self.walk is None:
+            return None
+
+        if (step := next(self.walk, None)) is None:
+            self.walk = None
+            return None
+
+        self.history.append(step)
+        self.terms.append(step.term)
+        return step
+
+    def advance(self, n):
+        '''
+        take steps until there are n, returns how many there are.
+        '''
+        while len(self.history) < n and self.step() is not None:
+            pass
+
+        return len(self.history)
+
+    def __getitem__(self, n):
+        if n < 0:
+            raise IndexError("steps are counted from the start")
+
+        if self.advance(n) < n:
+            raise IndexError("the normal form is reached after %d steps" % len(self.history))
+
+        return self.terms[n]
+
+    def __iter__(self):
+        '''
+        the steps taken so far, then new ones until the normal form.
+        '''
+        i = 0
+
+        while i < len(self.history) or self.step() is not None:
+            yield self.history[i]
+            i += 1
+
+if __name__ == "__main__":
+    from .parsex import LamPar
+    from .tools import convert_church
+    from .debruijn import Free, shape
+
+    def parse(program):
+        return to_debruijn(convert_church(LamPar(program).parse()))
+
+    def test_strategies():
+        plus = "(λm.λn.λf.λx.m f (n f x))"
+        result = normalize(parse("%s 2 3" % plus))
+
+        assert result.normal and result.term == parse("5")
+
+        for strategy in STRATEGIES:
+            assert normalize(parse("(λx.x) y"), strategy).term == parse("y")
+
+        omega = "((λx.x x) (λx.x x))"
+
+        result = normalize(parse("(λx.λy.y) %s z" % omega), max_steps=100)
+        assert result.normal and result.steps == 2 and result.term == parse("z")
+
+        result = normalize(parse("(λx.λy.y) %s z" % omega), STRATEGIES.APPLICATIVE, max_steps=100)
+        assert not result.normal and result.reason == "steps" and result.steps == 100
+
+        result = normalize(parse(omega), timeout=0.05)
+        assert not result.normal and result.reason == "timeout"
+
+        assert normalize(parse("λx. x ((λy.y) z)"), STRATEGIES.HEAD).steps == 0
+        assert normalize(parse("λx. (λy.y) x"), STRATEGIES.HEAD).term == parse("λx.x")
+        assert normalize(parse("λx. (λy.y) x"), STRATEGIES.WEAK_HEAD).steps == 0
+        assert normalize(parse("(λx.λy.(λz.z) y) a"), STRATEGIES.WEAK_HEAD).term == parse("λy.(λz.z) y")
+
+        assert normalize(parse("(λx.λy.x y) y")).tree.reconstruct() == "λx0.(y) x0"
+
+        return True
+
+    def test_budget_exact():
+        result = normalize(parse("(λx.x) ((λx.x) y)"), max_steps=2)
+        assert result.normal and result.steps == 2
+
+        return True
+
+    def test_large():
+        result = normalize(parse("(λm.λn.λf.λx.m f (n f x)) 3000 3000"))
+        assert result.normal and result.term == parse("6000")
+
+        result = normalize(parse("(λm.λn.λf.m (n f)) 30 30"))
+        assert result.normal and result.term == parse("900")
+
+        return True
+
+    def test_Stepper():
+        term = parse("(λm.λn.λf.λx.m f (n f x)) 2 3")
+        stepper = Stepper(term)
+
+        assert stepper[3] == normalize(term, max_steps=3).term and len(stepper) == 3
+        assert stepper[0] is term and stepper[1] is stepper.history[0].term
+
+        history = list(stepper)
+        assert stepper.normal and history[-1].term == parse("5") and len(history) == normalize(term).steps
+        assert [step.number for step in history] == list(range(1, len(history) + 1))
+
+        try:
+            stepper[len(history) + 1]
+            assert False
+        except IndexError:
+            pass
+
+        # the redex sits at the path in the term before it
+        for before, step in zip([term] + [step.term for step in history], history):
+            node = before
+
+            for kind in step.path:
+                node = node.body if kind == IN_BODY else node.func if kind == IN_FUNC else node.arg
+
+            assert node is step.redex
+
+        assert next(steps(parse("λx.x")), None) is None
+        assert [step.term for step in steps(parse("(λx.x) ((λx.x) y)"), STRATEGIES.APPLICATIVE)] == [parse("(λx.x) y"), parse("y")]
+
+        # a long history shares almost everything, a step copies the path to its redex
+        leaves = [parse("(λx.x x) (λy.y)")] * 5000
+        while len(leaves) > 1:
+            leaves = [Apply(Apply(Free("g"), leaves[i]), leaves[i + 1]) if i + 1 < len(leaves) else leaves[i] for i in range(0, len(leaves), 2)]
+
+        stepper = Stepper(leaves[0])
+        stepper.advance(10000)
+        nodes = set()
+
+        for term in stepper.terms:
+            stack = [term]
+
+            while stack:
+                node = stack.pop()
+
+                if id(node) not in nodes:
+                    nodes.add(id(node))
+                    stack.extend((node.body,) if node.__class__ is Abs else (node.func, node.arg) if node.__class__ is Apply else ())
+
+        total = sum(shape(term)[0] for term in stepper.terms[::100]) * 100
+        assert len(stepper) == 10000 and len(nodes) * 20 < total
+
+        return True
+
+    print(test_strategies() and test_budget_exact() and test_large() and test_Stepper())
\ No newline at end of file
@@ -1,7 +1,12 @@
-from .parsex import LamPar, LamNode, NODES
+import itertools
+
+from .parsex import LamPar, LamNode, Var, Lam, App, NODES
 from .lambex import TOKENS, Token
+from . import church
+from . import trace
 
-variable_anonymous_counter = 0
+# numbers the binders of encoded numerals, next() on a count is atomic
+church_counter = itertools.count(1)
 
 '''
 class LamNode:
@@ -15,47 +20,106 @@ LamNode(NODES.L_VARIABLE, name=self.lamb.next_token())
 '''
 
 def repeat_fx(f, x, n):
-    serie = x
-    
-    while n:
-        serie = f"{f} ({serie})"
-        n -= 1
-    
-    return serie
+    return f"{f} (" * n + x + ")" * n
 
 def encode_church(num):
-    global variable_anonymous_counter
-    variable_anonymous_counter += 1
-    return f"\\f{variable_anonymous_counter}.\\x{variable_anonymous_counter}." + repeat_fx(f"f{variable_anonymous_counter}", f"x{variable_anonymous_counter}", num)
+    n = next(church_counter)
+    return f"\\f{n}.\\x{n}." + repeat_fx(f"f{n}", f"x{n}", num)
 
 def convert_church(root):
+    '''
+    copy of root with every number replaced by its Church numeral, built directly.
+    '''
     if isinstance(root, Token):
         return root
-    
-    if root.node_type == NODES.L_VARIABLE and root.values["name"].token_type == TOKENS.T_NUM:
-        return LamPar(encode_church(int(root.values["name"].value))).parse()
-    
-    return LamNode(root.node_type, **{k: convert_church(v) for k, v in root.values.items()})
+
+    results = []
+    stack = [(root, False)]
+
+    while stack:
+        node, done = stack.pop()
+
+        if node.node_type == NODES.L_VARIABLE:
+            if node.symbol.isdigit():
+                n = next(church_counter)
+                results.append(church.numeral(int(node.symbol), f"f{n}", f"x{n}"))
+            else:
+                results.append(Var(node.symbol))
+        elif node.node_type == NODES.L_ABSTRACTION:
+            if done:
+                results.append(Lam(Var(node.argument.symbol), results.pop()))
+            else:
+                stack.append((node, True))
+                stack.append((node.body, False))
+        elif done:
+            parameter = results.pop()
+            results.append(App(results.pop(), parameter))
+        else:
+            stack.append((node, True))
+            stack.append((node.parameter, False))
+            stack.append((node.abstraction, False))
+
+    return results[0]
 
 class ReductionException(Exception):
     pass
 
+@trace.traced("substitute", lambda tracer, tree: tracer.count("substitutions"))
 def substitute(tree, var, new_var, shadow=False):
+    '''
+    replace every subtree equal to var by new_var, unchanged subtrees are shared with tree.
+    hash-consed trees are rebuilt through their factory, so comparisons stay identity checks
+    and shared subterms are substituted once.
+    '''
     if not isinstance(tree, LamNode):
         return tree
 
-    if shadow and tree.node_type == NODES.L_ABSTRACTION and tree.values["argument"] == var:
-        return tree
-
-    if tree == var:
-        return new_var
-
-    node = LamNode(tree.node_type)
-
-    for k, v in tree.values.items():
-        node[k] = substitute(v, var, new_var, shadow=shadow)
-
-    return node
+    factory = getattr(tree, "factory", None)
+    memo = {}
+    results = []
+    stack = [(tree, False)]
+
+    while stack:
+        node, done = stack.pop()
+
+        if done:
+            if node.node_type == NODES.L_ABSTRACTION:
+                body = results.pop()
+                argument = results.pop()
+
+                if argument is node.argument and body is node.body:
+                    new = node
+                else:
+                    new = factory.lam(argument, body) if factory else LamNode(NODES.L_ABSTRACTION, argument=argument, body=body)
+            else:
+                parameter = results.pop()
+                abstraction = results.pop()
+
+                if abstraction is node.abstraction and parameter is node.parameter:
+                    new = node
+                else:
+                    new = factory.app(abstraction, parameter) if factory else LamNode(NODES.L_APPLICATION, abstraction=abstraction, parameter=parameter)
+
+            memo[id(node)] = new
+            results.append(new)
+        elif (new := memo.get(id(node))) is not None:
+            results.append(new)
+        elif shadow and node.node_type == NODES.L_ABSTRACTION and node.argument == var:
+            results.append(node)
+        elif node == var:
+            results.append(new_var)
+        elif node.node_type == NODES.L_VARIABLE:
+            results.append(node)
+        elif node.node_type == NODES.L_ABSTRACTION:
+            stack.append((node, True))
+            stack.append((node.body, False))
+            stack.append((node.argument, False))
+        else:
+            stack.append((node, True))
+            stack.append((node.parameter, False))
+            stack.append((node.abstraction, False))
+
+    return results[0]
 
 def alpha_conversion(tree):
     """
@@ -98,9 +162,24 @@ def beta_reduction(tree):
 
 def is_beta_normal(tree):
     '''
-    given a tree T, if beta-reduction applied on T = T, the tree is beta-normal.
+    given a tree T, if beta-reduction applied on T = T, the tree is beta-normal,
+    i.e. no application in T has an abstraction on its left.
     '''
-    pass
+    stack = [tree]
+
+    while stack:
+        node = stack.pop()
+
+        if node.node_type == NODES.L_APPLICATION:
+            if node.abstraction.node_type == NODES.L_ABSTRACTION:
+                return False
+
+            stack.append(node.parameter)
+            stack.append(node.abstraction)
+        elif node.node_type == NODES.L_ABSTRACTION:
+            stack.append(node.body)
+
+    return True
 
 if __name__ == "__main__":
     for i in range(5):
@@ -0,0 +1,287 @@
+'''
+tracing and profiling of lexing, parsing, substitution and reduction.
+
+tracing is off while sink is None, instrumented functions then cost one global
+lookup per call and nothing per step. enable() installs a Tracer, which records
+
+    phases    wall time and calls per phase ("lex", "parse", "reduce", ...), and an
+              event for every phase run, nested phases inside their parent
+    counters  steps, substitutions, cache hits and misses, tokens, ..., and allocations
+              of the backends that count them (the Krivine machines and combinators)
+    peaks     largest values seen, term sizes and depths
+
+with sample < 1 only that fraction of outermost phases is recorded, together with
+everything nested in them. events go to a callback as they happen, and can be
+written as JSON lines or as Chrome trace events (chrome://tracing, Perfetto).
+'''
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+sink = None # the Tracer in use, None when tracing is off
+
+class Tracer:
+    def __init__(self, sample=1.0, callback=None, keep=True, seed=None):
+        self.sample = sample
+        self.callback = callback
+        self.keep = keep # keep events for export, a callback may be enough
+
+        self.counters = collections.Counter()
+        self.peaks = {}
+        self.times = collections.Counter()
+        self.calls = collections.Counter()
+        self.events = []
+
+        self.origin = time.perf_counter()
+        self.random = random.Random(seed)
+        self.depth = 0
+        self.recording = True
+        self.sampled = 0
+        self.skipped = 0
+
+    @contextlib.contextmanager
+    def phase(self, name, **args):
+        '''
+        time the block as a run of phase name, args go into its event.
+        '''
+        if not self.depth:
+            self.recording = self.sample >= 1 or self.random.random() < self.sample
+
+            if self.recording:
+                self.sampled += 1
+            else:
+                self.skipped += 1
+
+        self.depth += 1
+
+        if not self.recording:
+            try:
+                yield
+            finally:
+                self.depth -= 1
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.depth -= 1
+            self.times[name] += end - start
+            self.calls[name] += 1
+            self.emit({"phase": name, "start": start - self.origin, "elapsed": end - start, "depth": self.depth, "args": args})
+
+    def count(self, name, n=1):
+        if self.recording:
+            self.counters[name] += n
+
+    def peak(self, name, value):
+        if self.recording and value > self.peaks.get(name, value - 1):
+            self.peaks[name] = value
+
+    def emit(self, event):
+        if self.keep:
+            self.events.append(event)
+
+        if self.callback is not None:
+            self.callback(event)
+
+    def summary(self):
+        return {
+            "phases": {name: {"calls": self.calls[name], "elapsed": self.times[name]} for name in self.times},
+            "counters": dict(self.counters),
+            "peaks": dict(self.peaks),
+            "sampled": self.sampled,
+            "skipped": self.skipped,
+        }
+
+    def write_jsonl(self, stream):
+        '''
+        one line per phase event, then a line with the summary.
+        '''
+        for event in self.events:
+            stream.write(json.dumps(event, default=str) + "\n")
+
+        stream.write(json.dumps({"summary": self.summary()}) + "\n")
+
+    def chrome(self):
+        '''
+        the events as a Chrome trace, times in microseconds.
+        '''
+        pid, tid = os.getpid(), threading.get_ident()
+        events = [{
+            "name": event["phase"],
+            "cat": "sheep",
+            "ph": "X",
+            "ts": event["start"] * 1e6,
+            "dur": event["elapsed"] * 1e6,
+            "pid": pid,
+            "tid": tid,
+            "args": {key: str(value) if not isinstance(value, (int, float, str, bool)) else value for key, value in event["args"].items()},
+        } for event in self.events]
+
+        end = max((event["start"] + event["elapsed"] for event in self.events), default=0)
+        events.append({"name": "counters", "ph": "C", "ts": end * 1e6, "pid": pid, "tid": tid, "args": dict(self.counters)})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome(self, stream):
+        json.dump(self.chrome(), stream)
+
+def enable(tracer=None, **options):
+    '''
+    install tracer, or a new Tracer(**options), and return it.
+    '''
+    global sink
+    sink = tracer if tracer is not None else Tracer(**options)
+    return sink
+
+def disable():
+    '''
+    turn tracing off and return the Tracer that was in use.
+    '''
+    global sink
+    tracer, sink = sink, None
+    return tracer
+
+@contextlib.contextmanager
+def tracing(tracer=None, **options):
+    previous = sink
+    tracer = enable(tracer, **options)
+
+    try:
+        yield tracer
+    finally:
+        enable(previous) if previous is not None else disable()
+
+def traced(name, report=None):
+    '''
+    decorator running the function as phase name while tracing, report(tracer, result)
+    can count what the result tells.
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kw):
+            if sink is None:
+                return function(*args, **kw)
+
+            tracer = sink
+
+            with tracer.phase(name, function=function.__qualname__):
+                result = function(*args, **kw)
+
+                if report is not None and tracer.recording:
+                    report(tracer, result)
+
+            return result
+
+        return wrapper
+
+    return decorate
+
+if __name__ == "__main__":
+    import io
+
+    # run as a script this file is __main__, the instrumented modules use the package's copy
+    from . import trace
+
+    from .parsex import LamPar
+    from .tools import convert_church
+    from .reduction import normalize
+    from .machine import evaluate
+    from .cache import Cache
+    from . import nbe
+
+    def parse(program):
+        return convert_church(LamPar(program).parse_expression())
+
+    def test_Tracer():
+        assert trace.sink is None
+
+        with trace.tracing() as tracer:
+            result = normalize(parse("(λm.λn.λf.m (n f)) 3 4"))
+            evaluate(parse("(λx.x x) (λx.x x)"), max_steps=100, lazy=True)
+
+            cache = Cache()
+            cache.normalize(parse("(λx.x) (λy.y)"))
+            cache.normalize(parse("(λx.x) (λy.y)"))
+
+        assert trace.sink is None
+        summary = tracer.summary()
+
+        assert summary["counters"]["beta_steps"] >= result.steps + 100
+        assert summary["counters"]["substitutions"] >= result.steps
+        assert summary["counters"]["stopped_steps"] == 1
+        assert summary["counters"]["cache_hits"] >= 1 and summary["counters"]["cache_misses"] >= 1
+        assert summary["peaks"]["term_size"] >= 2 and summary["peaks"]["term_depth"] >= 2
+        assert {"parse", "reduce", "cache"} <= set(summary["phases"]) and summary["phases"]["parse"]["calls"] == 4
+
+        # phases inside cache.normalize are nested in it
+        assert any(event["phase"] == "reduce" and event["depth"] == 1 for event in tracer.events)
+
+        stream = io.StringIO()
+        tracer.write_jsonl(stream)
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == len(tracer.events) + 1 and "summary" in json.loads(lines[-1])
+
+        stream = io.StringIO()
+        tracer.write_chrome(stream)
+        events = json.loads(stream.getvalue())["traceEvents"]
+        assert events[0]["ph"] == "X" and events[-1]["ph"] == "C"
+
+        seen = []
+
+        with trace.tracing(sample=0.5, seed=1, keep=False, callback=seen.append) as tracer:
+            for _ in range(200):
+                normalize(parse("(λx.x) y"))
+
+        assert tracer.sampled + tracer.skipped == 400 and 100 < tracer.sampled < 300
+        assert len(seen) == tracer.sampled and not tracer.events
+        assert tracer.counters["beta_steps"] == tracer.calls["reduce"]
+
+        # allocations are only counted where they are measured, never as 0
+        with trace.tracing() as tracer:
+            normalize(parse("(λm.λn.λf.m (n f)) 3 4"))
+            nbe.normalize(parse("(λm.λn.λf.m (n f)) 3 4"))
+
+        assert "allocations" not in tracer.summary()["counters"]
+
+        with trace.tracing() as tracer:
+            evaluate(parse("(λm.λn.λf.m (n f)) 3 4"))
+
+        assert tracer.summary()["counters"]["allocations"] > 0
+
+        return True
+
+    def bench_overhead():
+        terms = [parse("(λm.λn.λf.m (n f)) %d %d" % (n, n)) for n in range(2, 30)]
+
+        def run():
+            start = time.perf_counter()
+
+            for term in terms:
+                evaluate(term, lazy=True)
+
+            return time.perf_counter() - start
+
+        run()
+        off = min(run() for _ in range(5))
+
+        with trace.tracing():
+            on = min(run() for _ in range(5))
+
+        with trace.tracing(sample=0.1):
+            sampled = min(run() for _ in range(5))
+
+        print("off %8.2f ms, on %8.2f ms, sampled %8.2f ms" % (off * 1000, on * 1000, sampled * 1000))
+        return True
+
+    print(test_Tracer())
+    print(bench_overhead())
\ No newline at end of file